@@ -0,0 +1,11 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Tornado Restless benchmarks
+    ===========================
+
+    Microbenchmarks (benchmarks.micro) of the convert and wrapper hot paths on synthetic models
+"""
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26'
@@ -0,0 +1,305 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    HTTP load test of the ApiManager blueprints
+
+    Starts the blueprints of the synthetic models in a server thread and drives them with
+    an asynchronous http client of configurable concurrency::
+
+        python -m benchmarks.load --concurrency 20 --requests 2000 --workload get_single,mixed
+
+    A workload is either a single endpoint (get_single, get_many, filtered, post, patch, delete)
+    or a mix of them (read, write, mixed). For each workload the issued requests, the errors (responses
+    other than 2xx), the successful requests per second and their p50 / p95 / p99 latencies in seconds
+    are reported as json, for mixes also per endpoint.
+"""
+from argparse import ArgumentParser
+from bisect import bisect
+from collections import Counter, defaultdict
+from datetime import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from threading import Thread, Event
+from time import perf_counter
+from urllib.parse import urlencode
+
+import sqlalchemy
+import tornado
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.web import Application
+
+import tornado_restless
+from tornado_restless import ApiManager
+
+from .models import create_models, create_database
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 16:30'
+
+MIXES = {
+    'read': {'get_single': 50, 'get_many': 30, 'filtered': 20},
+    'write': {'post': 40, 'patch': 40, 'delete': 20},
+    'mixed': {'get_single': 40, 'get_many': 20, 'filtered': 15, 'post': 10, 'patch': 10, 'delete': 5},
+}
+
+
+class Endpoints(object):
+    """
+        Builds the requests of the endpoints, returning (method, path, body)
+
+        Reads and updates use the items 1 ... rows, deletes the items rows + 1 ... 2 * rows.
+        The run fails when more deletes are requested than items are left.
+    """
+
+    def __init__(self, rows: int, results_per_page: int, seed: int):
+        self.rows = rows
+        self.results_per_page = results_per_page
+        self.random = random.Random(seed)
+        self.deletable = list(range(2 * rows, rows, -1))
+
+    def get_single(self):
+        return 'GET', '/api/items/%u' % self.random.randint(1, self.rows), None
+
+    def get_many(self):
+        page = self.random.randint(1, max(1, self.rows // self.results_per_page))
+        return 'GET', '/api/items?page=%u' % page, None
+
+    def filtered(self):
+        number = self.random.randint(0, self.rows)
+        q = {'filters': [{'name': 'number', 'op': 'ge', 'val': number},
+                         {'name': 'column0', 'op': 'like', 'val': '%%-%u%%' % (number % 10)}],
+             'order_by': [{'field': 'number', 'direction': 'desc'}]}
+        return 'GET', '/api/items?%s' % urlencode({'q': json.dumps(q)}), None
+
+    def post(self):
+        number = self.random.randint(0, self.rows)
+        return 'POST', '/api/items', {'number': number, 'column0': 'posted-%u' % number}
+
+    def patch(self):
+        return 'PATCH', '/api/items/%u' % self.random.randint(1, self.rows), {'number': self.random.randint(0, 100)}
+
+    def delete(self):
+        if not self.deletable:
+            raise RuntimeError("All %u deletable items have been deleted, increase --rows" % self.rows)
+        return 'DELETE', '/api/items/%u' % self.deletable.pop(), None
+
+    def choose(self, workload: str) -> str:
+        """
+            Choose the next endpoint of a workload
+        """
+        if workload not in MIXES:
+            return workload
+        endpoints = sorted(MIXES[workload].items())
+        cumulative = []
+        for _, weight in endpoints:
+            cumulative.append(weight + (cumulative[-1] if cumulative else 0))
+        return endpoints[bisect(cumulative, self.random.random() * cumulative[-1])][0]
+
+
+def percentile(latencies: list, percent: float) -> float:
+    """
+        Nearest rank percentile of sorted latencies
+    """
+    if not latencies:
+        return None
+    rank = max(0, min(len(latencies) - 1, int(round(percent / 100 * len(latencies) + 0.5)) - 1))
+    return latencies[rank]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """
+        Summarize the (latency, status) samples of a run
+
+        Responses other than 2xx are counted as errors, rps and latencies are those of the successful requests.
+    """
+    latencies = sorted(latency for latency, status in samples if 200 <= status < 300)
+    statuses = Counter(status for _, status in samples)
+    return {'issued': len(samples),
+            'requests': len(latencies),
+            'errors': len(samples) - len(latencies),
+            'rps': len(latencies) / elapsed if elapsed else None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+            'statuses': {str(status): count for status, count in sorted(statuses.items())}}
+
+
+def start_server(application: Application, host: str='127.0.0.1', port: int=0):
+    """
+        Start a http server for application in a thread with its own IOLoop
+
+        :return: (port, stop function)
+    """
+    sockets = bind_sockets(port, host)
+    port = sockets[0].getsockname()[1]
+    started = Event()
+    loop = []
+
+    def run():
+        io_loop = IOLoop()
+        io_loop.make_current()
+        server = HTTPServer(application)
+        server.add_sockets(sockets)
+        loop.append(io_loop)
+        started.set()
+        io_loop.start()
+        server.stop()
+        io_loop.close(all_fds=True)
+
+    thread = Thread(target=run, name='restless-load-server', daemon=True)
+    thread.start()
+    started.wait()
+
+    def stop():
+        loop[0].add_callback(loop[0].stop)
+        thread.join()
+
+    return port, stop
+
+
+@gen.coroutine
+def drive(base_url: str, endpoints: Endpoints, workload: str, requests: int, concurrency: int):
+    """
+        Fire requests at the server with concurrency parallel clients
+
+        :return: Dictionary of endpoint to (latency, status) samples and the elapsed time
+    """
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+    results = defaultdict(list)
+    remaining = [requests]
+
+    @gen.coroutine
+    def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            endpoint = endpoints.choose(workload)
+            method, path, body = getattr(endpoints, endpoint)()
+            kwargs = {'method': method, 'request_timeout': 60}
+            if body is not None:
+                kwargs['body'] = json.dumps(body)
+                kwargs['headers'] = {'Content-Type': 'application/json; charset=utf-8'}
+            start = perf_counter()
+            try:
+                response = yield client.fetch(base_url + path, **kwargs)
+                status = response.code
+            except HTTPError as ex:
+                status = ex.code
+            results[endpoint].append((perf_counter() - start, status))
+
+    start = perf_counter()
+    yield [worker() for _ in range(concurrency)]
+    elapsed = perf_counter() - start
+    client.close()
+    return results, elapsed
+
+
+def run(workloads=('get_single', 'get_many', 'filtered', 'post', 'patch', 'delete', 'mixed'),
+        requests: int=1000,
+        concurrency: int=10,
+        warmup: int=50,
+        rows: int=1000,
+        columns: int=10,
+        depth: int=1,
+        results_per_page: int=10,
+        seed: int=0) -> dict:
+    """
+        Run the load test
+
+        :param workloads: Endpoints or mixes to be run one after another
+        :param requests: Requests per workload
+        :param concurrency: Parallel requests
+        :param warmup: Requests before each workload that are not measured
+        :param rows: Number of items read and updated (the same number is created for deletes)
+        :param columns: Number of string columns of an item
+        :param depth: Depth of the relations above an item
+        :param results_per_page: Results per page of the blueprint
+        :param seed: Seed of the request generator
+    """
+    directory = tempfile.mkdtemp(prefix='restless-load-')
+    try:
+        models = create_models(columns=columns, depth=depth)
+        Session = create_database(models, rows=2 * rows, dns='sqlite:///%s' % os.path.join(directory, 'load.lite'),
+                                  connect_args={'check_same_thread': False})
+
+        application = Application([])
+        api = ApiManager(application=application, session_maker=Session)
+        api.create_api(models['Item'], methods=ApiManager.METHODS_ALL, results_per_page=results_per_page)
+
+        port, stop = start_server(application)
+        base_url = 'http://127.0.0.1:%u' % port
+        endpoints = Endpoints(rows, results_per_page, seed)
+        io_loop = IOLoop.current()
+
+        results = []
+        try:
+            for workload in workloads:
+                if workload not in MIXES and not hasattr(Endpoints, workload):
+                    raise ValueError("Unknown workload %s" % workload)
+                if warmup:
+                    io_loop.run_sync(lambda: drive(base_url, endpoints, workload, warmup, concurrency))
+                measured, elapsed = io_loop.run_sync(
+                    lambda: drive(base_url, endpoints, workload, requests, concurrency))
+
+                result = summarize([sample for samples in measured.values() for sample in samples], elapsed)
+                result['workload'] = workload
+                if workload in MIXES:
+                    result['endpoints'] = {endpoint: summarize(measured[endpoint], elapsed)
+                                           for endpoint in sorted(measured)}
+                results.append(result)
+        finally:
+            stop()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {'meta': {'date': datetime.utcnow().isoformat(),
+                     'python': platform.python_version(),
+                     'implementation': platform.python_implementation(),
+                     'sqlalchemy': sqlalchemy.__version__,
+                     'tornado': tornado.version,
+                     'tornado_restless': tornado_restless.__version__,
+                     'parameters': {'requests': requests, 'concurrency': concurrency, 'warmup': warmup,
+                                    'rows': rows, 'columns': columns, 'depth': depth,
+                                    'results_per_page': results_per_page, 'seed': seed}},
+            'results': results}
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='HTTP load test of tornado_restless blueprints')
+    parser.add_argument('--workload', default='get_single,get_many,filtered,post,patch,delete,mixed',
+                        help='comma separated endpoints (get_single, get_many, filtered, post, patch, delete) '
+                             'or mixes (%s)' % ', '.join(sorted(MIXES)))
+    parser.add_argument('--requests', type=int, default=1000, help='requests per workload')
+    parser.add_argument('--concurrency', type=int, default=10, help='parallel requests')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests before each workload')
+    parser.add_argument('--rows', type=int, default=1000, help='number of items in the database')
+    parser.add_argument('--columns', type=int, default=10, help='number of string columns per item')
+    parser.add_argument('--depth', type=int, default=1, help='depth of the relations above an item')
+    parser.add_argument('--results-per-page', type=int, default=10, help='results per page of the blueprint')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the request generator')
+    parser.add_argument('--output', default=None, help='write json to this file instead of stdout')
+    args = vars(parser.parse_args(argv))
+
+    output = args.pop('output')
+    args['workloads'] = args.pop('workload').split(',')
+    result = run(**args)
+
+    if output is None:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as fp:
+            json.dump(result, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
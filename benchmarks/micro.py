@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Microbenchmarks of the convert and wrapper hot paths
+
+    Usage::
+
+        python -m benchmarks.micro --rows 1000 --columns 20 --depth 2 --output results.json
+
+    The results are written as json, each benchmark reports the best, median and mean
+    time per operation in seconds (or the error that stopped it).
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+import json
+import platform
+from statistics import mean, median
+import sys
+from time import perf_counter
+
+import sqlalchemy
+from sqlalchemy import inspect as sqinspect
+from sqlalchemy.orm import object_mapper
+import tornado
+
+import tornado_restless
+from tornado_restless.convert import to_dict, to_filter, rows_to_dict, get_converters
+from tornado_restless.handler import BaseHandler
+from tornado_restless.wrapper import ModelWrapper, SessionedModelWrapper
+
+from .models import create_models, create_database
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 15:40'
+
+
+def measure(func, number: int, repeat: int) -> dict:
+    """
+        Call func number times per round and measure repeat rounds
+
+        :return: Dictionary of timings per call in seconds
+    """
+    func()
+    rounds = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((perf_counter() - start) / number)
+    return {'number': number,
+            'repeat': repeat,
+            'min': min(rounds),
+            'median': median(rounds),
+            'mean': mean(rounds)}
+
+
+def to_filter_benchmarks(Item) -> dict:
+    """
+        Filters of each operator family in restless format
+    """
+    return {
+        'compare': [{'name': 'number', 'op': 'gt', 'val': 10}, {'name': 'number', 'op': '<=', 'val': 100},
+                    {'name': 'id', 'op': 'eq', 'val': 1}, {'name': 'id', 'op': 'ne', 'val': 2}],
+        'like': [{'name': 'column0', 'op': 'like', 'val': '%1%'}, {'name': 'column0', 'op': 'ilike', 'val': '%1%'},
+                 {'name': 'column0', 'op': 'not_like', 'val': '%2%'}],
+        'in': [{'name': 'number', 'op': 'in', 'val': list(range(50))},
+               {'name': 'number', 'op': 'not_in', 'val': list(range(50, 60))}],
+        'null': [{'name': 'column0', 'op': 'is_null'}, {'name': 'column0', 'op': 'is_not_null'}],
+        'additional': [{'name': 'number', 'op': 'between', 'val': [10, 20]},
+                       {'name': 'column0', 'op': 'startswith', 'val': 'c'},
+                       {'name': 'column0', 'op': 'contains', 'val': '1'}],
+        'field': [{'name': 'number', 'op': 'eq', 'field': 'id'}],
+    }
+
+
+def run(rows: int=1000,
+        columns: int=10,
+        depth: int=2,
+        width: int=32,
+        page: int=10,
+        hybrids: bool=True,
+        proxies: bool=True,
+        number: int=100,
+        repeat: int=5,
+        only: str=None) -> dict:
+    """
+        Run all benchmarks
+
+        :param rows: Number of items in the database
+        :param columns: Number of string columns of an item
+        :param depth: Depth of the relations above an item
+        :param width: Length of the string values
+        :param page: Number of items converted in list benchmarks
+        :param hybrids: Models with hybrids
+        :param proxies: Models with association proxies
+        :param number: Calls per round (list and database benchmarks use number / 10)
+        :param repeat: Rounds per benchmark
+        :param only: Only run benchmarks starting with this name
+    """
+    models = create_models(columns=columns, depth=depth, hybrids=hybrids, proxies=proxies)
+    Session = create_database(models, rows=rows, width=width)
+    Item = models['Item']
+
+    session = Session()
+    wrapper = SessionedModelWrapper(Item, session)
+    items = wrapper.all(limit=page)
+    item = items[0]
+
+    # Load the relations once, the benchmarks should measure the conversion
+    to_dict(items)
+
+    handler = object.__new__(BaseHandler)
+    include = ['id', 'number'] + ['column%u' % column for column in range(columns)]
+    nested = include + ['parent'] if depth else include
+
+    benchmarks = [
+        ('to_dict.single', number, lambda: to_dict(item)),
+        ('to_dict.list', max(1, number // 10), lambda: to_dict(items)),
+        ('to_dict.include', number, lambda: to_dict(item, include=handler.parse_columns(include))),
+        ('to_dict.nested', number, lambda: to_dict(item, include=handler.parse_columns(nested))),
+        ('parse_columns.flat', number, lambda: handler.parse_columns(include)),
+        ('parse_columns.nested', number, lambda: handler.parse_columns(include + ['parent.id', 'parent.name'])),
+        ('wrapper.init', number, lambda: SessionedModelWrapper(Item, session)),
+        # The properties of the wrapper are memoized per model, the introspection is measured uncached
+        ('wrapper.primary_keys', number, lambda: ModelWrapper.get_primary_keys(Item)),
+        ('wrapper.columns', number, lambda: ModelWrapper.get_columns(Item)),
+        ('wrapper.relations', number, lambda: ModelWrapper.get_relations(Item)),
+        ('wrapper.foreign_keys', number, lambda: ModelWrapper.get_foreign_keys(Item)),
+        ('wrapper.hybrids', number, lambda: ModelWrapper.get_hybrids(Item)),
+        ('wrapper.proxies', number, lambda: ModelWrapper.get_proxies(Item)),
+        ('wrapper.memoized', number, lambda: ModelWrapper(Item).primary_keys),
+        ('wrapper.mapper_columns', number, lambda: ModelWrapper.get_columns(object_mapper(item))),
+        ('wrapper.count', max(1, number // 10), lambda: wrapper.count()),
+        ('wrapper.count.filtered', max(1, number // 10),
+         lambda: wrapper.count(filters=to_filter(Item, [{'name': 'number', 'op': 'lt', 'val': rows // 2}]))),
+        ('wrapper.all', max(1, number // 10), lambda: wrapper.all(limit=page)),
+        ('wrapper.all.to_dict', max(1, number // 10), lambda: to_dict(wrapper.all(limit=page),
+                                                                      include=handler.parse_columns(include))),
+        ('wrapper.rows', max(1, number // 10), lambda: wrapper.rows(include, limit=page)),
+        ('wrapper.rows.to_dict', max(1, number // 10),
+         lambda: rows_to_dict(wrapper.rows(include, limit=page), include, get_converters(sqinspect(Item), include))),
+        ('wrapper.all.filtered', max(1, number // 10),
+         lambda: wrapper.all(limit=page, filters=to_filter(Item, [{'name': 'number', 'op': 'lt', 'val': rows // 2}],
+                                                           [{'field': 'number', 'direction': 'desc'}]))),
+    ]
+
+    for family, filters in to_filter_benchmarks(Item).items():
+        benchmarks.append(('to_filter.%s' % family, number,
+                           lambda filters=filters: to_filter(Item, [dict(f) for f in filters])))
+    if depth:
+        benchmarks.append(('to_filter.relation', number,
+                           lambda: to_filter(models['Level1'], [{'name': 'children__number', 'op': 'eq', 'val': 1}])))
+    benchmarks.append(('to_filter.order_by', number,
+                       lambda: to_filter(Item, [], [{'field': 'number', 'direction': 'asc'},
+                                                    {'field': 'id', 'direction': 'desc', 'nullslast': True}])))
+
+    results = []
+    for name, calls, func in benchmarks:
+        if only is not None and not name.startswith(only):
+            continue
+        try:
+            result = measure(func, calls, repeat)
+        except Exception as ex:
+            result = {'error': '%s: %s' % (type(ex).__name__, ex)}
+        result['name'] = name
+        results.append(result)
+
+    session.close()
+
+    return {'meta': {'date': datetime.utcnow().isoformat(),
+                     'python': platform.python_version(),
+                     'implementation': platform.python_implementation(),
+                     'sqlalchemy': sqlalchemy.__version__,
+                     'tornado': tornado.version,
+                     'tornado_restless': tornado_restless.__version__,
+                     'parameters': {'rows': rows, 'columns': columns, 'depth': depth, 'width': width,
+                                    'page': page, 'hybrids': hybrids, 'proxies': proxies,
+                                    'number': number, 'repeat': repeat}},
+            'results': results}
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Microbenchmarks of tornado_restless convert and wrapper')
+    parser.add_argument('--rows', type=int, default=1000, help='number of items in the database')
+    parser.add_argument('--columns', type=int, default=10, help='number of string columns per item')
+    parser.add_argument('--depth', type=int, default=2, help='depth of the relations above an item')
+    parser.add_argument('--width', type=int, default=32, help='length of the string values')
+    parser.add_argument('--page', type=int, default=10, help='items per page for list benchmarks')
+    parser.add_argument('--no-hybrids', dest='hybrids', action='store_false', help='models without hybrids')
+    parser.add_argument('--no-proxies', dest='proxies', action='store_false', help='models without proxies')
+    parser.add_argument('--number', type=int, default=100, help='calls per round')
+    parser.add_argument('--repeat', type=int, default=5, help='rounds per benchmark')
+    parser.add_argument('--only', default=None, help='only run benchmarks starting with this name')
+    parser.add_argument('--output', default=None, help='write json to this file instead of stdout')
+    args = vars(parser.parse_args(argv))
+
+    output = args.pop('output')
+    result = run(**args)
+
+    if output is None:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as fp:
+            json.dump(result, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
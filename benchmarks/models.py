@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Synthetic sqlalchemy models for the benchmarks
+
+    The models form a chain Item -> Level1 -> ... -> LevelN of many-to-one relations.
+    Item has a configurable number of columns, a hybrid and an association proxy to the name of its parent,
+    Level1 has the collection Level1.children.
+"""
+from sqlalchemy import create_engine, schema, Column, Integer, String, ForeignKey
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import sessionmaker, relationship
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 15:20'
+
+
+def create_models(columns: int=10,
+                  depth: int=2,
+                  hybrids: bool=True,
+                  proxies: bool=True) -> dict:
+    """
+        Create the model classes on a new declarative base
+
+        :param columns: Number of string columns of Item (besides id, number and parent)
+        :param depth: Number of related levels above Item
+        :param hybrids: Add the hybrid Item.double
+        :param proxies: Add the association proxy Item.parent_name
+        :return: Dictionary with Base, Item and the levels Level1 ... LevelN
+    """
+    Base = declarative_base(metadata=schema.MetaData())
+    models = {'Base': Base}
+
+    # Levels from top to bottom, each referencing the one above
+    parent = None
+    for level in range(depth, 0, -1):
+        attributes = {'__tablename__': 'level%u' % level,
+                      'id': Column(Integer, primary_key=True),
+                      'name': Column(String)}
+        if parent is not None:
+            attributes['parent_id'] = Column(ForeignKey(parent.id))
+            attributes['parent'] = relationship(parent)
+        parent = type('Level%u' % level, (Base, ), attributes)
+        models[parent.__name__] = parent
+
+    # Items
+    attributes = {'__tablename__': 'items',
+                  'id': Column(Integer, primary_key=True),
+                  'number': Column(Integer)}
+    for column in range(columns):
+        attributes['column%u' % column] = Column(String)
+    if parent is not None:
+        attributes['parent_id'] = Column(ForeignKey(parent.id))
+        attributes['parent'] = relationship(parent, backref='children')
+        if proxies:
+            attributes['parent_name'] = association_proxy('parent', 'name')
+    if hybrids:
+        def double(self):
+            return self.number * 2
+        attributes['double'] = hybrid_property(double)
+    models['Item'] = type('Item', (Base, ), attributes)
+
+    return models
+
+
+def create_database(models: dict,
+                    rows: int=1000,
+                    parents: int=10,
+                    width: int=32,
+                    dns: str='sqlite://',
+                    **engine_options):
+    """
+        Create the tables and insert the rows
+
+        :param models: The models returned by create_models
+        :param rows: Number of items
+        :param parents: Number of instances of each level
+        :param width: Length of the values of the string columns
+        :param dns: The database url
+        :param engine_options: Additional arguments of create_engine
+        :return: A session maker bound to the database
+    """
+    engine = create_engine(dns, **engine_options)
+    models['Base'].metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    Item = models['Item']
+    columns = [key for key in Item.__table__.columns.keys() if key.startswith('column')]
+
+    # Levels
+    level_ids = []
+    level = 1
+    while 'Level%u' % level in models:
+        level += 1
+    for level in range(level - 1, 0, -1):
+        Level = models['Level%u' % level]
+        instances = []
+        for number in range(parents):
+            instance = Level(name='level%u-%u' % (level, number))
+            if level_ids:
+                instance.parent_id = level_ids[number % len(level_ids)]
+            instances.append(instance)
+        session.add_all(instances)
+        session.flush()
+        level_ids = [instance.id for instance in instances]
+
+    # Items
+    for number in range(rows):
+        item = Item(number=number)
+        for column in columns:
+            setattr(item, column, ('%s-%u-' % (column, number) * width)[:width])
+        if level_ids:
+            item.parent_id = level_ids[number % len(level_ids)]
+        session.add(item)
+    session.commit()
+    session.close()
+
+    return Session
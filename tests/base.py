@@ -40,6 +40,8 @@ class TestBase(object):
         'tornado': {'port': 7600}
     }
 
+    restless_options = {}
+
     def setUp(self):
 
         self.setUpAlchemy()
@@ -74,7 +76,8 @@ class TestBase(object):
         """
         Session = self.alchemy['Session']
 
-        self.api = {'tornado': TornadoRestlessManager(application=self.tornado, session_maker=Session),
+        self.api = {'tornado': TornadoRestlessManager(application=self.tornado, session_maker=Session,
+                                                      **self.restless_options),
                     'flask': FlaskRestlessManager(self.flask, session=Session())}
 
         for model, methods in self.models.values():
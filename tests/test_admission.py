@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import requests
+
+from sqlalchemy.orm import sessionmaker
+
+from tests.base import TestBase
+from tornado_restless.admission import AdmissionControl
+from tornado_restless.group import GroupCommit
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 11:05'
+
+
+class TestAdmission(TestBase):
+    """
+        Test the admission of requests
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        # The writes hold their slot while they wait for the group commit
+        self.admission = AdmissionControl(write_concurrency=1, max_queue=1, queue_timeout=2, retry_after=3)
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=self.api['tornado'].METHODS_ALL,
+                                       collection_name='admitted', admission=self.admission,
+                                       group_commit=GroupCommit(sessionmaker(bind=self.alchemy['engine']),
+                                                                window=0.5))
+
+    def test_queue_full(self):
+        """
+            Test that a write is rejected while another one holds the slot and the queue is full
+        """
+        url = 'http://localhost:%u/api/admitted' % self.config['tornado']['port']
+
+        def post(num):
+            r = requests.post(url, headers={'content-type': 'application/json'}, data=json.dumps({'cpu': num}))
+            r.close()
+            return r
+
+        with ThreadPoolExecutor(3) as executor:
+            responses = list(executor.map(post, range(3)))
+
+        assert sorted(r.status_code for r in responses) == [201, 201, 503]
+
+        rejected, = [r for r in responses if r.status_code == 503]
+        assert rejected.headers['Retry-After'] == '3'
+        assert self.admission.lanes['write'].rejected == 1
+
+        computers = self.curl_tornado('/api/computers')
+        assert computers['num_results'] == 7
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from sqlalchemy import Column, ForeignKey, Integer
+from sqlalchemy.orm import declarative_base, relationship
+
+from tests.base import TestBase
+from tornado_restless.wrapper import ModelWrapper
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 16:40'
+
+
+class TestApis(TestBase):
+    """
+        Test the registration of many models at once
+    """
+
+    def test_get_models(self):
+        """
+            Test the models of a declarative base and of a list
+        """
+
+        Person, _ = self.models['Person']
+        Computer, _ = self.models['Computer']
+
+        models = self.api['tornado'].get_models(self.alchemy['Base'])
+        assert [model.__name__ for model in models] == ['City', 'City2Person', 'Computer', 'Person']
+
+        assert self.api['tornado'].get_models([Person, Computer]) == [Person, Computer]
+
+    def test_declarative_base(self):
+        """
+            Test the registration of all models of a declarative base
+        """
+
+        blueprints = self.api['tornado'].create_apis(self.alchemy['Base'], url_prefix='/apis')
+        assert [blueprint.collection_name for blueprint in blueprints] == \
+               ['cities', 'city2persons', 'computers', 'persons']
+
+        assert self.api['tornado'].startup_timings['models'] == 4
+        assert self.curl_tornado('/apis/computers/1')['cpu'] == 3.2
+        assert self.curl_tornado('/apis/persons/2')['name'] == 'Bernd'
+
+    def test_list(self):
+        """
+            Test the registration of a list of models with defaults
+        """
+
+        Computer, _ = self.models['Computer']
+        City, _ = self.models['City']
+
+        self.api['tornado'].create_apis([Computer, City], url_prefix='/apis', results_per_page=2,
+                                        methods=['GET', 'DELETE'])
+
+        computers = self.curl_tornado('/apis/computers')
+        assert computers['num_results'] == 5
+        assert len(computers['objects']) == 2
+
+        self.curl_tornado('/apis/computers/4', 'delete', assert_for=204)
+        self.curl_tornado('/apis/persons', assert_for=404)
+
+    def test_options(self):
+        """
+            Test the registration of a dictionary of models with their own options
+        """
+
+        Person, _ = self.models['Person']
+        Computer, _ = self.models['Computer']
+
+        self.api['tornado'].create_apis({Person: {'collection_name': 'people', 'exclude_columns': ['birth']},
+                                         Computer: {}},
+                                        url_prefix='/apis', exclude_columns=['user'])
+
+        person = self.curl_tornado('/apis/people/2')
+        assert person['name'] == 'Bernd'
+        assert 'birth' not in person
+
+        computer = self.curl_tornado('/apis/computers/1')
+        assert 'user' not in computer
+
+    def test_backref(self):
+        """
+            Test that relations defined by a backref are part of the metadata read before the mappers are configured
+        """
+
+        Base = declarative_base()
+
+        class Parent(Base):
+            __tablename__ = 'parents'
+
+            id = Column(Integer, primary_key=True)
+
+        class Child(Base):
+            __tablename__ = 'children'
+
+            id = Column(Integer, primary_key=True)
+            parent_id = Column(ForeignKey(Parent.id))
+            parent = relationship(Parent, backref='children')
+
+        assert list(ModelWrapper(Parent).relations) == ['children']
+        assert ModelWrapper(Parent).relations['children'] is not None
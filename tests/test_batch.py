@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+from tornado.ioloop import IOLoop
+
+from tests.base import TestBase
+from tornado_restless.batch import BatchConnection, execute_handler
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:05'
+
+
+class TestBatch(TestBase):
+    """
+        Test the batch api
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=self.api['tornado'].METHODS_ALL,
+                                       collection_name='plain_computers', exclude_columns=['user'])
+        self.api['tornado'].create_batch_api('/api')
+
+    def batch(self, operations, **kwargs) -> list:
+        """
+            Post a batch and return the statuses and the bodies of its operations
+        """
+        tornado_data = self.curl_tornado('/api/_batch', 'post', data=json.dumps(dict(operations=operations, **kwargs)))
+        return [result['status'] for result in tornado_data['results']], \
+               [result['body'] for result in tornado_data['results']]
+
+    def test_execute_handler(self):
+        """
+            Test that a handler executed outside of the application answers like it
+        """
+
+        blueprint = self.api['tornado'].blueprints[('/api', 'persons')]
+
+        def execute(instance_id):
+            connection = BatchConnection()
+            request = HTTPServerRequest(method='GET', uri='/api/persons/%s' % instance_id, version='HTTP/1.1',
+                                        headers=HTTPHeaders(), host='localhost', connection=connection)
+            handler = blueprint.handler_class(self.tornado, request, **blueprint.kwargs)
+            IOLoop().run_sync(lambda: execute_handler(handler, instance_id))
+            assert handler._finished
+            return connection.result()
+
+        result = execute('1')
+        assert result['status'] == 200
+        assert result['body']['name'] == 'Anastacia'
+
+        result = execute('99')
+        assert result['status'] == 404
+        assert result['body']['message'] == 'No result found'
+
+    def test_operations(self):
+        """
+            Test operations on several blueprints
+        """
+
+        statuses, bodies = self.batch([{'method': 'GET', 'collection': 'persons', 'id': 1},
+                                       {'method': 'PATCH', 'collection': 'computers', 'id': 2, 'body': {'cpu': 3.2}},
+                                       {'method': 'GET', 'collection': 'unknowns', 'id': 1}])
+        assert statuses == [200, 201, 404]
+        assert bodies[0]['name'] == 'Anastacia'
+        assert bodies[1]['cpu'] == 3.2
+
+        assert self.curl_tornado('/api/computers/2')['cpu'] == 3.2
+
+    def test_transaction(self):
+        """
+            Test that a failing operation rolls back the transaction
+        """
+
+        statuses, _ = self.batch([{'method': 'PATCH', 'collection': 'plain_computers', 'id': 1, 'body': {'cpu': 99}},
+                                  {'method': 'GET', 'collection': 'persons', 'id': 99},
+                                  {'method': 'GET', 'collection': 'persons', 'id': 1}], transaction=True)
+        assert statuses == [201, 404, 424]
+
+        assert self.curl_tornado('/api/computers/1')['cpu'] == 3.2
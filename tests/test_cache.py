@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+import time
+
+from tests.base import TestBase
+from tornado_restless.cache import InstanceCache
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 13:10'
+
+
+class TestCache(TestBase):
+    """
+        Test the instance cache of get_single
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Computer, _ = self.models['Computer']
+        methods = self.api['tornado'].METHODS_ALL
+
+        self.cache = InstanceCache()
+        self.api['tornado'].create_api(Computer, methods=methods, collection_name='cached', cache=self.cache,
+                                       exclude_columns=['user'], allow_patch_many=True)
+        self.api['tornado'].create_api(Computer, methods=methods, collection_name='cached_orm', cache=self.cache)
+        self.api['tornado'].create_api(Computer, collection_name='expiring', cache=InstanceCache(ttl=0.2))
+        self.api['tornado'].create_batch_api('/api')
+
+    def update_directly(self, instance_id: int, cpu: float):
+        """
+            Update a computer without a session, unnoticed by the caches
+        """
+        Computer, _ = self.models['Computer']
+        with self.alchemy['engine'].begin() as connection:
+            connection.execute(Computer.__table__.update().where(Computer._id == instance_id).values(cpu=cpu))
+
+    def patch(self, url: str, values: dict, **kwargs):
+        return self.curl_tornado(url, 'patch', assert_for=201, headers={'content-type': 'application/json'},
+                                 data=json.dumps(values), **kwargs)
+
+    def test_hit(self):
+        """
+            Test that a cached instance is not read again
+        """
+
+        assert self.curl_tornado('/api/cached/1')['cpu'] == 3.2
+        self.update_directly(1, 5.0)
+        assert self.curl_tornado('/api/cached/1')['cpu'] == 3.2
+
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+        # Another blueprint
+        assert self.curl_tornado('/api/cached_orm/1')['cpu'] == 5.0
+        assert 'user' in self.curl_tornado('/api/cached_orm/1')
+        assert (self.cache.hits, self.cache.misses) == (2, 2)
+
+    def test_patch(self):
+        """
+            Test that a patch by one statement invalidates the instance
+        """
+
+        self.curl_tornado('/api/cached/1')
+        self.curl_tornado('/api/cached_orm/1')
+
+        self.patch('/api/cached/1', {'cpu': 5.0})
+
+        assert self.curl_tornado('/api/cached/1')['cpu'] == 5.0
+        assert self.curl_tornado('/api/cached_orm/1')['cpu'] == 5.0
+        assert self.cache.hits == 0
+
+    def test_patch_orm(self):
+        """
+            Test that a patch flushed by the session invalidates the instance
+        """
+
+        self.curl_tornado('/api/cached/1')
+        self.curl_tornado('/api/cached_orm/1')
+
+        self.patch('/api/cached_orm/1', {'cpu': 5.0})
+
+        assert self.curl_tornado('/api/cached/1')['cpu'] == 5.0
+        assert self.curl_tornado('/api/cached_orm/1')['cpu'] == 5.0
+        assert self.cache.hits == 0
+
+    def test_patch_many(self):
+        """
+            Test that a bulk update invalidates all instances of the model
+        """
+
+        self.curl_tornado('/api/cached/1')
+        self.curl_tornado('/api/cached/4')
+
+        filters = [dict(name='cpu', op='lt', val=4)]
+        result = self.patch('/api/cached', {'ram': 32}, params=dict(q=json.dumps(dict(filters=filters))))
+        assert result['num_modified'] == 3
+
+        assert self.curl_tornado('/api/cached/1')['ram'] == 32
+        assert self.curl_tornado('/api/cached/4')['ram'] == 32
+        assert self.cache.hits == 0
+
+    def test_delete_many(self):
+        """
+            Test that a bulk delete invalidates all instances of the model
+        """
+
+        self.curl_tornado('/api/cached/4')
+
+        filters = [dict(name='_id', op='eq', val=4)]
+        result = self.curl_tornado('/api/cached', 'delete', params=dict(q=json.dumps(dict(filters=filters))))
+        assert result['num_removed'] == 1
+
+        self.curl_tornado('/api/cached/4', assert_for=404)
+
+    def test_delete(self):
+        """
+            Test that a deleted instance is invalidated
+        """
+
+        self.curl_tornado('/api/cached/4')
+        self.curl_tornado('/api/cached/4', 'delete', assert_for=204)
+        self.curl_tornado('/api/cached/4', assert_for=404)
+
+    def test_rollback(self):
+        """
+            Test that an instance cached within a transaction is invalidated when it is rolled back
+        """
+
+        operations = [{'method': 'PATCH', 'collection': 'cached', 'id': 1, 'body': {'cpu': 99}},
+                      {'method': 'GET', 'collection': 'cached', 'id': 1},
+                      {'method': 'GET', 'collection': 'persons', 'id': 99}]
+        results = self.curl_tornado('/api/_batch', 'post',
+                                    data=json.dumps(dict(operations=operations, transaction=True)))['results']
+        assert [result['status'] for result in results] == [201, 200, 404]
+        assert results[1]['body']['cpu'] == 99
+
+        assert self.curl_tornado('/api/cached/1')['cpu'] == 3.2
+
+    def test_ttl(self):
+        """
+            Test that cached instances expire after the ttl
+        """
+
+        assert self.curl_tornado('/api/expiring/1')['cpu'] == 3.2
+        self.update_directly(1, 5.0)
+        assert self.curl_tornado('/api/expiring/1')['cpu'] == 3.2
+
+        time.sleep(0.3)
+        assert self.curl_tornado('/api/expiring/1')['cpu'] == 5.0
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 23:55'
+
+
+class TestColumns(TestBase):
+    """
+        Test the include and exclude columns of blueprints
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Person = self.models['Person'][0]
+        self.api['tornado'].create_api(Person, collection_name='included',
+                                       include_columns=['name', 'computers.cpu'])
+        self.api['tornado'].create_api(Person, collection_name='excluded',
+                                       exclude_columns=['computers', 'cities'])
+        self.api['tornado'].create_api(Person, collection_name='nested',
+                                       exclude_columns=['computers.ram'])
+
+        Computer = self.models['Computer'][0]
+        self.api['tornado'].create_api(Computer, collection_name='compound_included', compound_documents=True,
+                                       include_columns=['_id', 'cpu'])
+        self.api['tornado'].create_api(Computer, collection_name='compound_nested', compound_documents=True,
+                                       include_columns=['_id', 'user.name'])
+        self.api['tornado'].create_api(Computer, collection_name='compound_excluded', compound_documents=True,
+                                       exclude_columns=['user.birth'])
+        self.api['tornado'].create_api(Computer, url_prefix='/v2', collection_name='machines',
+                                       compound_documents=True)
+        self.api['tornado'].create_api(Person, url_prefix='/v2', collection_name='people')
+        self.api['tornado'].create_api(Computer, url_prefix='/v3', compound_documents=True)
+
+    def test_nested_include(self):
+        """
+            Test the columns of relations in include_columns
+        """
+
+        tornado_data = self.curl_tornado('/api/included/1')
+        assert set(tornado_data) == {'name', 'computers'}
+        assert tornado_data['computers'] == [{'cpu': 3.2}, {'cpu': 12}]
+
+    def test_related_included(self):
+        """
+            Test that only included relations are served with their included columns
+        """
+
+        tornado_data = self.curl_tornado('/api/included/1/computers')
+        assert tornado_data['num_results'] == 2
+        assert all(set(computer) == {'cpu'} for computer in tornado_data['objects'])
+
+        self.curl_tornado('/api/included/1/cities', assert_for=404)
+
+    def test_related_excluded(self):
+        """
+            Test that excluded relations are not served and the excluded columns of relations are not rendered
+        """
+
+        self.curl_tornado('/api/excluded/1/computers', assert_for=404)
+        self.curl_tornado('/api/excluded/1/cities', assert_for=404)
+
+        tornado_data = self.curl_tornado('/api/nested/1/computers')
+        assert tornado_data['num_results'] == 2
+        assert all('ram' not in computer and 'cpu' in computer for computer in tornado_data['objects'])
+
+    def test_compound_included(self):
+        """
+            Test that only included relations are side loaded with their included columns
+        """
+
+        tornado_data = self.curl_tornado('/api/compound_included')
+        assert tornado_data['num_results'] == 5
+        assert tornado_data['included'] == {}
+
+        tornado_data = self.curl_tornado('/api/compound_nested')
+        assert tornado_data['included']['persons']['1'] == {'name': 'Anastacia'}
+
+    def test_compound_excluded(self):
+        """
+            Test that the excluded columns of side loaded instances are not rendered
+        """
+
+        tornado_data = self.curl_tornado('/api/compound_excluded')
+        person = tornado_data['included']['persons']['1']
+        assert person['name'] == 'Anastacia'
+        assert 'birth' not in person and 'computers' not in person
+
+    def test_compound_collection(self):
+        """
+            Test that side loaded instances are keyed by the collection name of their blueprint
+        """
+
+        tornado_data = self.curl_tornado('/v2/machines')
+        assert set(tornado_data['included']) == {'people'}
+        assert tornado_data['included']['people']['1']['name'] == 'Anastacia'
+
+        # Without a blueprint of the related model
+        tornado_data = self.curl_tornado('/v3/computers')
+        assert set(tornado_data['included']) == {'persons'}
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from tests.base import TestBase
+from tornado_restless.group import GroupCommit
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 11:40'
+
+
+class TestDeadline(TestBase):
+    """
+        Test the deadlines of requests
+    """
+
+    scan = {'filters': [{'name': 'cpu', 'op': 'gt', 'val': 0}]}
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        # Enough rows that scanning them is interrupted by an expired deadline
+        Computer, _ = self.models['Computer']
+        with self.alchemy['engine'].begin() as connection:
+            connection.execute(Computer.__table__.insert(), [{'cpu': 1.0, 'ram': 2.0}] * 2000)
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=self.api['tornado'].METHODS_ALL,
+                                       collection_name='limited', statement_timeout=0.5,
+                                       group_commit=GroupCommit(sessionmaker(bind=self.alchemy['engine']),
+                                                                window=0.3))
+
+    def test_invalid(self):
+        """
+            Test an invalid timeout argument
+        """
+
+        self.curl_tornado('/api/limited?timeout=-1', assert_for=400)
+        self.curl_tornado('/api/limited?timeout=soon', assert_for=400)
+
+    def test_exceeded(self):
+        """
+            Test that statements exceeding the deadline are cancelled
+        """
+
+        self.curl_tornado('/api/limited', assert_for=504, params={'timeout': 0.000001, 'q': json.dumps(self.scan)})
+
+    def test_interleaved(self):
+        """
+            Test that the deadlines of interleaved requests do not apply to later requests
+        """
+
+        def post(num):
+            return self.curl_tornado('/api/limited', 'post', assert_for=201,
+                                     headers={'content-type': 'application/json'},
+                                     data=json.dumps({'cpu': num}))
+
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(post, [2.4, 3.6]))
+
+        # The deadlines of the posts expired
+        time.sleep(0.6)
+
+        computers = self.curl_tornado('/api/computers', params={'q': json.dumps(self.scan)})
+        assert computers['num_results'] == 2007
@@ -0,0 +1,38 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 02:10'
+
+
+class TestDelete(TestBase):
+    """
+        Test the result of some /delete operations
+    """
+
+    def test_single(self):
+        """
+            Test deleting an instance by one statement
+        """
+
+        self.curl_tornado('/api/computers/1', 'delete', assert_for=204)
+        self.curl_tornado('/api/computers/1', assert_for=404)
+        assert self.curl_tornado('/api/computers')['num_results'] == 4
+
+        self.curl_tornado('/api/computers/1', 'delete', assert_for=404)
+
+    def test_cascade(self):
+        """
+            Test that instances with relations the orm takes care of are deleted by the orm
+        """
+
+        self.curl_tornado('/api/persons/5', 'delete', assert_for=204)
+        self.curl_tornado('/api/persons/5', assert_for=404)
+
+        assert self.curl_tornado('/api/computers/4')['_user'] is None
+        assert self.curl_tornado('/api/computers/5')['_user'] is None
+        assert self.curl_tornado('/api/computers/3')['_user'] == 2
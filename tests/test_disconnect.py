@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import socket
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from tests.base import TestBase
+from tornado_restless.admission import AdmissionControl
+from tornado_restless.group import GroupCommit
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 12:20'
+
+
+def slow(**kwargs):
+    """
+        Preprocessor giving the client time to disconnect
+    """
+    time.sleep(0.3)
+
+
+class TestDisconnect(TestBase):
+    """
+        Test requests whose client disconnects
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Computer, _ = self.models['Computer']
+        self.finished = []
+        callback = lambda handler, timings: self.finished.append(handler)
+
+        self.api['tornado'].create_api(Computer, collection_name='slow', allow_export=True, export_batch_size=2,
+                                       preprocessor={'get_many': [slow], 'get_export': [slow]},
+                                       timing_callback=callback)
+
+        self.admission = AdmissionControl(write_concurrency=1, queue_timeout=2)
+        self.api['tornado'].create_api(Computer, methods=self.api['tornado'].METHODS_ALL, collection_name='admitted',
+                                       admission=self.admission, timing_callback=callback,
+                                       group_commit=GroupCommit(sessionmaker(bind=self.alchemy['engine']),
+                                                                window=0.5))
+
+    def disconnect(self, method: str, path: str, payload: dict=None):
+        """
+            Send a request and close the connection before it is answered
+        """
+        body = json.dumps(payload).encode() if payload is not None else b''
+        connection = socket.create_connection(('localhost', self.config['tornado']['port']))
+        connection.sendall(b'%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                           b'Content-Length: %u\r\n\r\n%s' % (method.encode(), path.encode(), len(body), body))
+        time.sleep(0.1)
+        connection.close()
+
+    def wait_finished(self, count: int):
+        """
+            Wait for count requests to be finished (the response is sent before on_finish)
+        """
+        deadline = time.time() + 2
+        while len(self.finished) < count and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(self.finished) == count
+
+    def test_get_many(self):
+        """
+            Test that the instances are not fetched after the client disconnected
+        """
+
+        self.disconnect('GET', '/api/slow')
+        self.wait_finished(1)
+
+        handler, = self.finished
+        assert handler.error_type == 'disconnected'
+        assert handler.get_status() == 499
+        assert 'count' in handler.timings
+        assert 'fetch' not in handler.timings
+
+    def test_export(self):
+        """
+            Test that an export stops before its first batch after the client disconnected
+        """
+
+        self.disconnect('GET', '/api/slow/_export')
+        self.wait_finished(1)
+
+        handler, = self.finished
+        assert handler.error_type == 'disconnected'
+        assert handler.num_rows == 0
+
+    def test_admission(self):
+        """
+            Test that a request waiting for admission leaves the queue when its client disconnects
+        """
+
+        def post():
+            return self.curl_tornado('/api/admitted', 'post', assert_for=201,
+                                     headers={'content-type': 'application/json'},
+                                     data=json.dumps({'cpu': 2.4}))
+
+        with ThreadPoolExecutor(1) as executor:
+            # Holds the slot until its group is committed
+            future = executor.submit(post)
+            time.sleep(0.1)
+
+            self.disconnect('POST', '/api/admitted', {'cpu': 3.6})
+            future.result()
+        self.wait_finished(2)
+
+        disconnected, = [handler for handler in self.finished if handler.error_type == 'disconnected']
+        assert disconnected.get_status() == 499
+
+        lane = self.admission.lanes['write']
+        assert lane.active == 0
+        assert not lane.waiting
+        assert lane.admitted == 1
+
+        computers = self.curl_tornado('/api/computers')
+        assert computers['num_results'] == 6
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+import logging
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 17:50'
+
+
+class TestDispatch(TestBase):
+    """
+        Test the single dispatcher route
+    """
+
+    restless_options = {'dispatch': True}
+
+    def test_routes(self):
+        """
+            Test that only one route is registered
+        """
+
+        patterns = [spec.regex.pattern for _, specs in self.tornado.handlers for spec in specs]
+        assert len([pattern for pattern in patterns if pattern.startswith('/api/')]) == 1
+
+    def test_many(self):
+        """
+            Test a query of a dispatched collection
+        """
+
+        filters = [dict(name='name', op='like', val='%r%')]
+        params = dict(q=json.dumps(dict(filters=filters)))
+
+        flask_data = self.curl_flask('/api/persons', params=params)
+        tornado_data = self.curl_tornado('/api/persons', params=params)
+
+        logging.debug(flask_data)
+        logging.debug(tornado_data)
+
+        assert self.subsetOf(flask_data, tornado_data)
+
+    def test_single(self):
+        """
+            Test for a specific computer per pk
+        """
+
+        flask_data = self.curl_flask('/api/computers/1')
+        tornado_data = self.curl_tornado('/api/computers/1')
+
+        assert self.subsetOf(flask_data, tornado_data)
+
+    def test_unknown(self):
+        """
+            Test for an unknown collection
+        """
+
+        self.curl_tornado('/api/unknowns', assert_for=404)
+        self.curl_tornado('/api/unknowns/1', assert_for=404)
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import csv
+from io import StringIO
+import json
+
+import requests
+
+from tests.base import TestBase
+from tornado_restless.handler import BaseHandler
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 00:45'
+
+
+class FailingHandler(BaseHandler):
+    """
+        Fails translating the second batch of an export
+    """
+
+    def rows_to_dict(self, rows: list, columns: list, model=None) -> list:
+        if self.num_rows > len(rows):
+            raise RuntimeError("Failing batch")
+        return super().rows_to_dict(rows, columns, model)
+
+
+class TestExport(TestBase):
+    """
+        Test the streaming export of blueprints
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Person = self.models['Person'][0]
+        Computer = self.models['Computer'][0]
+        self.api['tornado'].create_api(Person, collection_name='exported', allow_export=True, export_batch_size=2,
+                                       include_columns=['_id', 'name'])
+        self.api['tornado'].create_api(Computer, collection_name='exported_computers', allow_export=True)
+        self.api['tornado'].create_api(Person, collection_name='failing', allow_export=True, export_batch_size=2,
+                                       include_columns=['_id', 'name'], handler_class=FailingHandler)
+
+    def test_ndjson(self):
+        """
+            Test the filtered export as one json object per line
+        """
+
+        filters = [dict(name='name', op='like', val='%e%')]
+        r = requests.get('http://localhost:%u/api/exported/_export' % self.config['tornado']['port'],
+                         params=dict(q=json.dumps(dict(filters=filters))))
+        r.raise_for_status()
+        assert r.headers['Content-Type'].startswith('application/x-ndjson')
+
+        objects = [json.loads(line) for line in r.text.splitlines()]
+        assert [person['name'] for person in objects] == ['Bernd', 'Dennise', 'Emil', 'Feris']
+
+    def test_csv(self):
+        """
+            Test the export as csv with relations as json strings
+        """
+
+        r = requests.get('http://localhost:%u/api/exported_computers/_export' % self.config['tornado']['port'],
+                         params=dict(format='csv'))
+        r.raise_for_status()
+        assert r.headers['Content-Type'].startswith('text/csv')
+
+        rows = list(csv.DictReader(StringIO(r.text)))
+        assert len(rows) == 5
+        assert json.loads(rows[0]['user'])['name'] == 'Anastacia'
+
+        self.curl_tornado('/api/exported/_export', params=dict(format='xml'), assert_for=400)
+
+    def test_abort(self):
+        """
+            Test that a failing export is not finished like a complete one
+        """
+
+        r = requests.get('http://localhost:%u/api/failing/_export' % self.config['tornado']['port'], stream=True)
+        assert r.status_code == 200
+        try:
+            r.content
+        except requests.exceptions.ChunkedEncodingError:
+            pass
+        else:
+            raise AssertionError("Truncated export has been finished")
@@ -167,3 +167,19 @@ class TestGet(TestBase):
         }
         tornado_data = self.curl_tornado('/api/persons', params=params)
         assert len(tornado_data['objects']) == 0
+
+    def test_related(self):
+        """
+            Test the paginated sub collection of a relation
+        """
+
+        tornado_data = self.curl_tornado('/api/persons/1/computers')
+        assert tornado_data['num_results'] == 2
+        assert all(computer['_user'] == 1 for computer in tornado_data['objects'])
+
+        params = dict(results_per_page=1, page=2)
+        tornado_data = self.curl_tornado('/api/persons/1/computers', params=params)
+        assert tornado_data['total_pages'] == 2
+        assert len(tornado_data['objects']) == 1
+
+        self.curl_tornado('/api/persons/1/unknowns', assert_for=404)
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import requests
+
+from sqlalchemy.orm import sessionmaker
+
+from tests.base import TestBase
+from tornado_restless.admission import AdmissionControl
+from tornado_restless.group import GroupCommit
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 10:15'
+
+
+class TestGroupCommit(TestBase):
+    """
+        Test concurrent writes committed together
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Computer, _ = self.models['Computer']
+        methods = self.api['tornado'].METHODS_ALL
+
+        self.group_commit = GroupCommit(sessionmaker(bind=self.alchemy['engine']), window=0.3)
+        self.api['tornado'].create_api(Computer, methods=methods, collection_name='grouped',
+                                       group_commit=self.group_commit)
+        self.api['tornado'].create_api(Computer, methods=methods, collection_name='admitted',
+                                       group_commit=self.group_commit,
+                                       admission=AdmissionControl(write_concurrency=1, queue_timeout=5))
+
+    def write_concurrently(self, method: str, requests_: list) -> list:
+        """
+            Send requests (url and payload) at once and return their status codes
+        """
+        url = 'http://localhost:%u' % self.config['tornado']['port']
+
+        def write(request):
+            path, payload = request
+            r = getattr(requests, method)(url + path, headers={'content-type': 'application/json'},
+                                          data=json.dumps(payload))
+            r.close()
+            return r.status_code
+
+        with ThreadPoolExecutor(len(requests_)) as executor:
+            return list(executor.map(write, requests_))
+
+    def test_concurrent(self):
+        """
+            Test that concurrent posts are committed together
+        """
+
+        statuses = self.write_concurrently('post', [('/api/grouped', {'cpu': 2.4 + num}) for num in range(3)])
+        assert statuses == [201, 201, 201]
+
+        computers = self.curl_tornado('/api/computers')
+        assert computers['num_results'] == 8
+        assert self.group_commit.writes == 3
+
+    def test_failing_member(self):
+        """
+            Test that a failing post does not affect the other posts of its group
+        """
+
+        statuses = self.write_concurrently('post', [('/api/grouped', {'cpu': 2.4}),
+                                                    ('/api/grouped', {'_id': 1, 'cpu': 3.6}),
+                                                    ('/api/grouped', {'cpu': 4.8})])
+        assert sorted(statuses) == [201, 201, 400]
+
+        computers = self.curl_tornado('/api/computers')
+        assert computers['num_results'] == 7
+        assert self.group_commit.writes == 2
+
+        computer = self.curl_tornado('/api/computers/1')
+        assert computer['cpu'] == 3.2
+
+    def test_failing_patch(self):
+        """
+            Test that a failing patch is rolled back and answered once
+        """
+
+        statuses = self.write_concurrently('patch', [('/api/grouped/1', {'cpu': 5.0}),
+                                                     ('/api/grouped/99', {'cpu': 6.0})])
+        assert statuses == [201, 404]
+
+        computer = self.curl_tornado('/api/computers/1')
+        assert computer['cpu'] == 5.0
+        assert self.group_commit.writes == 1
+
+    def test_admission(self):
+        """
+            Test that admitted writes join the group of the writes admitted before
+        """
+
+        statuses = self.write_concurrently('post', [('/api/admitted', {'cpu': 2.4 + num}) for num in range(3)])
+        assert statuses == [201, 201, 201]
+
+        computers = self.curl_tornado('/api/computers')
+        assert computers['num_results'] == 8
+        assert self.group_commit.writes == 3
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from tests.base import TestBase
+from tornado_restless.convert import to_dict
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 17:00'
+
+
+class TestMemo(TestBase):
+    """
+        Test the translation of repeated instances and reference cycles
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Person, _ = self.models['Person']
+        Computer, _ = self.models['Computer']
+        self.api['tornado'].create_api(Computer, collection_name='referenced', reference_duplicates=True)
+        self.api['tornado'].create_api(Person, collection_name='cyclic',
+                                       include_columns=['name', 'computers._id', 'computers.user.name'])
+
+    def test_shared(self):
+        """
+            Test that rows sharing a related instance share its dictionary
+        """
+
+        Computer, _ = self.models['Computer']
+        session = self.alchemy['Session']()
+        try:
+            computers = session.query(Computer).order_by(Computer._id).all()
+            objects = to_dict(computers)
+        finally:
+            session.close()
+
+        assert objects[0]['user']['name'] == 'Anastacia'
+        assert objects[0]['user'] is objects[1]['user']
+        assert objects[2]['user'] is not objects[0]['user']
+
+        # Over http
+        page = self.curl_tornado('/api/computers')
+        assert page['objects'][0]['user'] == page['objects'][1]['user']
+        assert page['objects'][1]['user']['name'] == 'Anastacia'
+
+    def test_reference_duplicates(self):
+        """
+            Test that repeated instances are rendered by their primary key after the first
+        """
+
+        objects = self.curl_tornado('/api/referenced')['objects']
+        assert [computer['_id'] for computer in objects] == [1, 2, 3, 4, 5]
+        assert objects[0]['user']['name'] == 'Anastacia'
+        assert objects[1]['user'] == 1
+        assert objects[2]['user']['name'] == 'Bernd'
+        assert objects[3]['user']['name'] == 'Emil'
+        assert objects[4]['user'] == 5
+
+    def test_cycle(self):
+        """
+            Test that a backref cycle with a deep include is cut at the instance it started from
+        """
+
+        person = self.curl_tornado('/api/cyclic/1')
+        assert person == {'name': 'Anastacia', 'computers': [{'_id': 1, 'user': 1}, {'_id': 2, 'user': 1}]}
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+import time
+
+import requests
+
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 14:50'
+
+
+class TestMetrics(TestBase):
+    """
+        Test the metrics of the blueprints
+    """
+
+    restless_options = {'metrics': True}
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.in_flight = []
+
+        def observe(handler, **kwargs):
+            self.in_flight.append(handler.metrics.in_flight.values[('observed', )])
+
+        self.api['tornado'].create_api(self.models['Computer'][0], collection_name='observed',
+                                       preprocessor={'get_single': [observe]})
+        self.api['tornado'].create_metrics_api()
+
+    def get_metrics(self) -> dict:
+        """
+            Request the metrics and return the samples by name and labels
+        """
+        r = requests.get('http://localhost:%u/metrics' % self.config['tornado']['port'])
+        r.raise_for_status()
+        assert r.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+
+        samples = {}
+        for line in r.text.splitlines():
+            if not line.startswith('#'):
+                sample, value = line.rsplit(' ', 1)
+                samples[sample] = float(value)
+        return samples
+
+    def wait_finished(self, count: int) -> dict:
+        """
+            Wait until count requests have been counted (the response is sent before on_finish)
+        """
+        deadline = time.time() + 1
+        while True:
+            samples = self.get_metrics()
+            finished = sum(value for sample, value in samples.items()
+                           if sample.startswith('restless_requests_total{'))
+            if finished >= count or time.time() > deadline:
+                return samples
+            time.sleep(0.01)
+
+    def test_render(self):
+        """
+            Test the prometheus text format
+        """
+        r = requests.get('http://localhost:%u/metrics' % self.config['tornado']['port'])
+        r.raise_for_status()
+
+        lines = r.text.splitlines()
+        assert '# HELP restless_requests_total Finished requests' in lines
+        assert '# TYPE restless_requests_total counter' in lines
+        assert '# TYPE restless_request_duration_seconds histogram' in lines
+        assert '# TYPE restless_requests_in_flight gauge' in lines
+        assert r.text.endswith('\n')
+
+    def test_requests(self):
+        """
+            Test the counters of requests by blueprint, method and status
+        """
+
+        self.curl_tornado('/api/computers/1')
+        self.curl_tornado('/api/computers/2')
+        self.curl_tornado('/api/persons/99', assert_for=404)
+        samples = self.wait_finished(3)
+
+        assert samples['restless_requests_total{blueprint="computers",method="GET",status="200"}'] == 2
+        assert samples['restless_requests_total{blueprint="persons",method="GET",status="404"}'] == 1
+        assert samples['restless_rows_returned_total{blueprint="computers",method="GET"}'] == 2
+        assert samples['restless_request_duration_seconds_count{blueprint="computers",method="GET"}'] == 2
+        assert samples['restless_request_duration_seconds_bucket{blueprint="computers",method="GET",le="+Inf"}'] == 2
+        assert samples['restless_sql_statements_count{blueprint="computers",method="GET"}'] == 2
+        assert samples['restless_response_bytes_sum{blueprint="computers",method="GET"}'] > 0
+
+    def test_errors(self):
+        """
+            Test the counters of errors by their type
+        """
+
+        self.curl_tornado('/api/computers/99', assert_for=404)
+        self.curl_tornado('/api/computers', assert_for=400, params={'q': json.dumps({'offset': -1})})
+        self.curl_tornado('/api/cities', 'post', assert_for=405)
+        samples = self.wait_finished(3)
+
+        assert samples['restless_errors_total{blueprint="computers",method="GET",type="no_result_found"}'] == 1
+        assert samples['restless_errors_total{blueprint="computers",method="GET",type="illegal_argument"}'] == 1
+        assert samples['restless_errors_total{blueprint="cities",method="POST",type="http"}'] == 1
+        assert samples['restless_requests_total{blueprint="cities",method="POST",status="405"}'] == 1
+
+    def test_in_flight(self):
+        """
+            Test that the in flight gauge counts the running requests and returns to 0
+        """
+
+        self.curl_tornado('/api/observed/1')
+        self.curl_tornado('/api/observed/2')
+        samples = self.wait_finished(2)
+
+        assert self.in_flight == [1, 1]
+        assert samples['restless_requests_in_flight{blueprint="observed"}'] == 0
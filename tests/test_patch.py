@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+import requests
+from sqlalchemy import Column, Integer, String, event
+
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:50'
+
+
+class TestPatch(TestBase):
+    """
+        Test the result of some /patch operations
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+
+        class Versioned(Base):
+            __tablename__ = 'versioned'
+
+            _id = Column(Integer, primary_key=True)
+            name = Column(String)
+            version = Column(Integer, nullable=False)
+
+            __mapper_args__ = {'version_id_col': version}
+
+        class Audited(Base):
+            __tablename__ = 'audited'
+
+            _id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+        @event.listens_for(Audited, 'before_update')
+        def before_update(mapper, connection, target):
+            target.name = target.name.upper()
+
+        Base.metadata.create_all(self.alchemy['engine'])
+
+        session = self.alchemy['Session']()
+        session.add_all([Versioned(_id=1, name='a'), Audited(_id=1, name='a')])
+        session.commit()
+
+        self.models['Versioned'] = (Versioned, "all")
+        self.models['Audited'] = (Audited, "all")
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=self.api['tornado'].METHODS_ALL,
+                                       collection_name='plain_computers', exclude_columns=['user'],
+                                       debug_statements=True)
+
+    def patch(self, url, payload, assert_for=201) -> requests.Response:
+        r = requests.patch('http://localhost:%u%s' % (self.config['tornado']['port'], url),
+                           headers={'content-type': 'application/json'}, data=json.dumps(payload))
+        assert r.status_code == assert_for
+        return r
+
+    def test_statement(self):
+        """
+            Test that plain columns are patched without loading the instance
+        """
+
+        r = self.patch('/api/plain_computers/1', {'cpu': 7})
+        assert r.json() == {'_id': 1, 'cpu': 7, 'ram': 4, '_user': 1}
+        assert r.headers['X-Restless-Statements'].startswith('count=2,')
+
+        assert self.curl_tornado('/api/computers/1')['cpu'] == 7
+
+        self.patch('/api/plain_computers/99', {'cpu': 7}, assert_for=404)
+
+    def test_relations(self):
+        """
+            Test patching an instance rendered with its relations
+        """
+
+        r = self.patch('/api/computers/2', {'ram': 16})
+        assert r.json()['ram'] == 16
+        assert r.json()['user']['name'] == 'Anastacia'
+
+    def test_version(self):
+        """
+            Test that instances with a version counter are patched by the orm
+        """
+
+        r = self.patch('/api/versioned/1', {'name': 'b'})
+        assert r.json() == {'_id': 1, 'name': 'b', 'version': 2}
+
+    def test_event(self):
+        """
+            Test that instances with update events are patched by the orm
+        """
+
+        r = self.patch('/api/audited/1', {'name': 'b'})
+        assert r.json() == {'_id': 1, 'name': 'B'}
+        assert self.curl_tornado('/api/audited/1')['name'] == 'B'
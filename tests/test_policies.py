@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import requests
+
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 00:10'
+
+
+class TestPolicies(TestBase):
+    """
+        Test the relation policies of blueprints
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Person = self.models['Person'][0]
+        Computer = self.models['Computer'][0]
+        City2Person = self.models['City'][0].persons.property.mapper.class_
+        self.api['tornado'].create_api(City2Person, collection_name='assocs',
+                                       relation_policies={'user': {'render': 'url'}})
+        self.api['tornado'].create_api(Person, collection_name='limited',
+                                       relation_policies={'computers': {'max_items': 1},
+                                                          'cities': {'render': 'id', 'max_items': 1}})
+        self.api['tornado'].create_api(Computer, collection_name='owned', debug_statements=True,
+                                       relation_policies={'user': {'render': 'id'}})
+
+    def test_url(self):
+        """
+            Test the url of a relation of an instance with a composite primary key
+        """
+
+        tornado_data = self.curl_tornado('/api/assocs/60400,2')
+        assert tornado_data['user'] == '/api/assocs/60400,2/user'
+
+    def test_max_items(self):
+        """
+            Test that collections are truncated in the order of their primary key
+        """
+
+        tornado_data = self.curl_tornado('/api/limited/2')
+        assert [computer['_id'] for computer in tornado_data['computers']] == [3]
+        assert tornado_data['computers_truncated'] is False
+
+        tornado_data = self.curl_tornado('/api/limited/1')
+        assert [computer['_id'] for computer in tornado_data['computers']] == [1]
+        assert tornado_data['computers_truncated'] is True
+
+    def test_id(self):
+        """
+            Test that primary keys are rendered without loading the related instances
+        """
+
+        tornado_data = self.curl_tornado('/api/limited/2')
+        assert tornado_data['cities'] == [['10800', 2]]
+        assert tornado_data['cities_truncated'] is True
+
+        r = requests.get('http://localhost:%u/api/owned/1' % self.config['tornado']['port'])
+        r.raise_for_status()
+        assert r.json()['user'] == 1
+        assert r.headers['X-Restless-Statements'].startswith('count=1,')
@@ -44,3 +44,36 @@ class TestGet(TestBase):
                           data=payload,
                           assert_for=405)
 
+    def test_created(self):
+        """
+            Test the translation of a created instance
+        """
+
+        payload = {'_user': 2, 'cpu': 2.2, 'ram': 16}
+        tornado_data = self.curl_tornado('/api/computers', 'post',
+                                         headers={'content-type': 'application/json'},
+                                         data=json.dumps(payload),
+                                         assert_for=201)
+        assert tornado_data['_id'] == 6
+        assert tornado_data['cpu'] == 2.2
+        assert tornado_data['user']['name'] == 'Bernd'
+
+        assert self.curl_tornado('/api/computers/6')['ram'] == 16
+
+    def test_integrity(self):
+        """
+            Test for raising 400 on a failing flush
+        """
+
+        payload = {'_id': 1, 'cpu': 2.2, 'ram': 16}
+        self.curl_tornado('/api/computers', 'post',
+                          headers={'content-type': 'application/json'},
+                          data=json.dumps(payload),
+                          assert_for=400)
+
+        del payload['_id']
+        tornado_data = self.curl_tornado('/api/computers', 'post',
+                                         headers={'content-type': 'application/json'},
+                                         data=json.dumps(payload),
+                                         assert_for=201)
+        assert tornado_data['_id'] == 6
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from tests.base import TestBase
+from tornado_restless.group import GroupCommit
+from tornado_restless.profiler import RequestProfiler
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 15:20'
+
+
+def slow_preprocessor(**kwargs):
+    """
+        Preprocessor that takes long enough to be sampled
+    """
+    time.sleep(0.05)
+
+
+class TestProfiler(TestBase):
+    """
+        Test the profiles of requests
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.directory = tempfile.mkdtemp()
+
+        Computer, _ = self.models['Computer']
+        self.profiler = RequestProfiler(os.path.join(self.directory, 'cprofile'), token='secret')
+        self.sampler = RequestProfiler(os.path.join(self.directory, 'sample'), token='secret', mode='sample',
+                                       aggregate=False)
+
+        self.api['tornado'].create_api(Computer, collection_name='profiled', profiler=self.profiler,
+                                       methods=self.api['tornado'].METHODS_ALL,
+                                       group_commit=GroupCommit(sessionmaker(bind=self.alchemy['engine']),
+                                                                window=0.5))
+        self.api['tornado'].create_api(Computer, collection_name='sampled', profiler=self.sampler,
+                                       preprocessor={'get_single': [slow_preprocessor]})
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.directory)
+
+    def functions(self, filename: str) -> dict:
+        """
+            The call counts of the functions of a pstats file by name
+        """
+        stats = pstats.Stats(filename)
+        calls = {}
+        for (_, _, name), (_, ncalls, _, _, _) in stats.stats.items():
+            calls[name] = calls.get(name, 0) + ncalls
+        return calls
+
+    def test_cprofile(self):
+        """
+            Test that requests with the token are profiled into one pstats file per blueprint
+        """
+
+        self.curl_tornado('/api/profiled/1', headers={'X-Restless-Profile': 'secret'})
+        self.curl_tornado('/api/profiled/2', headers={'X-Restless-Profile': 'wrong'})
+        self.curl_tornado('/api/profiled/3', headers={'X-Restless-Profile': 'secret'})
+
+        # The profile is handed over in on_finish, after the response
+        time.sleep(0.1)
+        self.profiler.flush()
+
+        assert os.listdir(self.profiler.directory) == ['profiled.pstats']
+        calls = self.functions(os.path.join(self.profiler.directory, 'profiled.pstats'))
+        assert calls['get_single'] == 2
+
+    def test_interleaved(self):
+        """
+            Test that requests executed while a profiled request yields are not profiled
+        """
+
+        def post():
+            return self.curl_tornado('/api/profiled', 'post', assert_for=201,
+                                     headers={'content-type': 'application/json', 'X-Restless-Profile': 'secret'},
+                                     data=json.dumps({'cpu': 2.4}))
+
+        with ThreadPoolExecutor(1) as executor:
+            # Waits for its group commit
+            future = executor.submit(post)
+            time.sleep(0.1)
+
+            self.curl_tornado('/api/profiled/1')
+            future.result()
+
+        time.sleep(0.1)
+        self.profiler.flush()
+
+        calls = self.functions(os.path.join(self.profiler.directory, 'profiled.pstats'))
+        assert calls['post_single'] == 1
+        assert 'get_single' not in calls
+
+    def test_sample(self):
+        """
+            Test that sampled stacks are written per request
+        """
+
+        self.curl_tornado('/api/sampled/1', headers={'X-Restless-Profile': 'secret'})
+        self.curl_tornado('/api/sampled/2')
+
+        time.sleep(0.1)
+        self.sampler.flush()
+
+        filename, = os.listdir(self.sampler.directory)
+        assert filename.startswith('sampled-') and filename.endswith('.stacks')
+
+        with open(os.path.join(self.sampler.directory, filename)) as fp:
+            stacks = [line.rsplit(' ', 1) for line in fp.read().splitlines()]
+        assert any('slow_preprocessor' in stack for stack, count in stacks)
+        assert all(int(count) > 0 for stack, count in stacks)
+
+    def test_mode(self):
+        """
+            Test an unknown mode
+        """
+
+        try:
+            RequestProfiler(self.directory, mode='trace')
+        except ValueError:
+            pass
+        else:
+            assert False, "Unknown mode accepted"
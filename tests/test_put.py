@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from datetime import datetime
+import json
+
+import requests
+from sqlalchemy import Column, Integer, String, event
+from sqlalchemy.orm import validates
+
+from tests.base import TestBase
+from tornado_restless.wrapper import SessionedModelWrapper
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 01:30'
+
+
+class MergingModelWrapper(SessionedModelWrapper):
+    """
+        Upserts by session.merge like on dialects without a native upsert
+    """
+
+    def get_upsert_statement(self, keys: tuple):
+        return None
+
+
+class TestPut(TestBase):
+    """
+        Test the upserts of PUT requests
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+
+        class Versioned(Base):
+            __tablename__ = 'versioned'
+
+            _id = Column(Integer, primary_key=True)
+            name = Column(String)
+            version = Column(Integer, nullable=False)
+
+            __mapper_args__ = {'version_id_col': version}
+
+        class Audited(Base):
+            __tablename__ = 'audited'
+
+            _id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+        @event.listens_for(Audited, 'before_update')
+        def before_update(mapper, connection, target):
+            target.name = target.name.upper()
+
+        class Validated(Base):
+            __tablename__ = 'validated'
+
+            _id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+            @validates('name')
+            def validate_name(self, key, value):
+                return value.lower()
+
+        Base.metadata.create_all(self.alchemy['engine'])
+
+        session = self.alchemy['Session']()
+        session.add_all([Versioned(_id=1, name='a'), Audited(_id=1, name='a'), Validated(_id=1, name='a')])
+        session.commit()
+
+        self.models['Versioned'] = (Versioned, "all")
+        self.models['Audited'] = (Audited, "all")
+        self.models['Validated'] = (Validated, "all")
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        for name in ['Versioned', 'Audited', 'Validated']:
+            self.api['tornado'].create_api(self.models[name][0], methods=self.api['tornado'].METHODS_ALL,
+                                           collection_name='upserted_%s' % name.lower(), upsert=True)
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=self.api['tornado'].METHODS_ALL,
+                                       collection_name='upserted', exclude_columns=['user'], upsert=True,
+                                       debug_statements=True)
+
+    def put(self, url, payload) -> requests.Response:
+        r = requests.put('http://localhost:%u%s' % (self.config['tornado']['port'], url),
+                         headers={'content-type': 'application/json'}, data=json.dumps(payload))
+        assert r.status_code == 201, r.text
+        return r
+
+    def test_single(self):
+        """
+            Test updating and inserting one instance
+        """
+
+        r = self.put('/api/upserted/1', {'cpu': 1.5, 'ram': 2, '_user': 2})
+        assert r.json() == {'_id': 1, 'cpu': 1.5, 'ram': 2, '_user': 2}
+        assert self.curl_tornado('/api/computers/1')['user']['name'] == 'Bernd'
+
+        r = self.put('/api/upserted/10', {'cpu': 2.5, 'ram': 8, '_user': None})
+        assert r.json()['_id'] == 10
+        assert self.curl_tornado('/api/computers')['num_results'] == 6
+
+    def test_many(self):
+        """
+            Test that a list of instances is written and translated by a constant number of statements
+        """
+
+        payload = [{'_id': index, 'cpu': 1.0 * index, 'ram': 4, '_user': None} for index in range(1, 21)]
+        r = self.put('/api/upserted', payload)
+        assert r.json()['num_results'] == 20
+        assert r.json()['objects'] == payload
+        assert int(r.headers['X-Restless-Statements'].split(',')[0][len('count='):]) <= 3
+
+        assert self.curl_tornado('/api/computers')['num_results'] == 20
+
+    def test_merge(self):
+        """
+            Test the fallback to session.merge with a model whose constructor requires arguments
+        """
+
+        Person = self.models['Person'][0]
+        session = self.alchemy['Session']()
+        model = MergingModelWrapper(Person, session)
+
+        instances = model.upsert([{'_id': 1, 'name': 'Anna'}, {'_id': 10, 'name': 'Zoe', 'birth': datetime(2000, 1, 1)}])
+        session.commit()
+
+        assert [instance.name for instance in instances] == ['Anna', 'Zoe']
+        assert self.curl_tornado('/api/persons/1')['name'] == 'Anna'
+        assert self.curl_tornado('/api/persons/10')['name'] == 'Zoe'
+
+    def test_orm(self):
+        """
+            Test that models with a version counter, mapper events or validators are written by the ORM
+        """
+
+        assert self.put('/api/upserted_versioned/1', {'name': 'b'}).json()['version'] == 2
+        assert self.put('/api/upserted_versioned/2', {'name': 'c'}).json()['version'] == 1
+
+        assert self.put('/api/upserted_audited/1', {'name': 'b'}).json()['name'] == 'B'
+
+        assert self.put('/api/upserted_validated/1', {'name': 'B'}).json()['name'] == 'b'
+        assert self.put('/api/upserted_validated/2', {'name': 'C'}).json()['name'] == 'c'
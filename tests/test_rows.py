@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+
+import requests
+from sqlalchemy import Column, Integer, String
+
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 00:30'
+
+
+class TestRows(TestBase):
+    """
+        Test that reading rows of plain columns returns the same as reading instances
+    """
+
+    def setUpModels(self):
+        super().setUpModels()
+
+        Base = self.alchemy['Base']
+
+        class Employee(Base):
+            __tablename__ = 'employees'
+
+            _id = Column(Integer, primary_key=True)
+            name = Column(String)
+            kind = Column(String)
+
+            __mapper_args__ = {'polymorphic_on': kind, 'polymorphic_identity': 'employee'}
+
+        class Manager(Employee):
+            department = Column(String)
+
+            __mapper_args__ = {'polymorphic_identity': 'manager'}
+
+        Base.metadata.create_all(self.alchemy['engine'])
+
+        session = self.alchemy['Session']()
+        session.add_all([Employee(_id=1, name='a'), Manager(_id=2, name='b', department='sales')])
+        session.commit()
+
+        self.models['Employee'] = (Employee, "all")
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        Person = self.models['Person'][0]
+        columns = ['_id', 'name', 'birth']
+        self.api['tornado'].create_api(Person, collection_name='rows', include_columns=columns,
+                                       debug_statements=True)
+        self.api['tornado'].create_api(Person, collection_name='instances', include_columns=columns,
+                                       core_reads=False)
+        self.api['tornado'].create_api(Person, collection_name='hybrids', include_columns=['name', 'age'])
+
+    def test_single(self):
+        """
+            Test one instance by one statement
+        """
+
+        r = requests.get('http://localhost:%u/api/rows/1' % self.config['tornado']['port'])
+        r.raise_for_status()
+        assert r.json() == self.curl_tornado('/api/instances/1')
+        assert r.json()['name'] == 'Anastacia'
+        assert r.headers['X-Restless-Statements'].startswith('count=1,')
+
+        self.curl_tornado('/api/rows/99', assert_for=404)
+
+    def test_many(self):
+        """
+            Test filtered and sorted pages
+        """
+
+        filters = [dict(name='name', op='like', val='%e%')]
+        order_by = [dict(field='name', direction='desc')]
+        params = dict(q=json.dumps(dict(filters=filters, order_by=order_by)), results_per_page=2, page=2)
+
+        rows_data = self.curl_tornado('/api/rows', params=params)
+        instances_data = self.curl_tornado('/api/instances', params=params)
+
+        assert rows_data == instances_data
+        assert rows_data['num_results'] == 4
+        assert [person['name'] for person in rows_data['objects']] == ['Dennise', 'Bernd']
+
+    def test_hybrids(self):
+        """
+            Test that responses with hybrids are read as instances
+        """
+
+        tornado_data = self.curl_tornado('/api/hybrids/3')
+        assert tornado_data['name'] == 'Claudia'
+        assert round(tornado_data['age']) == 20
+
+    def test_polymorphic(self):
+        """
+            Test that instances of polymorphic models are read with the columns of their subclass
+        """
+
+        tornado_data = self.curl_tornado('/api/employees')
+        assert tornado_data['num_results'] == 2
+        assert 'department' not in tornado_data['objects'][0]
+        assert tornado_data['objects'][1]['department'] == 'sales'
+
+        assert self.curl_tornado('/api/employees/2')['department'] == 'sales'
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+import logging
+import time
+
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 16:05'
+
+
+class RecordHandler(logging.Handler):
+    """
+        Keeps the records of the slow requests
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        if hasattr(record, 'restless'):
+            self.records.append(record)
+
+
+class TestSlowRequests(TestBase):
+    """
+        Test the log of slow requests
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.handler = RecordHandler()
+        logging.getLogger('tornado.restless').addHandler(self.handler)
+
+        self.api['tornado'].create_api(self.models['Computer'][0], collection_name='slow', slow_request_threshold=0)
+
+    def tearDown(self):
+        logging.getLogger('tornado.restless').removeHandler(self.handler)
+        super().tearDown()
+
+    def wait_record(self) -> dict:
+        """
+            Wait for the record of the request (logged after the response has been sent)
+        """
+        deadline = time.time() + 1
+        while not self.handler.records and time.time() < deadline:
+            time.sleep(0.01)
+        record, = self.handler.records
+        return record
+
+    def test_record(self):
+        """
+            Test the record of a slow request
+        """
+
+        q = {'order_by': [{'field': 'cpu', 'direction': 'asc'}], 'filters': [{'name': 'cpu', 'op': 'gt', 'val': 3}]}
+        result = self.curl_tornado('/api/slow', params={'q': json.dumps(q)})
+        assert result['num_results'] == 4
+
+        log = self.wait_record()
+        assert log.levelno == logging.WARNING
+        assert log.getMessage().startswith('Slow request: ')
+
+        record = log.restless
+        assert record['blueprint'] == 'slow'
+        assert record['method'] == 'GET'
+        assert record['status'] == 200
+        assert record['rows'] == 4
+
+        # Normalized q
+        assert record['q'] == json.dumps(q, sort_keys=True)
+        assert len(record['filters']) == 2
+        assert 'cpu' in record['filters'][0]
+
+        # Statements with their parameters
+        assert [query['phase'] for query in record['queries']] == ['count', 'fetch']
+        assert all('FROM computers' in query['statement'] for query in record['queries'])
+        assert all(3 in query['parameters'] for query in record['queries'])
+        assert record['statements'] >= 2
+
+        # Timings
+        assert {'parse', 'filter', 'count', 'fetch', 'total'} <= set(record['timings'])
+        assert record['duration'] == record['timings']['total']
+
+    def test_error(self):
+        """
+            Test the record of a failing request
+        """
+
+        self.curl_tornado('/api/slow/99', assert_for=404)
+
+        record = self.wait_record().restless
+        assert record['status'] == 404
+        assert record['q'] is None
+        assert record['filters'] == []
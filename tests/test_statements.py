@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+
+import requests
+
+from sqlalchemy.orm import sessionmaker
+
+from tests.base import TestBase
+from tornado_restless.group import GroupCommit
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 23:40'
+
+
+class TestStatements(TestBase):
+    """
+        Test the statements recorded per request
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.finished = []
+        group_commit = GroupCommit(sessionmaker(bind=self.alchemy['engine']), window=0.3)
+        self.api['tornado'].create_api(self.models['Computer'][0], methods=self.api['tornado'].METHODS_ALL,
+                                       collection_name='grouped', group_commit=group_commit, debug_statements=True,
+                                       timing_callback=lambda handler, timings: self.finished.append(handler))
+
+    def post_concurrently(self, payloads: list) -> list:
+        """
+            Post computers at once to the group committed blueprint
+        """
+
+        def post(payload):
+            return self.curl_tornado('/api/grouped', 'post', assert_for=201,
+                                     headers={'content-type': 'application/json'},
+                                     data=json.dumps(payload))
+
+        with ThreadPoolExecutor(len(payloads)) as executor:
+            results = list(executor.map(post, payloads))
+
+        # The response is sent before on_finish
+        deadline = time.time() + 1
+        while len(self.finished) < len(payloads) and time.time() < deadline:
+            time.sleep(0.01)
+        return results
+
+    def test_debug_header(self):
+        """
+            Test the summary header of the statements (the computer and its user)
+        """
+
+        url = 'http://localhost:%u/api/grouped/1' % self.config['tornado']['port']
+        r = requests.get(url)
+        r.raise_for_status()
+        assert r.headers['X-Restless-Statements'].startswith('count=2,')
+
+    def test_interleaved(self):
+        """
+            Test that the statements of other requests are not recorded after interleaved requests
+        """
+
+        self.post_concurrently([{'cpu': 2.4, 'ram': 8}, {'cpu': 3.6, 'ram': 16}])
+        assert len(self.finished) == 2
+        counts = [handler.statements.count for handler in self.finished]
+        assert all(counts)
+
+        self.curl_tornado('/api/computers')
+        self.curl_tornado('/api/computers/1')
+
+        assert [handler.statements.count for handler in self.finished] == counts
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+
+"""
+import json
+import time
+
+import requests
+
+from tests.base import TestBase
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '19.10.26 - 14:30'
+
+
+class TestTiming(TestBase):
+    """
+        Test the phase timings of requests
+    """
+
+    def setUpRestless(self):
+        super().setUpRestless()
+
+        self.timings = []
+        self.api['tornado'].create_api(self.models['Person'][0], collection_name='timed', server_timing=True,
+                                       timing_callback=lambda handler, timings: self.timings.append(timings))
+
+    def test_server_timing(self):
+        """
+            Test the phases of the Server-Timing header
+        """
+
+        filters = [dict(name='name', op='like', val='%e%')]
+        r = requests.get('http://localhost:%u/api/timed' % self.config['tornado']['port'],
+                         params=dict(q=json.dumps(dict(filters=filters))))
+        r.raise_for_status()
+
+        phases = [metric.split(';')[0] for metric in r.headers['Server-Timing'].split(', ')]
+        assert phases == ['parse', 'filter', 'count', 'fetch', 'to_dict', 'encode', 'total']
+        assert all(metric.split(';')[1].startswith('dur=') for metric in r.headers['Server-Timing'].split(', '))
+
+        # Not enabled
+        r = requests.get('http://localhost:%u/api/persons' % self.config['tornado']['port'])
+        r.raise_for_status()
+        assert 'Server-Timing' not in r.headers
+
+    def test_timing_callback(self):
+        """
+            Test that the timing callback receives the timings of every request
+        """
+
+        self.curl_tornado('/api/timed/2')
+        self.curl_tornado('/api/timed/99', assert_for=404)
+
+        # The response is sent before on_finish
+        deadline = time.time() + 1
+        while len(self.timings) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        found, missing = self.timings
+        assert {'fetch', 'to_dict', 'encode', 'total'} <= set(found)
+        assert 'fetch' in missing
+        assert all(duration >= 0 for duration in found.values())
+        assert found['total'] >= found['fetch'] + found['to_dict']
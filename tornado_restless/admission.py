@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless Admission Control
+
+    Limits the requests processed at once and sheds requests that waited too long.
+"""
+from collections import deque
+from datetime import timedelta
+
+from tornado import gen
+from tornado.concurrent import Future
+
+from .errors import ServiceUnavailableError
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 22:10'
+
+
+class Lane(object):
+    """
+        A number of slots and the queue of requests waiting for one
+    """
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.active = 0
+        self.waiting = deque()
+
+        self.admitted = 0
+        self.rejected = 0
+
+    def __repr__(self):
+        return '<Lane %s active=%u/%u waiting=%u>' % (self.name, self.active, self.concurrency, len(self.waiting))
+
+
+class AdmissionControl(object):
+    """
+        Admits the requests of the blueprints it is passed to (create_api_blueprint(admission=...))
+
+        Reads (GET, HEAD, OPTIONS) and writes have separate lanes, so a burst of writes does not starve the reads
+        and vice versa. A request takes a slot of its lane before it is prepared and returns it when it is finished.
+        Without a free slot it waits in the queue of its lane. Requests are rejected with
+        :http:statuscode:`503` and a Retry-After header if the queue is full or if they waited (since their
+        arrival) longer than queue_timeout.
+
+        Requests hold their slot until they are finished, e.g. the writes of a group commit until their
+        group has been committed. Pass the same instance to the blueprints of an engine to limit them together.
+
+        The handlers run on the thread of the IOLoop, so the database work of a request between two yields is
+        never interleaved with other requests. Slots are only contended by requests that yield while holding
+        them: writes waiting for their group commit and exports between their batches. Without such requests
+        a lane rarely has more than one active request.
+    """
+
+    READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self,
+                 read_concurrency: int=10,
+                 write_concurrency: int=2,
+                 max_queue: int=100,
+                 queue_timeout: float=1.0,
+                 retry_after: int=1):
+        """
+            Create an admission control
+
+            :param read_concurrency: Number of reads processed at once
+            :param write_concurrency: Number of writes processed at once
+            :param max_queue: Number of requests waiting per lane
+            :param queue_timeout: Seconds a request may wait (since its arrival) before it is rejected
+            :param retry_after: Seconds of the Retry-After header of rejected requests
+        """
+        self.lanes = {'read': Lane('read', read_concurrency),
+                      'write': Lane('write', write_concurrency)}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+    def lane(self, method: str) -> Lane:
+        """
+            The lane of a request method
+        """
+        return self.lanes['read' if method in self.READ_METHODS else 'write']
+
+    def reject(self, handler, lane: Lane, reason: str):
+        """
+            Reject the request of handler
+
+            :raise: ServiceUnavailableError
+        """
+        lane.rejected += 1
+        if handler.metrics is not None:
+            handler.metrics.admission_rejected.inc(blueprint=handler.blueprint_name, lane=lane.name, reason=reason)
+        raise ServiceUnavailableError("Rejected by admission control (%s)" % reason, retry_after=self.retry_after)
+
+    @gen.coroutine
+    def acquire(self, handler) -> Lane:
+        """
+            Wait for a slot of the lane of the request of handler
+
+            :return: The lane, pass it to release when the request is finished
+            :raise: ServiceUnavailableError if the request is rejected
+        """
+        lane = self.lane(handler.request.method)
+        waited = handler.request.request_time()
+
+        if waited > self.queue_timeout:
+            self.reject(handler, lane, 'queue_timeout')
+
+        if lane.active < lane.concurrency:
+            lane.active += 1
+        elif len(lane.waiting) >= self.max_queue:
+            self.reject(handler, lane, 'queue_full')
+        else:
+            future = Future()
+            lane.waiting.append(future)
+            handler.admission_waiting = future
+            if handler.metrics is not None:
+                handler.metrics.admission_queued.inc(lane=lane.name)
+            try:
+                yield gen.with_timeout(timedelta(seconds=self.queue_timeout - waited), future)
+            except gen.TimeoutError:
+                if future.done():
+                    # The slot has been passed on after the timeout
+                    self.release(lane)
+                else:
+                    lane.waiting.remove(future)
+                self.reject(handler, lane, 'queue_timeout')
+            finally:
+                handler.admission_waiting = None
+                if handler.metrics is not None:
+                    handler.metrics.admission_queued.dec(lane=lane.name)
+
+        lane.admitted += 1
+        if handler.metrics is not None:
+            handler.metrics.admission_wait.observe(handler.request.request_time() - waited,
+                                                   blueprint=handler.blueprint_name, lane=lane.name)
+        return lane
+
+    def release(self, lane: Lane):
+        """
+            Return a slot, it is passed to the first waiting request of the lane
+
+            Requests that stopped waiting (their client disconnected) are skipped.
+        """
+        while lane.waiting:
+            future = lane.waiting.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        lane.active -= 1
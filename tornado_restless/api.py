@@ -3,10 +3,19 @@
 """
 
 """
+from collections import OrderedDict
+import logging
+from time import perf_counter
+
+from sqlalchemy import inspect as sqinspect
+from sqlalchemy.orm import configure_mappers
 from tornado.web import Application, URLSpec
 
-from .handler import BaseHandler
+from .batch import BatchHandler
+from .handler import BaseHandler, DispatchHandler
 from .errors import IllegalArgumentError
+from .metrics import ApiMetrics, MetricsHandler
+from .wrapper import ModelWrapper
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
 __date__ = '26.04.13 - 22:25'
@@ -28,17 +37,31 @@ class ApiManager(object):
 
     def __init__(self,
                  application: Application,
-                 session_maker: type=None):
+                 session_maker: type=None,
+                 metrics: bool=False,
+                 dispatch: bool=False):
         """
         Create an instance of the tornado restless engine
 
         :param session_maker: is a sqlalchemy.orm.Session class factory
         :param application: is the tornado.web.Application object
+        :param metrics: Collect request metrics of all blueprints (see create_metrics_api)
+        :param dispatch: Register one route per url prefix, that dispatches to the blueprints by collection name,
+                         instead of one route per blueprint
         """
         self.application = application
 
         self.session_maker = session_maker
 
+        self.metrics = ApiMetrics() if metrics else None
+
+        self.dispatch = dispatch
+        self.dispatch_tables = {}
+
+        self.startup_timings = {}
+
+        self.blueprints = {}
+
     def create_api_blueprint(self,
                              model,
                              methods: set=METHODS_READ,
@@ -56,6 +79,24 @@ class ApiManager(object):
                              results_per_page: int=10,
                              max_results_per_page: int=100,
                              blueprint_prefix: str='',
+                             server_timing: bool=False,
+                             timing_callback=None,
+                             debug_statements: bool=False,
+                             statement_budget: int=None,
+                             profiler=None,
+                             slow_request_threshold: float=None,
+                             relation_policies: dict=None,
+                             reference_duplicates: bool=False,
+                             compound_documents: bool=False,
+                             core_reads: bool=True,
+                             allow_export: bool=False,
+                             export_batch_size: int=1000,
+                             upsert: bool=False,
+                             group_commit=None,
+                             admission=None,
+                             statement_timeout: float=None,
+                             max_statement_timeout: float=None,
+                             cache=None,
                              handler_class: type=BaseHandler) -> URLSpec:
         """
         Create a tornado route for a sqlalchemy model
@@ -76,6 +117,33 @@ class ApiManager(object):
         :param blueprint_prefix: The Prefix that will be used to unique collection_name for named_handlers
         :param preprocessor: A dictionary of list of preprocessors that get called
         :param postprocessor: A dictionary of list of postprocessor that get called
+        :param server_timing: Append a Server-Timing header with the phase timings to every response
+        :param timing_callback: A function called with keyword arguments handler and timings after every request
+        :param debug_statements: Append a X-Restless-Statements header summarizing the executed sql statements
+        :param statement_budget: Log a warning with the repeated statements when a request executes more statements
+        :param profiler: A tornado_restless.profiler.RequestProfiler profiling sampled requests
+        :param slow_request_threshold: Log requests taking longer (in seconds) with their queries and timings
+        :param relation_policies: Dictionary of relation name (or '*' for all relations) to a dictionary with
+                                  max_items (truncate embedded collections) and render ('embed', 'id' or 'url')
+        :param reference_duplicates: Render instances repeated in a response by their primary key after the first
+        :param compound_documents: Return the related instances of get_many in a top level included dictionary
+                                   by default (query argument compound)
+        :param core_reads: Read rows instead of instances on GET, if the response contains only plain columns
+                           (of a model without polymorphic inheritance)
+        :param allow_export: Stream all (filtered) instances as NDJSON or CSV on GET <collection>/_export
+        :param export_batch_size: Number of instances fetched, translated and flushed at once by an export
+        :param upsert: PUT inserts or updates the instance of the url (or a list of instances on the collection)
+                       by one INSERT ... ON CONFLICT DO UPDATE statement on sqlite and postgresql,
+                       attributes missing in the body keep their values
+        :param group_commit: A tornado_restless.group.GroupCommit committing the writes of concurrent requests
+                             in one transaction
+        :param admission: A tornado_restless.admission.AdmissionControl limiting the requests processed at once,
+                          with separate lanes for reads and writes
+        :param statement_timeout: Seconds since the arrival of a request its sql statements may take in default,
+                                  enforced by statement timeouts on postgresql and interrupts on sqlite
+        :param max_statement_timeout: The hard upper limit of the timeout query argument
+        :param cache: A tornado_restless.cache.InstanceCache keeping the responses of single instances,
+                      invalidated on changes of the instances
         :param handler_class: The Handler Class that will be used in the route
         :type handler_class: tornado_restless.handler.BaseHandler or a subclass
         :return: :class:`tornado.web.URLSpec`
@@ -84,7 +152,17 @@ class ApiManager(object):
         if exclude_columns is not None and include_columns is not None:
             raise IllegalArgumentError('Cannot simultaneously specify both include columns and exclude columns.')
 
+        for relation, policy in (relation_policies or {}).items():
+            if policy.get('render', 'embed') not in ('embed', 'id', 'url'):
+                raise IllegalArgumentError('Unknown render %s of relation %s.' % (policy['render'], relation))
+            if policy.get('max_items') is not None and policy['max_items'] < 0:
+                raise IllegalArgumentError('Negative max_items of relation %s.' % relation)
+
+        if cache is not None:
+            cache.register(model)
+
         table_name = collection_name if collection_name is not None else model.__tablename__
+        blueprint_name = '%s%s' % (blueprint_prefix, table_name)
 
         kwargs = {'model': model,
                   'manager': self,
@@ -99,13 +177,35 @@ class ApiManager(object):
                   'exclude_queries': exclude_queries,
                   'exclude_hybrids': exclude_hybrids,
                   'results_per_page': results_per_page,
-                  'max_results_per_page': max_results_per_page}
+                  'max_results_per_page': max_results_per_page,
+                  'server_timing': server_timing,
+                  'timing_callback': timing_callback,
+                  'blueprint_name': blueprint_name,
+                  'debug_statements': debug_statements,
+                  'statement_budget': statement_budget,
+                  'profiler': profiler,
+                  'slow_request_threshold': slow_request_threshold,
+                  'relation_policies': relation_policies,
+                  'reference_duplicates': reference_duplicates,
+                  'compound_documents': compound_documents,
+                  'core_reads': core_reads,
+                  'allow_export': allow_export,
+                  'export_batch_size': export_batch_size,
+                  'upsert': upsert,
+                  'group_commit': group_commit,
+                  'admission': admission,
+                  'statement_timeout': statement_timeout,
+                  'max_statement_timeout': max_statement_timeout,
+                  'cache': cache,
+                  'collection_url': '%s/%s' % (url_prefix, table_name)}
 
         blueprint = URLSpec(
             "%s/%s(?:/(.+))?[/]?" % (url_prefix, table_name),
             handler_class,
             kwargs,
-            '%s%s' % (blueprint_prefix, table_name))
+            blueprint_name)
+        blueprint.url_prefix = url_prefix
+        blueprint.collection_name = table_name
         return blueprint
 
     def create_api(self,
@@ -120,12 +220,195 @@ class ApiManager(object):
         :param virtualhost: bindhost for binding, .*$ in default
         """
         blueprint = self.create_api_blueprint(model, *args, **kwargs)
+        if self.dispatch:
+            self.add_dispatch_blueprint(blueprint, virtualhost)
+        else:
+            self.add_blueprint(blueprint, virtualhost)
+
+    def create_apis(self,
+                    models,
+                    virtualhost=r".*$",
+                    precompute: bool=True,
+                    **defaults) -> list:
+        """
+        Creates and registers the routes of many models in one pass
+
+        The time spent for the metadata and the registration is logged and kept in startup_timings.
+
+        :param models: A declarative base, an iterable of models or a dictionary of model to
+                       keyword arguments that override the defaults for this model
+        :param virtualhost: bindhost for binding, .*$ in default
+        :param precompute: Compute and validate the metadata of all models before registering them
+        :param defaults: Keyword arguments passed to create_api_blueprint for all models
+        :return: List of :class:`tornado.web.URLSpec`
+        :raise: IllegalArgumentError if the metadata of a model is invalid
+        """
+        start = perf_counter()
+
+        if not isinstance(models, dict):
+            models = OrderedDict((model, {}) for model in self.get_models(models))
+
+        # Metadata
+        if precompute:
+            configure_mappers()
+            for model in models:
+                ModelWrapper(model).precompute()
+        metadata = perf_counter()
+
+        # Blueprints
+        blueprints = []
+        for model, options in models.items():
+            kwargs = dict(defaults)
+            kwargs.update(options)
+            blueprints.append(self.create_api_blueprint(model, **kwargs))
+
+        if self.dispatch:
+            for blueprint in blueprints:
+                self.add_dispatch_blueprint(blueprint, virtualhost)
+        else:
+            self.add_blueprints(blueprints, virtualhost)
+        end = perf_counter()
+
+        self.startup_timings = {'models': len(blueprints),
+                                'metadata': metadata - start,
+                                'register': end - metadata,
+                                'total': end - start}
+        logging.getLogger('tornado.restless').info(
+            "Registered %(models)u apis in %(total).3fs (metadata %(metadata).3fs, register %(register).3fs)" %
+            self.startup_timings)
+
+        return blueprints
+
+    @staticmethod
+    def get_models(models) -> list:
+        """
+        Returns the mapped classes of a declarative base or the models of an iterable
+
+        Subclasses of single table inheritance are skipped as they share the table of their parent.
+
+        :param models: A declarative base or an iterable of models
+        """
+        registry = getattr(models, 'registry', None)
+        if registry is not None and hasattr(registry, 'mappers'):
+            classes = [mapper.class_ for mapper in registry.mappers]
+        elif hasattr(models, '_decl_class_registry'):
+            classes = [cls for cls in models._decl_class_registry.values()
+                       if isinstance(cls, type) and hasattr(cls, '__mapper__')]
+        else:
+            return list(models)
+
+        return sorted((cls for cls in classes if not getattr(sqinspect(cls), 'single', False)),
+                      key=lambda cls: cls.__name__)
+
+    def create_metrics_api(self,
+                           url: str='/metrics',
+                           virtualhost=r".*$"):
+        """
+        Creates and registers a route serving the collected metrics in the prometheus text format
+
+        :param url: The url of the metrics route
+        :param virtualhost: bindhost for binding, .*$ in default
+        :raise: IllegalArgumentError if the manager was created without metrics
+        """
+        if self.metrics is None:
+            raise IllegalArgumentError('Metrics are disabled for this ApiManager.')
+
+        blueprint = URLSpec(url, MetricsHandler, {'registry': self.metrics}, 'metrics')
+        self.add_blueprint(blueprint, virtualhost)
+
+    def create_batch_api(self,
+                         url_prefix: str='/api',
+                         virtualhost=r".*$",
+                         transaction: bool=False,
+                         max_operations: int=100):
+        """
+        Creates and registers the route <url_prefix>/_batch executing many operations on the blueprints
+        of url_prefix in one request (see :class:`tornado_restless.batch.BatchHandler`)
+
+        :param url_prefix: The url prefix of the blueprints
+        :param virtualhost: bindhost for binding, .*$ in default
+        :param transaction: Execute the operations of a batch in one transaction in default
+        :param max_operations: The hard upper limit of operations per batch
+        """
+        blueprint = URLSpec("%s/_batch" % url_prefix,
+                            BatchHandler,
+                            {'manager': self, 'url_prefix': url_prefix,
+                             'transaction': transaction, 'max_operations': max_operations},
+                            'batch%s' % url_prefix)
+        blueprint.url_prefix = url_prefix
+        blueprint.collection_name = '_batch'
+
+        if self.dispatch:
+            self.add_dispatch_blueprint(blueprint, virtualhost)
+        else:
+            self.add_blueprint(blueprint, virtualhost)
+
+    def add_dispatch_blueprint(self,
+                               blueprint: URLSpec,
+                               virtualhost=r".*$"):
+        """
+        Registers a blueprint in the dispatch table of its url prefix
+
+        The first blueprint of an url prefix registers the route of the DispatchHandler,
+        the blueprint itself is only added to the named handlers for reverse_url.
+
+        :param blueprint: The route returned by create_api_blueprint
+        :param virtualhost: bindhost for binding, .*$ in default
+        :raise: IllegalArgumentError if the collection is already registered
+        """
+        key = (virtualhost, blueprint.url_prefix)
+        if key not in self.dispatch_tables:
+            self.dispatch_tables[key] = {}
+            self.add_blueprint(URLSpec("%s/[^/]+(?:/(.+))?[/]?" % blueprint.url_prefix,
+                                       DispatchHandler,
+                                       {'blueprints': self.dispatch_tables[key], 'url_prefix': blueprint.url_prefix},
+                                       'dispatch%s' % blueprint.url_prefix),
+                               virtualhost)
 
+        blueprints = self.dispatch_tables[key]
+        if blueprint.collection_name in blueprints:
+            raise IllegalArgumentError('Collection %s is already registered.' % blueprint.collection_name)
+        blueprints[blueprint.collection_name] = (blueprint.handler_class, blueprint.kwargs)
+
+        self.application.named_handlers[blueprint.name] = blueprint
+        self.register_blueprint(blueprint)
+
+    def add_blueprint(self,
+                      blueprint: URLSpec,
+                      virtualhost=r".*$"):
+        """
+        Registers a route in your tornado application
+
+        :param blueprint: The route
+        :param virtualhost: bindhost for binding, .*$ in default
+        """
+        self.add_blueprints([blueprint], virtualhost)
+
+    def add_blueprints(self,
+                       blueprints: list,
+                       virtualhost=r".*$"):
+        """
+        Registers many routes in your tornado application at once
+
+        :param blueprints: List of routes
+        :param virtualhost: bindhost for binding, .*$ in default
+        """
         for vhost, handlers in self.application.handlers:
             if vhost == virtualhost:
-                handlers.append(blueprint)
+                handlers.extend(blueprints)
                 break
         else:
-            self.application.add_handlers(virtualhost, [blueprint])
+            self.application.add_handlers(virtualhost, blueprints)
+
+        for blueprint in blueprints:
+            self.application.named_handlers[blueprint.name] = blueprint
+            self.register_blueprint(blueprint)
 
-        self.application.named_handlers[blueprint.name] = blueprint
\ No newline at end of file
+    def register_blueprint(self, blueprint: URLSpec):
+        """
+            Remember a blueprint of a model by url prefix and collection name (used by the batch api)
+
+            :param blueprint: The route
+        """
+        if issubclass(blueprint.handler_class, BaseHandler) and hasattr(blueprint, 'collection_name'):
+            self.blueprints[(blueprint.url_prefix, blueprint.collection_name)] = blueprint
\ No newline at end of file
@@ -0,0 +1,211 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless Batch
+
+    Executes many operations on the blueprints of an ApiManager in one request.
+"""
+from json import loads, dumps
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.escape import url_escape
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+from tornado.web import RequestHandler
+
+from .errors import IllegalArgumentError
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 21:40'
+
+
+class BatchConnection(object):
+    """
+        Stands in for the http connection of an operation and collects its response
+    """
+
+    def __init__(self, context=None):
+        self.context = context
+        self.code = None
+        self.headers = None
+        self.chunks = []
+
+    def set_close_callback(self, callback):
+        pass
+
+    def write_headers(self, start_line, headers, chunk=None, callback=None):
+        self.code = start_line.code
+        self.headers = headers
+        return self.write(chunk, callback=callback)
+
+    def write(self, chunk, callback=None):
+        if chunk:
+            self.chunks.append(chunk)
+        if callback is not None:
+            callback()
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def finish(self):
+        pass
+
+    def result(self) -> dict:
+        """
+            The status and the (json decoded) body of the response
+        """
+        body = b"".join(self.chunks).decode('utf-8')
+        if body and 'json' in (self.headers or {}).get('Content-Type', ''):
+            body = loads(body)
+        return {'status': self.code, 'body': body or None}
+
+
+@gen.coroutine
+def execute_handler(handler: RequestHandler, *args):
+    """
+        Execute a request handler created outside of the application like the application executes it
+
+        Runs prepare, the http method and finish of the handler including its error handling and resolves
+        when the handler has finished. This is the only place relying on the private RequestHandler._execute.
+
+        :param handler: The request handler
+        :param args: The path arguments of the request
+    """
+    yield handler._execute([], *args)
+
+
+class BatchHandler(RequestHandler):
+    """
+        Executes a list of operations on the blueprints of an url prefix in one request
+
+        The body is a json list of operations (or a dictionary with operations and transaction)::
+
+            [{"method": "GET", "collection": "persons", "id": 1},
+             {"method": "GET", "collection": "persons", "q": {"filters": [...]}},
+             {"method": "PATCH", "collection": "computers", "id": 2, "body": {"cpu": 3.2}}]
+
+        Every operation is executed by the handler of its blueprint, including pre- and postprocessors,
+        with one shared session. The response contains the status and the body of every operation in order.
+
+        Within a transaction the operations only flush the session. The batch commits it at the end or rolls it back
+        at the first failing operation, the remaining operations are answered with :http:statuscode:`424`.
+    """
+
+    SUPPORTED_METHODS = ['POST']
+
+    # noinspection PyMethodOverriding
+    def initialize(self,
+                   manager,
+                   url_prefix: str,
+                   transaction: bool=False,
+                   max_operations: int=100):
+        """
+            :param manager: The tornado_restless Api Manager
+            :param url_prefix: The url prefix of the blueprints
+            :param transaction: Execute the operations in one transaction in default
+            :param max_operations: The hard upper limit of operations per batch
+        """
+        self.manager = manager
+        self.url_prefix = url_prefix
+        self.transaction = transaction
+        self.max_operations = max_operations
+
+    def parse_operations(self) -> tuple:
+        """
+            Returns the operations of the body and whether they are executed in one transaction
+
+            :statuscode 400: if the body is no list of operations or exceeds max_operations
+        """
+        try:
+            operations = loads(self.request.body.decode('utf-8'))
+        except ValueError:
+            raise IllegalArgumentError("Batch body is no valid json")
+
+        transaction = self.transaction
+        if isinstance(operations, dict):
+            transaction = operations.get('transaction', transaction)
+            operations = operations.get('operations')
+
+        if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+            raise IllegalArgumentError("Batch body is no list of operations")
+        if len(operations) > self.max_operations:
+            raise IllegalArgumentError("Batch has more than %u operations" % self.max_operations)
+
+        return operations, transaction
+
+    def create_request(self, operation: dict) -> HTTPServerRequest:
+        """
+            Create the http request of an operation
+
+            :param operation: Dictionary of method, collection, id, q and body
+        """
+        uri = '%s/%s' % (self.url_prefix, url_escape(str(operation.get('collection', ''))))
+        if operation.get('id') is not None:
+            uri += '/%s' % url_escape(str(operation['id']))
+        if operation.get('q') is not None:
+            uri += '?q=%s' % url_escape(dumps(operation['q']))
+
+        headers = HTTPHeaders({'Content-Type': 'application/json; charset=UTF-8'})
+        body = dumps(operation['body']).encode('utf-8') if operation.get('body') is not None else b""
+
+        return HTTPServerRequest(method=str(operation.get('method', 'GET')).upper(), uri=uri, version='HTTP/1.1',
+                                 headers=headers, body=body, host=self.request.host,
+                                 connection=BatchConnection(getattr(self.request.connection, 'context', None)))
+
+    @gen.coroutine
+    def execute(self, operation: dict, session, transaction: bool) -> dict:
+        """
+            Execute one operation with the handler of its blueprint
+
+            :param operation: Dictionary of method, collection, id, q and body
+            :param session: The session shared by all operations
+            :param transaction: Only flush the session instead of committing it
+            :return: Dictionary of status and body
+        """
+        blueprint = self.manager.blueprints.get((self.url_prefix, operation.get('collection')))
+        if blueprint is None:
+            return {'status': 404, 'body': None}
+
+        request = self.create_request(operation)
+        kwargs = dict(blueprint.kwargs, session=session, batch_transaction=transaction)
+        handler = blueprint.handler_class(self.application, request, **kwargs)
+
+        instance_id = str(operation['id']) if operation.get('id') is not None else None
+        yield execute_handler(handler, instance_id)
+
+        return request.connection.result()
+
+    @gen.coroutine
+    def post(self, *args):
+        """
+            POST a batch of operations
+
+            :param args: (ignored, set by the route of the dispatcher)
+
+            :statuscode 200: the operations have been executed (see the status of each operation)
+            :statuscode 400: if the body is no list of operations or exceeds max_operations
+        """
+        operations, transaction = self.parse_operations()
+
+        session = self.manager.session_maker()
+        results = []
+        failed = False
+        try:
+            for operation in operations:
+                if failed:
+                    results.append({'status': 424, 'body': None})
+                    continue
+
+                result = yield self.execute(operation, session, transaction)
+                results.append(result)
+
+                if transaction and (result['status'] is None or result['status'] >= 400):
+                    session.rollback()
+                    failed = True
+
+            if transaction and not failed:
+                session.commit()
+        finally:
+            session.close()
+
+        self.finish({'results': results})
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless Instance Cache
+
+    Caches the responses of single instances by their primary key.
+"""
+from collections import OrderedDict
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy import inspect as sqinspect
+from sqlalchemy.orm import Session
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 22:55'
+
+_caches = {}
+_listening = False
+_PENDING = 'tornado_restless.cache'
+
+
+def _caches_of(model) -> list:
+    """
+        The caches registered for model or one of its base classes
+    """
+    return [cache for cls in model.__mro__ for cache in _caches.get(cls, ())]
+
+
+def _after_flush(session, flush_context):
+    """
+        Invalidate the updated and deleted instances of a flush
+    """
+    for instance in list(session.dirty) + list(session.deleted):
+        identity = sqinspect(instance).identity
+        if identity is not None:
+            invalidate_instance(type(instance), identity, session)
+
+
+def _after_bulk(context):
+    """
+        Invalidate all instances of the model of a bulk update or delete (Query.update and Query.delete)
+    """
+    invalidate_model(context.mapper.class_, context.session)
+
+
+def _after_transaction(session):
+    """
+        Invalidate the instances changed in the transaction again, they may have been cached before its end
+    """
+    for cache, identity in session.info.pop(_PENDING, ()):
+        cache.discard(identity)
+
+
+def listen():
+    """
+        Register the session listeners (only once)
+    """
+    global _listening
+    if not _listening:
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_bulk_update', _after_bulk)
+        event.listen(Session, 'after_bulk_delete', _after_bulk)
+        event.listen(Session, 'after_commit', _after_transaction)
+        event.listen(Session, 'after_rollback', _after_transaction)
+        _listening = True
+
+
+def invalidate_instance(model, identity: tuple, session: Session=None):
+    """
+        Invalidate an instance in all caches of its model
+
+        Use this for instances changed by statements the session does not notice (e.g. core update statements).
+
+        :param model: The model class
+        :param identity: The primary key of the instance
+        :param session: The session the instance has been changed in, it is invalidated again after its transaction
+    """
+    for cache in _caches_of(model):
+        cache.discard(identity)
+        if session is not None:
+            session.info.setdefault(_PENDING, []).append((cache, identity))
+
+
+def invalidate_model(model, session: Session=None):
+    """
+        Invalidate all instances in the caches of model
+
+        :param model: The model class
+        :param session: The session the instances have been changed in, they are invalidated again after its end
+    """
+    invalidate_instance(model, None, session)
+
+
+class InstanceCache(object):
+    """
+        Caches the responses of get_single of the blueprints it is passed to (create_api_blueprint(cache=...))
+
+        The json encoded responses are kept by primary key (and blueprint) in a LRU of max_size instances,
+        an entry expires ttl seconds after it has been written (or never without ttl).
+
+        Instances are invalidated when a session flushes an update or delete of them, at the bulk updates and
+        deletes of their model (patch_many and delete_many) and again at the end of the transaction.
+        Writes of the blueprints that bypass the session invalidate their instances explicitly.
+        Changes of related instances included in a response are not noticed, limit them by ttl.
+
+        Pass the same instance to blueprints of the same model to share the invalidations.
+    """
+
+    def __init__(self,
+                 max_size: int=10000,
+                 ttl: float=None):
+        """
+            Create an instance cache
+
+            :param max_size: Number of instances kept
+            :param ttl: Seconds an entry is valid, None for no expiry
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<InstanceCache %u/%u hits=%u misses=%u>' % (len(self.entries), self.max_size, self.hits, self.misses)
+
+    def register(self, model):
+        """
+            Invalidate this cache on changes of the instances of model
+
+            :param model: The model class
+        """
+        listen()
+        caches = _caches.setdefault(model, [])
+        if self not in caches:
+            caches.append(self)
+
+    def get(self, identity: tuple, variant: str) -> str:
+        """
+            Returns the cached response of an instance or None
+
+            :param identity: The primary key of the instance
+            :param variant: The blueprint of the response
+        """
+        entry = self.entries.get(identity)
+        if entry is not None:
+            expires, responses = entry
+            if expires is not None and expires < perf_counter():
+                del self.entries[identity]
+            elif variant in responses:
+                self.entries.move_to_end(identity)
+                self.hits += 1
+                return responses[variant]
+        self.misses += 1
+        return None
+
+    def set(self, identity: tuple, variant: str, response: str):
+        """
+            Cache the response of an instance
+
+            :param identity: The primary key of the instance
+            :param variant: The blueprint of the response
+            :param response: The json encoded response
+        """
+        entry = self.entries.get(identity)
+        if entry is None:
+            entry = self.entries[identity] = (perf_counter() + self.ttl if self.ttl is not None else None, {})
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(identity)
+        entry[1][variant] = response
+
+    def discard(self, identity: tuple=None):
+        """
+            Remove an instance from the cache
+
+            :param identity: The primary key of the instance, None removes all instances
+        """
+        if identity is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(identity, None)
@@ -6,14 +6,17 @@
 from datetime import datetime, date, time
 from decimal import Decimal
 import collections
-import itertools
+from urllib.parse import quote
 
-from sqlalchemy.orm import object_mapper
-from sqlalchemy.orm.exc import UnmappedInstanceError
+from sqlalchemy import inspect as sqinspect
+from sqlalchemy.orm import object_mapper, object_session, with_parent
+from sqlalchemy.orm.exc import UnmappedInstanceError, UnmappedColumnError
+from sqlalchemy.orm.interfaces import MANYTOONE
 from sqlalchemy.orm.query import Query
+from sqlalchemy.types import TypeDecorator
 
 from .errors import IllegalArgumentError, DictConvertionError
-from .wrapper import ModelWrapper
+from .wrapper import ModelWrapper, _metadata
 
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
@@ -159,6 +162,58 @@ def to_filter(instance,
     return alchemy_filters
 
 
+def to_converter(column):
+    """
+        Returns a function translating the values of column like to_dict, None if they are passed unchanged
+
+        :param column: The sqlalchemy column
+    """
+    if isinstance(column.type, TypeDecorator):
+        return to_dict
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return to_dict
+
+    if issubclass(python_type, __datetypes__):
+        return lambda value: None if value is None else value.isoformat()
+    if issubclass(python_type, __clsztypes__):
+        return lambda value: None if value is None else str(value)
+    if issubclass(python_type, __basetypes__):
+        return None
+    return to_dict
+
+
+def get_converters(mapper, columns: list) -> tuple:
+    """
+        Returns the converters (see to_converter) of columns of a mapper, memoized per mapper
+
+        :param mapper: The sqlalchemy mapper
+        :param columns: Names of the column attributes
+    """
+    converters = _metadata.setdefault(mapper, {}).setdefault('converters', {})
+    try:
+        return tuple(converters[column] for column in columns)
+    except KeyError:
+        for column in columns:
+            if column not in converters:
+                converters[column] = to_converter(mapper.attrs[column].columns[0])
+        return tuple(converters[column] for column in columns)
+
+
+def rows_to_dict(rows: list, columns: list, converters: tuple) -> list:
+    """
+        Translates result rows to dictionaries like to_dict translates instances with only these columns
+
+        :param rows: The rows (see SessionedModelWrapper.rows)
+        :param columns: Names of the column attributes in the order of the rows
+        :param converters: The converters of the columns (see get_converters)
+    """
+    items = tuple(zip(columns, converters))
+    return [{column: value if convert is None else convert(value)
+             for (column, convert), value in zip(items, row)} for row in rows]
+
+
 def to_deep(include,
             exclude,
             key):
@@ -184,10 +239,166 @@ def to_deep(include,
     return rtn
 
 
+class DictMemo(object):
+    """
+        Memo of one to_dict translation (e.g. one response)
+
+        Instances translated again with the same include / exclude get the same dictionary
+        (or their primary key with references), instances referencing one of the instances
+        they are nested in get the primary key of it instead of recursing.
+    """
+
+    def __init__(self, references: bool=False):
+        """
+            :param references: Translate repeated instances to their primary key instead of reusing the dictionary
+        """
+        self.references = references
+        self.translated = {}
+        self.active = set()
+
+
+def to_identity(instance):
+    """
+        Returns the primary key of an instance (a list for composite primary keys)
+
+        :param instance: The sqlalchemy instance
+    """
+    if instance is None:
+        return None
+
+    identity = sqinspect(instance).identity
+    if identity is None:
+        return None
+    return _to_identity(identity)
+
+
+def _to_identity(values):
+    """
+        Translates the values of a primary key like to_identity
+    """
+    if len(values) == 1:
+        return to_dict(values[0])
+    return [to_dict(value) for value in values]
+
+
+def _related_identities(instance, relation, max_items: int=None) -> tuple:
+    """
+        Returns the primary keys of the instances of a relation without loading them (see to_related)
+
+        The primary key of a many to one relation is taken from the foreign key of instance,
+        otherwise only the primary key columns of the related instances are read.
+    """
+    prop = relation.property
+    primary_key = prop.mapper.primary_key
+
+    # Foreign key
+    if prop.direction is MANYTOONE:
+        local = {remote: column for column, remote in prop.local_remote_pairs}
+        if all(column in local for column in primary_key):
+            mapper = object_mapper(instance)
+            try:
+                values = [getattr(instance, mapper.get_property_by_column(local[column]).key)
+                          for column in primary_key]
+            except UnmappedColumnError:
+                pass
+            else:
+                return (None if any(value is None for value in values) else _to_identity(values)), None
+
+    query = object_session(instance).query(*primary_key).filter(with_parent(instance, relation))
+    query = query.order_by(*(prop.order_by or primary_key))
+    if max_items is not None:
+        rows = query.limit(max_items + 1).all()
+        truncated = len(rows) > max_items
+        rows = rows[:max_items]
+    else:
+        rows = query.all()
+        truncated = None
+
+    if prop.uselist:
+        return [_to_identity(row) for row in rows], truncated
+    return (_to_identity(rows[0]) if rows else None), None
+
+
+def to_related(instance,
+               key: str,
+               policy: dict,
+               options,
+               include=None,
+               exclude=None,
+               memo: DictMemo=None) -> tuple:
+    """
+        Translates the relation key of instance according to a relation policy
+
+        The policy is a dictionary with the optional keys:
+          * max_items: Return at most max_items of a collection, only max_items + 1 are fetched
+          * render: 'embed' the related instances (default), return their primary keys ('id')
+                    or the url of the relation ('url', requires options['url'])
+
+        Collections are truncated in the order of the relation or of the primary key of the related instances.
+        Primary keys of relations that are not loaded yet are read without loading the related instances.
+
+        :param instance: The sqlalchemy instance
+        :param key: Name of the relation
+        :param policy: The relation policy
+        :param options: Dictionary of flags (see to_dict)
+        :param include: Columns and Relations that should be included for the related instances
+        :param exclude: Columns and Relations that should not be included for the related instances
+        :param memo: The memo of the translation
+        :return: (translated value, truncated) with truncated None if the relation was not truncated
+    """
+    render = policy.get('render', 'embed')
+    max_items = policy.get('max_items')
+
+    # Link to the relation endpoint, no query at all
+    if render == 'url' and options.get('url') is not None:
+        identity = sqinspect(instance).identity or ()
+        identity = options.get('id_separator', ',').join(quote(str(to_dict(value)), safe='') for value in identity)
+        return '%s/%s/%s' % (options['url'], identity, key), None
+
+    relation = getattr(type(instance), key)
+    order_by = relation.property.order_by or relation.property.mapper.primary_key
+
+    # Primary keys only
+    if render == 'id' and key not in instance.__dict__ and object_session(instance) is not None:
+        return _related_identities(instance, relation, max_items if relation.property.uselist else None)
+
+    # Collections
+    if relation.property.uselist and max_items is not None:
+        node = instance.__dict__.get(key)
+        session = object_session(instance)
+        # Not loaded: Query only max_items + 1
+        if node is None and session is not None:
+            query = session.query(relation.property.mapper).filter(with_parent(instance, relation))
+            nodes = query.order_by(*order_by).limit(max_items + 1).all()
+        else:
+            node = getattr(instance, key) if node is None else node
+            if isinstance(node, Query):
+                if not relation.property.order_by:
+                    node = node.order_by(*order_by)
+                nodes = node.limit(max_items + 1).all()
+            else:
+                nodes = list(node)[:max_items + 1]
+        truncated = len(nodes) > max_items
+        nodes = nodes[:max_items]
+    else:
+        nodes = getattr(instance, key)
+        if isinstance(nodes, Query):
+            nodes = nodes.all()
+        truncated = None
+
+    if render == 'embed':
+        return to_dict(nodes, include=include, exclude=exclude, memo=memo), truncated
+    elif relation.property.uselist:
+        return [to_identity(node) for node in nodes], truncated
+    else:
+        return to_identity(nodes), truncated
+
+
 def to_dict(instance,
             options=collections.defaultdict(bool),
             include=None,
-            exclude=None):
+            exclude=None,
+            memo: DictMemo=None):
     """
         Translates sqlalchemy instance to dictionary
 
@@ -197,8 +408,14 @@ def to_dict(instance,
         :param options: Dictionary of flags
                           * execute_queries: Execute Query Objects
                           * execute_hybrids: Execute Hybrids
+                          * relations: Dictionary of relation name (or '*' for all relations) to policy,
+                                       see to_related
+                          * url: Url of the collection of instance used by relation policies
+                          * id_separator: Separator of composite primary keys in urls
+                          * references: Translate repeated instances to their primary key (see DictMemo)
         :param include: Columns and Relations that should be included for an instance
         :param exclude: Columns and Relations that should not be included for an instance
+        :param memo: The memo of repeated instances, created for every top level call
     """
     if exclude is not None and include is not None:
         raise ValueError('Cannot specify both include and exclude.')
@@ -215,38 +432,63 @@ def to_dict(instance,
     if isinstance(instance, __datetypes__):
         return instance.isoformat()
 
+    if memo is None:
+        memo = DictMemo(references=options.get('references', False))
+
     # Any Dictionary
     if isinstance(instance, dict) or hasattr(instance, 'items'):
-        return {k: to_dict(v, options=options, **to_deep(include, exclude, k)) for k, v in instance.items()}
+        return {k: to_dict(v, options=options, memo=memo, **to_deep(include, exclude, k)) for k, v in instance.items()}
 
     # Any List
     if isinstance(instance, list) or hasattr(instance, '__iter__'):
-        return [to_dict(x, options=options, include=include, exclude=exclude) for x in instance]
+        return [to_dict(x, options=options, include=include, exclude=exclude, memo=memo) for x in instance]
 
     # Additional classes:
     #  - decimal.Decimal: created by sqlalchemy.automap/reflect
     if isinstance(instance, __clsztypes__):
         return str(instance)
 
+    # Repeated instances and cycles
+    state = sqinspect(instance, raiseerr=False)
+    if state is None:
+        return _instance_to_dict(instance, options, include, exclude, memo)
+
+    identity = state.key or id(instance)
+    if identity in memo.active:
+        return to_identity(instance)
+
+    key = (identity, id(include), id(exclude), id(options))
+    if key in memo.translated:
+        return to_identity(instance) if memo.references else memo.translated[key]
+
+    memo.active.add(identity)
+    try:
+        rtn = memo.translated[key] = _instance_to_dict(instance, options, include, exclude, memo)
+    finally:
+        memo.active.discard(identity)
+    return rtn
+
+
+def _instance_to_dict(instance, options, include, exclude, memo: DictMemo) -> dict:
+    """
+        Translates one instance to a dictionary (see to_dict)
+    """
+
     # Include Columns given
     if isinstance(include, collections.Iterable):
         rtn = {}
         for column in include:
-            rtn[column] = to_dict(getattr(instance, column), **to_deep(include, exclude, column))
+            rtn[column] = to_dict(getattr(instance, column), memo=memo, **to_deep(include, exclude, column))
         return rtn
 
     # Include all columns if it is a SQLAlchemy instance
     try:
-        columns = ModelWrapper.get_columns(object_mapper(instance)).keys()
-        relations = ModelWrapper.get_relations(object_mapper(instance)).keys()
-        attributes = ModelWrapper.get_attributes(object_mapper(instance)).keys()
-        proxies = [p.key for p in ModelWrapper.get_proxies(object_mapper(instance))]
-        hybrids = [p.key for p in ModelWrapper.get_hybrids(object_mapper(instance))]
-        attributes = itertools.chain(columns, relations, proxies, hybrids, attributes)
+        columns, hybrids, relations, attributes = ModelWrapper.get_mapper_attributes(object_mapper(instance))
     except UnmappedInstanceError:
         raise DictConvertionError("Could not convert argument to plain dict")
 
     rtn = {}
+    policies = options.get('relations') or {}
 
     # Include AssociationProxy and Hybrids (may be list/dict/col)
     for column in attributes:
@@ -260,6 +502,18 @@ def to_dict(instance,
         if include is False and column not in hybrids and column not in columns:
             continue
 
+        # Relations with a policy
+        policy = policies.get(column, policies.get('*')) if column in relations and include is not False else None
+        if policy is not None:
+            if column not in instance.__dict__ and not options.get('execute_queries', True):
+                if policy.get('render') != 'url' or options.get('url') is None:
+                    continue
+            rtn[column], truncated = to_related(instance, column, policy, options, memo=memo,
+                                                **to_deep(include, exclude, column))
+            if truncated is not None:
+                rtn['%s_truncated' % column] = truncated
+            continue
+
         if column not in instance.__dict__ and not options.get('execute_queries', True):
             if column not in hybrids or not options.get('execute_hybrids', True):
                 continue
@@ -275,5 +529,5 @@ def to_dict(instance,
             node = node.all()
 
         # Convert it
-        rtn[column] = to_dict(node, **to_deep(include, exclude, column))
+        rtn[column] = to_dict(node, memo=memo, **to_deep(include, exclude, column))
     return rtn
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Applies the deadline of a request to the sql statements executed while it is processed
+"""
+from threading import local
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 22:25'
+
+_active = local()
+_listening = False
+_APPLIED = 'tornado_restless.deadline'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+        Pass the statement to the active deadline
+
+        Without an active deadline the statement_timeout a deadline set on the connection is reset,
+        the transaction may have been shared with another request (e.g. by a group commit).
+    """
+    deadline = getattr(_active, 'deadline', None)
+    if deadline is not None:
+        deadline.apply(conn.dialect.name, cursor)
+        if conn.dialect.name == 'postgresql':
+            conn.info[_APPLIED] = True
+    elif conn.info.pop(_APPLIED, False):
+        cursor.execute('SET LOCAL statement_timeout TO DEFAULT')
+
+
+def _progress_handler() -> int:
+    """
+        Called by sqlite while it executes a statement, a non zero result interrupts the statement
+    """
+    deadline = getattr(_active, 'deadline', None)
+    if deadline is not None and deadline.expired():
+        deadline.exceeded = True
+        return 1
+    return 0
+
+
+def listen():
+    """
+        Register the cursor execute listener on all engines (only once)
+    """
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        _listening = True
+
+
+def is_timeout(error) -> bool:
+    """
+        Test whether a (sqlalchemy wrapped) database error has been caused by a statement timeout
+    """
+    orig = getattr(error, 'orig', error)
+    if getattr(orig, 'pgcode', None) == '57014':
+        return True
+    return type(orig).__module__.startswith('sqlite3') and 'interrupted' in str(orig)
+
+
+class StatementDeadline(object):
+    """
+        Limits the statements executed while it is active to the time remaining until its end
+
+        On postgresql every statement is preceded by SET LOCAL statement_timeout, on sqlite a progress handler
+        interrupts the statement. Other dialects are not limited.
+
+        A deadline only applies to statements while it is active, e.g. between activate() and deactivate()
+        in the thread it was activated in. Coroutine requests interleave on one thread, so an activation must
+        not span a yield (see BaseHandler.statement_scope).
+    """
+
+    SQLITE_INSTRUCTIONS = 1000
+
+    def __init__(self, timeout: float, elapsed: float=0.0):
+        """
+            :param timeout: Seconds until the end of the deadline
+            :param elapsed: Seconds of the timeout that already passed (e.g. since the arrival of the request)
+        """
+        self.timeout = timeout
+        self.end = perf_counter() + timeout - elapsed
+        self.exceeded = False
+        self.previous = None
+
+    def remaining(self) -> float:
+        """
+            Seconds until the end of the deadline
+        """
+        return self.end - perf_counter()
+
+    def expired(self) -> bool:
+        return perf_counter() >= self.end
+
+    def activate(self):
+        """
+            Make this deadline the active one of the current thread
+        """
+        listen()
+        self.previous = getattr(_active, 'deadline', None)
+        _active.deadline = self
+
+    def deactivate(self):
+        """
+            Restore the deadline that was active before
+        """
+        if getattr(_active, 'deadline', None) is self:
+            _active.deadline = self.previous
+        self.previous = None
+
+    def apply(self, dialect: str, cursor):
+        """
+            Limit the next statement executed by cursor to the remaining time
+
+            :param dialect: The name of the dialect
+            :param cursor: The dbapi cursor
+        """
+        if dialect == 'postgresql':
+            cursor.execute('SET LOCAL statement_timeout = %u' % max(1, int(self.remaining() * 1000)))
+        elif dialect == 'sqlite':
+            cursor.connection.set_progress_handler(_progress_handler, self.SQLITE_INSTRUCTIONS)
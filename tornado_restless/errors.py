@@ -30,6 +30,30 @@ class ProcessingException(HTTPError):
         HTTPError.__init__(self, status_code, log_message, *args, **kwargs)
 
 
+class ServiceUnavailableError(HTTPError):
+    """
+        Raised when a request is rejected because the service is overloaded
+
+        The client should retry after retry_after seconds.
+    """
+
+    def __init__(self, log_message, status_code=503, retry_after: int=1, *args, **kwargs):
+        HTTPError.__init__(self, status_code, log_message, *args, **kwargs)
+        self.retry_after = retry_after
+
+
+class ClientDisconnectedError(HTTPError):
+    """
+        Raised when the client closed the connection before the request has been processed
+
+        The remaining work of the request is skipped, nothing is sent.
+    """
+
+    def __init__(self, log_message=None, status_code=499, *args, **kwargs):
+        kwargs.setdefault('reason', 'Client Closed Request')
+        HTTPError.__init__(self, status_code, log_message, *args, **kwargs)
+
+
 class DictConvertionError(HTTPError):
     """
         Raised from convert.to_dict when it can't convert an instance to plain dict
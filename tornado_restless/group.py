@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless Group Commit
+
+    Commits the writes of concurrent requests in one transaction.
+"""
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 21:55'
+
+
+class GroupCommit(object):
+    """
+        Collects the writes of the blueprints it is passed to (create_api_blueprint(group_commit=...))
+        into one transaction, that is committed window seconds after the first write or after max_size writes
+
+        Every write request works in a savepoint of the shared session, a failing request only rolls back
+        its savepoint. The response of a successful write is sent after the commit of its group,
+        if the commit fails all requests of the group are answered with the error.
+
+        Pass the same instance to the blueprints of an engine to group their writes together.
+    """
+
+    def __init__(self,
+                 session_maker,
+                 window: float=0.002,
+                 max_size: int=100):
+        """
+            Create a group commit
+
+            :param session_maker: is a sqlalchemy.orm.Session class factory
+            :param window: Seconds a transaction waits for further writes before it is committed
+            :param max_size: Number of writes after which a transaction is committed immediately
+        """
+        self.session_maker = session_maker
+        self.window = window
+        self.max_size = max_size
+
+        self.current = None
+        self.futures = []
+        self.timeout = None
+
+        self.groups = 0
+        self.writes = 0
+
+    def session(self):
+        """
+            The session of the transaction currently collecting writes
+        """
+        if self.current is None:
+            self.current = self.session_maker()
+        return self.current
+
+    def join(self) -> Future:
+        """
+            Add a write to the current transaction
+
+            :return: Future resolved when the transaction is committed
+        """
+        future = Future()
+        self.futures.append(future)
+
+        if len(self.futures) >= self.max_size:
+            self.commit()
+        elif self.timeout is None:
+            io_loop = IOLoop.current()
+            self.timeout = io_loop.call_later(self.window, self.commit)
+        return future
+
+    def leave(self):
+        """
+            A write rolled back its savepoint instead of joining the current transaction
+
+            A transaction without joined writes is closed, so it does not hold its locks until the next write.
+        """
+        if self.current is not None and not self.futures:
+            self.current.close()
+            self.current = None
+
+    def commit(self):
+        """
+            Commit the current transaction and resolve the futures of its writes
+        """
+        if self.timeout is not None:
+            IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
+
+        session, futures = self.current, self.futures
+        self.current, self.futures = None, []
+        if session is None:
+            return
+
+        self.groups += 1
+        self.writes += len(futures)
+        try:
+            session.commit()
+        except Exception as ex:
+            session.rollback()
+            for future in futures:
+                future.set_exception(ex)
+        else:
+            for future in futures:
+                future.set_result(None)
+        finally:
+            session.close()
@@ -6,30 +6,56 @@
     Handles all registered blueprints, you may override this class and
      use the modification via create_api_blueprint(handler_class=...)
 """
+from collections import OrderedDict
+import csv
+from contextlib import contextmanager
+from functools import wraps
 import inspect
-from json import loads
+from json import loads, dumps
 import logging
+from io import StringIO
 from math import ceil
+import socket
+from time import perf_counter
 from traceback import print_exception
 from urllib.parse import parse_qs
 import sys
-import itertools
 
 from sqlalchemy import inspect as sqinspect
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.exc import NoResultFound, UnmappedInstanceError, MultipleResultsFound
 from sqlalchemy.util import memoized_instancemethod, memoized_property
-from tornado.web import RequestHandler, HTTPError
+from tornado import gen
+from tornado.escape import url_unescape
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.web import RequestHandler, HTTPError, ErrorHandler
 
-from .convert import to_dict, to_filter
-from .errors import IllegalArgumentError, MethodNotAllowedError, ProcessingException
-from .wrapper import SessionedModelWrapper
+from .cache import invalidate_instance
+from .convert import to_dict, to_deep, to_filter, rows_to_dict, get_converters, DictMemo
+from .deadline import StatementDeadline, is_timeout
+from .errors import IllegalArgumentError, MethodNotAllowedError, ProcessingException, ServiceUnavailableError, \
+    ClientDisconnectedError
+from .statements import StatementRecorder
+from .wrapper import ModelWrapper, SessionedModelWrapper
 
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
 __date__ = '26.04.13 - 22:09'
 
 
+def scoped(method):
+    """
+        Execute a method of the handler in the statement scope of its request (see BaseHandler.statement_scope)
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.statement_scope():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class BaseHandler(RequestHandler):
     """
         Basic Blueprint for a sqlalchemy model
@@ -47,6 +73,7 @@ class BaseHandler(RequestHandler):
     """
 
     ID_SEPARATOR = ","
+    EXPORT = "_export"
     SUPPORTED_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
 
     # noinspection PyMethodOverriding
@@ -64,7 +91,29 @@ class BaseHandler(RequestHandler):
                    include_columns: list,
                    exclude_columns: list,
                    results_per_page: int,
-                   max_results_per_page: int):
+                   max_results_per_page: int,
+                   server_timing: bool=False,
+                   timing_callback=None,
+                   blueprint_name: str=None,
+                   debug_statements: bool=False,
+                   statement_budget: int=None,
+                   profiler=None,
+                   slow_request_threshold: float=None,
+                   relation_policies: dict=None,
+                   reference_duplicates: bool=False,
+                   compound_documents: bool=False,
+                   core_reads: bool=True,
+                   allow_export: bool=False,
+                   export_batch_size: int=1000,
+                   upsert: bool=False,
+                   group_commit=None,
+                   admission=None,
+                   statement_timeout: float=None,
+                   max_statement_timeout: float=None,
+                   cache=None,
+                   collection_url: str=None,
+                   session=None,
+                   batch_transaction: bool=False):
         """
 
         Init of the handler, derives arguments from api create_api_blueprint
@@ -83,8 +132,31 @@ class BaseHandler(RequestHandler):
         :param exclude_columns: Blacklist of columns to be excluded
         :param results_per_page: The default value of how many results are returned per request
         :param max_results_per_page: The hard upper limit of resutest per page
+        :param server_timing: Append a Server-Timing header with the phase timings to every response
+        :param timing_callback: A function called with handler and timings after every finished request
+        :param blueprint_name: The name of the blueprint used in metrics and logs
+        :param debug_statements: Append a X-Restless-Statements header summarizing the executed sql statements
+        :param statement_budget: Log a warning when a request executes more sql statements
+        :param profiler: A tornado_restless.profiler.RequestProfiler for sampled requests
+        :param slow_request_threshold: Log requests taking longer (in seconds) with their queries and timings
+        :param relation_policies: Dictionary of relation name (or '*') to policy, see convert.to_related
+        :param reference_duplicates: Render instances repeated in a response by their primary key after the first
+        :param compound_documents: Return compound documents in get_many by default
+        :param core_reads: Read rows instead of instances on GET, if the response contains only plain columns
+        :param allow_export: Stream all (filtered) instances as NDJSON or CSV on GET <collection>/_export
+        :param export_batch_size: Number of instances fetched, translated and flushed at once by an export
+        :param upsert: PUT inserts or updates instances by one INSERT ... ON CONFLICT DO UPDATE statement
+        :param group_commit: A tornado_restless.group.GroupCommit committing concurrent writes together
+        :param admission: A tornado_restless.admission.AdmissionControl limiting the requests processed at once
+        :param statement_timeout: Seconds since the arrival of a request its sql statements may take in default
+        :param max_statement_timeout: The hard upper limit of the timeout query argument
+        :param cache: A tornado_restless.cache.InstanceCache keeping the responses of get_single
+        :param collection_url: The url of the collection, used to render relations as urls
+        :param session: The session of the request (by the batch api), a new session of the manager in default
+        :param batch_transaction: The request is part of a transactional batch, which commits the session
 
         :reqheader X-HTTP-Method-Override: If allow_method_override is True, this header overwrites the request method
+        :reqheader X-Restless-Profile: Profile the request if it matches the token of the profiler
         """
 
         # Override Method if Header provided
@@ -93,7 +165,52 @@ class BaseHandler(RequestHandler):
 
         super(BaseHandler, self).initialize()
 
-        self.model = SessionedModelWrapper(model, manager.session_maker())
+        # Phase Timings
+        self.timings = OrderedDict()
+        self.timing_phases = set()
+        self.timing_start = perf_counter()
+        self.server_timing = server_timing
+        self.timing_callback = timing_callback
+
+        # Metrics
+        self.manager = manager
+        self.blueprint_name = blueprint_name or model.__tablename__
+        self.metrics = manager.metrics
+        self.num_rows = 0
+        self.response_bytes = 0
+        self.error_type = None
+        self.statements = StatementRecorder(keep=slow_request_threshold is not None)
+        self.debug_statements = debug_statements
+        self.statement_budget = statement_budget
+        self.slow_request_threshold = slow_request_threshold
+        self.filters = None
+        self.recording = (self.metrics is not None or debug_statements or statement_budget is not None or
+                          slow_request_threshold is not None)
+        self.statement_scoped = False
+        if self.metrics is not None:
+            self.metrics.start_request(self)
+
+        # Admission
+        self.admission = admission
+        self.lane = None
+        self.admission_waiting = None
+        self.cancelled = False
+
+        # Profiling
+        self.profiler = profiler
+        self.profile = profiler.start(self) if profiler is not None else None
+
+        # Session
+        self.group_commit = None
+        self.group_future = None
+        self.savepoint = None
+        if session is None and group_commit is not None and self.request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+            self.group_commit = group_commit
+        if session is None:
+            session = manager.session_maker()
+
+        self.model = SessionedModelWrapper(model, session)
+        self.batch_transaction = batch_transaction
         self.pk_length = len(sqinspect(model).primary_key)
         self.methods = [method.lower() for method in methods]
         self.allow_patch_many = allow_patch_many
@@ -108,19 +225,287 @@ class BaseHandler(RequestHandler):
         self.include = self.parse_columns(include_columns)
         self.exclude = self.parse_columns(exclude_columns)
 
-        self.to_dict_options = {'execute_queries': not exclude_queries, 'execute_hybrids': not exclude_hybrids}
-
+        self.to_dict_options = {'execute_queries': not exclude_queries, 'execute_hybrids': not exclude_hybrids,
+                                'relations': relation_policies or {}, 'url': collection_url,
+                                'references': reference_duplicates, 'id_separator': self.ID_SEPARATOR}
+        self.compound_documents = compound_documents
+        self.core_reads = core_reads
+        self.allow_export = allow_export
+        self.export_batch_size = export_batch_size
+        self.upsert = upsert
+        self.cache = cache
+
+        # Deadline
+        self.statement_timeout = statement_timeout
+        self.max_statement_timeout = max_statement_timeout
+        self.deadline = None
+
+    @gen.coroutine
     def prepare(self):
         """
             Prepare the request
+
+            With admission control the request waits for a slot first.
+            With a timeout the sql statements of the request are limited to its deadline (see get_timeout).
+
+            :statuscode 503: rejected by admission control (see Retry-After)
+            :resheader Retry-After: Seconds after which a rejected request should be retried
+        """
+        if self.admission is not None:
+            with self.timing('admission'):
+                self.lane = yield self.admission.acquire(self)
+
+        if self.statement_timeout is not None or self.max_statement_timeout is not None:
+            timeout = self.get_timeout()
+            if timeout is not None:
+                self.deadline = StatementDeadline(timeout, self.request.request_time())
+
+        with self.statement_scope():
+            self._call_preprocessor()
+
+    def get_timeout(self) -> float:
+        """
+            The timeout of the request in seconds, the query argument timeout capped by max_statement_timeout
+            (or statement_timeout) or the statement_timeout of the blueprint in default
+
+            :query timeout: Seconds since the arrival of the request its sql statements may take
+
+            :statuscode 400: invalid timeout
+        """
+        timeout = self.get_argument("timeout", self.get_query_argument("timeout", None))
+        if timeout is None:
+            return self.statement_timeout
+
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            raise IllegalArgumentError("Invalid timeout %s" % timeout)
+        if timeout <= 0:
+            raise IllegalArgumentError("Invalid timeout %s" % timeout)
+
+        limit = self.max_statement_timeout if self.max_statement_timeout is not None else self.statement_timeout
+        return min(timeout, limit) if limit is not None else timeout
+
+    def on_connection_close(self):
         """
-        self._call_preprocessor()
+            The client closed the connection, the outstanding work of the request is cancelled
+
+            A request waiting for admission leaves the queue, an export stops after the current batch.
+        """
+        self.cancelled = True
+        if self.admission_waiting is not None and not self.admission_waiting.done():
+            self.admission_waiting.set_exception(ClientDisconnectedError())
+        super().on_connection_close()
+
+    def is_disconnected(self) -> bool:
+        """
+            Test whether the client closed the connection
+
+            While the handler runs the IOLoop does not notice a closed connection, so the socket is peeked.
+        """
+        if self.cancelled:
+            return True
+
+        stream = getattr(self.request.connection, 'stream', None)
+        if stream is None:
+            return False
+        if stream.closed():
+            return True
+        try:
+            return stream.socket.recv(1, socket.MSG_PEEK) == b""
+        except (BlockingIOError, InterruptedError, ValueError):
+            return False
+        except OSError:
+            return True
+
+    def check_connection(self):
+        """
+            Cancel the request if the client closed the connection
+
+            :raise: ClientDisconnectedError
+        """
+        if self.is_disconnected():
+            self.cancelled = True
+            raise ClientDisconnectedError()
 
     def on_finish(self):
         """
             Finish the request
+
+            The writes of a failed request are rolled back, so the session does not keep its transaction open.
         """
-        self._call_postprocessor()
+        if self.savepoint is not None and self.savepoint.is_active:
+            self.rollback()
+        elif self.get_status() >= 400 and self.group_commit is None and not self.batch_transaction:
+            self.model.session.rollback()
+
+        if self.lane is not None:
+            self.admission.release(self.lane)
+            self.lane = None
+
+        with self.statement_scope():
+            self._call_postprocessor()
+
+        self.timings['total'] = perf_counter() - self.timing_start
+
+        if self.statement_budget is not None and self.statements.count > self.statement_budget:
+            self.logger.warning("%s %s %s executed %u sql statements (budget %u) in %.3fms%s" % (
+                self.blueprint_name, self.request.method, self.request.uri,
+                self.statements.count, self.statement_budget, self.statements.duration * 1000,
+                "".join("\n  %ux %s" % (count, shape) for shape, count in self.statements.repeated())))
+
+        if self.slow_request_threshold is not None and self.timings['total'] > self.slow_request_threshold:
+            self.log_slow_request()
+
+        if self.metrics is not None:
+            self.metrics.finish_request(self, self.timings['total'])
+
+        if self.timing_callback is not None:
+            self.timing_callback(handler=self, timings=self.timings)
+
+        if self.profile is not None:
+            # The request may be finished within a scope, the profile is stopped after it has been left
+            IOLoop.current().add_callback(self.profiler.stop, self, self.profile)
+            self.profile = None
+
+    def finish(self, chunk=None):
+        """
+            Finish the request, encoding chunk in the encode phase
+
+            :param chunk: Last data to be written (dropped for responses without a body like 204)
+
+            :resheader Server-Timing: The phase timings if server_timing is enabled for the blueprint
+            :resheader X-Restless-Statements: Summary of the sql statements if debug_statements is enabled
+        """
+        if self.group_future is not None and self.get_status() < 400:
+            return self.finish_group_commit(chunk)
+
+        # No body
+        if self.get_status() in (204, 304):
+            chunk = None
+
+        if chunk is not None and not self._finished:
+            with self.timing('encode'):
+                self.write(chunk)
+            chunk = None
+
+        if self.server_timing and not self._headers_written:
+            self.timings['total'] = perf_counter() - self.timing_start
+            self.set_header('Server-Timing', self.format_server_timing())
+
+        if self.debug_statements and not self._headers_written:
+            self.set_header('X-Restless-Statements', self.statements.format_header())
+
+        if not self._finished:
+            self.response_bytes += sum(len(part) for part in self._write_buffer)
+
+        return super().finish(chunk)
+
+    @gen.coroutine
+    def finish_group_commit(self, chunk=None):
+        """
+            Finish the request after the group commit of its writes
+
+            :param chunk: Last data to be written
+        """
+        future, self.group_future = self.group_future, None
+        with self.timing('commit'):
+            yield future
+        self.finish(chunk)
+
+    @contextmanager
+    def timing(self, phase: str):
+        """
+            Measure the time spent in a phase of the request
+
+            Repeated phases accumulate their timings, a phase nested in itself is only measured once.
+
+            :param phase: Name of the phase (parse, preprocessor, filter, count, fetch, to_dict, ...)
+        """
+        if phase in self.timing_phases:
+            yield
+            return
+
+        start = perf_counter()
+        previous, self.statements.phase = self.statements.phase, phase
+        self.timing_phases.add(phase)
+        try:
+            yield
+        finally:
+            self.timing_phases.discard(phase)
+            self.statements.phase = previous
+            self.timings[phase] = self.timings.get(phase, 0) + perf_counter() - start
+
+    @contextmanager
+    def statement_scope(self):
+        """
+            Attribute the sql statements executed in the scope to the request, limit them to its deadline
+            and profile the scope if the request is profiled
+
+            Coroutine requests interleave on one thread, so a scope must not span a yield.
+            The http methods, the preprocessor of prepare, the postprocessor of on_finish and
+            every batch of an export are executed in a scope (see scoped).
+        """
+        if self.statement_scoped:
+            yield
+            return
+
+        self.statement_scoped = True
+        if self.recording:
+            self.statements.activate()
+        if self.deadline is not None:
+            self.deadline.activate()
+        profile = self.profile
+        profiling = profile is not None and self.profiler.enable(profile)
+        try:
+            yield
+        finally:
+            if profiling:
+                self.profiler.disable(profile)
+            if self.deadline is not None:
+                self.deadline.deactivate()
+            if self.recording:
+                self.statements.deactivate()
+            self.statement_scoped = False
+
+    def log_slow_request(self):
+        """
+            Log a structured record of a slow request
+
+            The record contains the normalized q argument, the resolved filters, the statements of the
+            count and fetch queries with their bound parameters, the repeated statements of the other phases,
+            rows returned, response size and the phase timings.
+        """
+        q = self.get_argument("q", default=None)
+        try:
+            q = dumps(loads(q), sort_keys=True)
+        except (TypeError, ValueError):
+            pass
+
+        record = {'blueprint': self.blueprint_name,
+                  'method': self.request.method,
+                  'uri': self.request.uri,
+                  'status': self.get_status(),
+                  'duration': self.timings['total'],
+                  'q': q,
+                  'filters': [str(expression) for expression in self.filters or []],
+                  'queries': [{'phase': phase, 'statement': statement, 'parameters': parameters, 'duration': duration}
+                              for phase, statement, parameters, duration in self.statements.executed
+                              if phase in ('count', 'fetch')],
+                  'repeated': [{'statement': shape, 'count': count} for shape, count in self.statements.repeated()],
+                  'statements': self.statements.count,
+                  'rows': self.num_rows,
+                  'response_bytes': self.response_bytes,
+                  'timings': self.timings}
+
+        self.logger.warning("Slow request: %s" % dumps(record, default=str, sort_keys=True),
+                            extra={'restless': record})
+
+    def format_server_timing(self) -> str:
+        """
+            Format the phase timings as value of a Server-Timing header (durations in milliseconds)
+        """
+        return ", ".join("%s;dur=%.3f" % (phase, duration * 1000) for phase, duration in self.timings.items())
 
     def parse_columns(self, strings: list) -> dict:
         """
@@ -139,21 +524,23 @@ class BaseHandler(RequestHandler):
         for column in [column.split(".", 1) for column in strings]:
             if len(column) == 1:
                 columns[column[0]] = True
-            else:
+            elif columns.get(column[0]) is not True:
                 columns.setdefault(column[0], []).append(column[1])
 
         # Now parse relations
         for (key, item) in columns.items():
             if isinstance(item, list):
-                columns[key] = itertools.chain.from_iterable(self.parse_columns(strings) for strings in item)
+                columns[key] = self.parse_columns(item)
 
         # Return
         return columns
 
-    def get_filters(self):
+    def get_filters(self, model=None):
         """
             Returns a list of filters made by the query argument
 
+            :param model: The model the filters apply to (the model of the blueprint in default)
+
             :query filters: list of filters
             :query order_by: list of orderings
         """
@@ -164,7 +551,9 @@ class BaseHandler(RequestHandler):
         # Get all provided orders
         argument_orders = self.get_query_argument("order_by", [])
 
-        return to_filter(self.model.model, argument_filters, argument_orders)
+        with self.timing('filter'):
+            self.filters = to_filter(model or self.model.model, argument_filters, argument_orders)
+        return self.filters
 
     def write_error(self, status_code: int, **kwargs):
         """
@@ -180,21 +569,30 @@ class BaseHandler(RequestHandler):
         """
         if 'exc_info' in kwargs:
             exc_type, exc_value = kwargs['exc_info'][:2]
-            if status_code >= 300:
+            if status_code >= 300 and not issubclass(exc_type, (ServiceUnavailableError, ClientDisconnectedError)):
                 print_exception(*kwargs['exc_info'])
             if issubclass(exc_type, UnmappedInstanceError):
+                self.error_type = 'unmapped_instance'
                 self.set_status(400, reason='SQLAlchemy: Unmapped Instance')
                 self.finish(dict(type=exc_type.__module__ + "." + exc_type.__name__,
                                  message="%s" % exc_value))
+            elif issubclass(exc_type, SQLAlchemyError) and self.deadline is not None and is_timeout(exc_value):
+                self.error_type = 'timeout'
+                self.set_status(504, reason='Deadline exceeded')
+                self.finish(dict(type=exc_type.__module__ + "." + exc_type.__name__,
+                                 message="Deadline of %.3fs exceeded" % self.deadline.timeout))
             elif issubclass(exc_type, SQLAlchemyError):
                 if issubclass(exc_type, NoResultFound):
+                    self.error_type = 'no_result_found'
                     status = 404
                     reason = message = 'No result found'
                 elif issubclass(exc_type, MultipleResultsFound):
+                    self.error_type = 'multiple_results_found'
                     status = 400
                     reason = 'SQLAlchemy: Bad Request'
                     message = 'Multiple results found'
                 else:
+                    self.error_type = 'sqlalchemy'
                     status = 400
                     reason = 'SQLAlchemy: Bad Request'
                     message = "%s" % exc_value
@@ -202,23 +600,38 @@ class BaseHandler(RequestHandler):
                 self.finish(dict(type=exc_type.__module__ + "." + exc_type.__name__,
                                  message=message))
             elif issubclass(exc_type, IllegalArgumentError):
+                self.error_type = 'illegal_argument'
                 self.set_status(400, reason='Restless: Bad Arguments')
                 self.finish(dict(type=exc_type.__module__ + "." + exc_type.__name__,
                                  message="%s" % exc_value))
             elif issubclass(exc_type, ProcessingException):
+                self.error_type = 'processing'
                 self.set_status(status_code,
                                 reason='ProcessingException: %s' % (exc_value.reason or "Stopped Processing"))
                 self.finish(dict(type=exc_type.__module__ + "." + exc_type.__name__,
                                  message="%s" % exc_value))
+            elif issubclass(exc_type, ClientDisconnectedError):
+                self.error_type = 'disconnected'
+                self.finish()
+            elif issubclass(exc_type, ServiceUnavailableError):
+                self.error_type = 'unavailable'
+                self.set_status(status_code)
+                self.set_header('Retry-After', '%u' % exc_value.retry_after)
+                self.finish(dict(type=exc_type.__module__ + "." + exc_type.__name__,
+                                 message="%s" % exc_value.log_message))
             elif issubclass(exc_type, HTTPError) and exc_value.reason:
+                self.error_type = 'http'
                 self.set_status(status_code, reason=exc_value.reason)
                 self.finish(dict(type=exc_type.__module__ + "." + exc_type.__name__,
                                  message="%s" % exc_value, **exc_value.__dict__))
             else:
+                self.error_type = 'http' if issubclass(exc_type, HTTPError) else 'internal'
                 super().write_error(status_code, **kwargs)
         else:
+            self.error_type = 'http'
             super().write_error(status_code, **kwargs)
 
+    @scoped
     def patch(self, instance_id: str=None):
         """
             PATCH (update instance) request
@@ -233,6 +646,8 @@ class BaseHandler(RequestHandler):
         if not 'patch' in self.methods:
             raise MethodNotAllowedError(self.request.method)
 
+        self.begin_write()
+
         self._call_preprocessor(search_params=self.search_params)
 
         if instance_id is None:
@@ -243,8 +658,10 @@ class BaseHandler(RequestHandler):
         else:
             result = self.patch_single(self.parse_pk(instance_id))
 
+        if self._finished:
+            return
         self._call_postprocessor(result=result)
-        self.finish(result)
+        return self.finish(result)
 
     def patch_many(self) -> dict:
         """
@@ -283,7 +700,7 @@ class BaseHandler(RequestHandler):
             num = self.model.update(values, limit=limit, filters=filters)
 
         # Commit
-        self.model.session.commit()
+        self.commit()
 
         # Result
         self.set_status(201, "Patched")
@@ -296,48 +713,62 @@ class BaseHandler(RequestHandler):
             :param instance_id: query argument of request
             :type instance_id: list of primary keys
 
+            If the response contains only plain columns (see get_row_columns) and the values are plain columns,
+            the instance is updated by one statement without loading it (see SessionedModelWrapper.update_row).
+
             :statuscode 201: instance successfull modified
             :statuscode 404: Error
         """
         try:
-            with self.model.session.begin_nested():
-                values = self.get_argument_values()
-
-                # Call Preprocessor
-                self._call_preprocessor(instance_id=instance_id, data=values)
-
-                # Get Instance
-                instance = self.model.get(*instance_id)
-
-                # Set Values
-                for (key, value) in values.items():
-                    self.logger.debug("%r.%s => %s" % (instance, key, value))
-                    setattr(instance, key, value)
+            values = self.get_argument_values()
 
-                # Flush
-                try:
+            # Call Preprocessor
+            self._call_preprocessor(instance_id=instance_id, data=values)
+
+            # Plain columns only
+            result = None
+            columns = self.get_row_columns(self.model)
+            if columns is not None:
+                with self.timing('fetch'):
+                    row = self.model.update_row(values, columns, *instance_id)
+                if row is not None:
+                    invalidate_instance(self.model.model, self.model.get_identity(*instance_id), self.model.session)
+                    result = self.rows_to_dict([row], columns)[0]
+
+            if result is None:
+                with self.model.session.begin_nested():
+                    # Get Instance
+                    instance = self.model.get(*instance_id)
+
+                    # Set Values
+                    for (key, value) in values.items():
+                        self.logger.debug("%r.%s => %s" % (instance, key, value))
+                        setattr(instance, key, value)
+
+                    # Flush
                     self.model.session.flush()
-                except SQLAlchemyError as ex:
-                    logging.exception(ex)
-                    self.model.session.rollback()
-                    self.send_error(status_code=400, exc_info=sys.exc_info())
-                    return
 
-                # Refresh
-                self.model.session.refresh(instance)
+                    # Refresh
+                    self.model.session.refresh(instance)
 
-                # Set Status
-                self.set_status(201, "Patched")
+                    # To Dict
+                    result = self.to_dict(instance)
 
-                # To Dict
-                return self.to_dict(instance)
+            # Commit
+            self.commit()
         except SQLAlchemyError as ex:
             logging.exception(ex)
+            self.rollback()
             self.send_error(status_code=400, exc_info=sys.exc_info())
-        finally:
-            # Commit
-            self.model.session.commit()
+            return
+
+        # Set Status
+        self.set_status(201, "Patched")
+        self.num_rows = 1
 
+        return result
+
+    @scoped
     def delete(self, instance_id: str=None):
         """
             DELETE (delete instance) request
@@ -352,6 +783,8 @@ class BaseHandler(RequestHandler):
         if not 'delete' in self.methods:
             raise MethodNotAllowedError(self.request.method)
 
+        self.begin_write()
+
         # Call Preprocessor
         self._call_preprocessor(search_params=self.search_params)
 
@@ -363,8 +796,10 @@ class BaseHandler(RequestHandler):
         else:
             result = self.delete_single(self.parse_pk(instance_id))
 
+        if self._finished:
+            return
         self._call_postprocessor(result=result)
-        self.finish(result)
+        return self.finish(result)
 
     def delete_many(self) -> dict:
         """
@@ -392,13 +827,13 @@ class BaseHandler(RequestHandler):
         if self.get_query_argument("single", False):
             instance = self.model.one(filters=filters)
             self.model.session.delete(instance)
-            self.model.session.commit()
+            self.commit()
             num = 1
         else:
             num = self.model.delete(limit=limit, filters=filters)
 
         # Commit
-        self.model.session.commit()
+        self.commit()
 
         # Result
         self.set_status(200, "Removed")
@@ -406,28 +841,37 @@ class BaseHandler(RequestHandler):
 
     def delete_single(self, instance_id: list) -> dict:
         """
-            Get one instance
+            Delete one instance
+
+            Instances of models without relations the ORM has to take care of are deleted
+            by one statement without loading them (see SessionedModelWrapper.delete_row).
 
             :param instance_id: query argument of request
             :type instance_id: list of primary keys
 
             :statuscode 204: instance successfull removed
+            :statuscode 404: instance not found
         """
 
         # Call Preprocessor
         self._call_preprocessor(instance_id=instance_id)
 
-        # Get Instance
-        instance = self.model.get(*instance_id)
+        # Delete by primary key
+        if self.model.delete_row(*instance_id):
+            invalidate_instance(self.model.model, self.model.get_identity(*instance_id), self.model.session)
+        else:
+            # Get Instance
+            instance = self.model.get(*instance_id)
 
-        # Trigger deletion
-        self.model.session.delete(instance)
-        self.model.session.commit()
+            # Trigger deletion
+            self.model.session.delete(instance)
+        self.commit()
 
         # Status
         self.set_status(204, "Instance removed")
         return {}
 
+    @scoped
     def put(self, instance_id: str=None):
         """
             PUT (update instance) request
@@ -443,23 +887,124 @@ class BaseHandler(RequestHandler):
         if not 'put' in self.methods:
             raise MethodNotAllowedError(self.request.method)
 
+        self.begin_write()
+
         # Call Preprocessor
         self._call_preprocessor(search_params=self.search_params)
 
         if instance_id is None:
-            if self.allow_patch_many:
+            if self.upsert and isinstance(self.get_body_arguments(), list):
+                result = self.upsert_many()
+            elif self.allow_patch_many:
                 result = self.put_many()
             else:
                 raise MethodNotAllowedError(self.request.method, status_code=403)
+        elif self.upsert:
+            result = self.upsert_single(self.parse_pk(instance_id))
         else:
             result = self.put_single(self.parse_pk(instance_id))
 
+        if self._finished:
+            return
         self._call_postprocessor(result=result)
-        self.finish(result)
+        return self.finish(result)
 
     put_many = patch_many
     put_single = patch_single
 
+    def upsert_single(self, instance_id: list) -> dict:
+        """
+            Insert or update one instance (PUT of a blueprint with upsert)
+
+            The primary key of the url overrides the one of the body. Other than patch_single the instance is
+            not read before, it is written by one statement (see SessionedModelWrapper.upsert).
+
+            :param instance_id: query argument of request
+            :type instance_id: list of primary keys
+
+            :statuscode 201: instance successfull created or modified
+            :statuscode 400: Error
+        """
+        values = self.get_argument_values()
+
+        # Call Preprocessor
+        self._call_preprocessor(instance_id=instance_id, data=values)
+
+        # Primary Keys
+        mapper = sqinspect(self.model.model)
+        for column, value in zip(mapper.primary_key, instance_id):
+            values[mapper.get_property_by_column(column).key] = value
+
+        try:
+            # Upsert
+            instance, = self.model.upsert([values])
+            invalidate_instance(self.model.model, sqinspect(instance).identity, self.model.session)
+
+            # To Dict (before the commit expires the instance)
+            result = self.to_dict(instance)
+
+            # Commit
+            self.commit()
+        except SQLAlchemyError:
+            self.rollback()
+            self.send_error(status_code=400, exc_info=sys.exc_info())
+            return
+
+        # Set Status
+        self.set_status(201, "Upserted")
+        self.num_rows = 1
+
+        return result
+
+    def upsert_many(self) -> dict:
+        """
+            Insert or update many instances (PUT of a list to a blueprint with upsert)
+
+            Every item of the list contains its primary key, items with the same keys are written
+            by one statement (see SessionedModelWrapper.upsert).
+
+            :statuscode 201: instances successfull created or modified
+            :statuscode 400: Error
+        """
+        arguments = self.get_body_arguments()
+        if not all(isinstance(item, dict) for item in arguments):
+            raise IllegalArgumentError("Body is no list of instances")
+        values = [self.get_argument_values(item) for item in arguments]
+
+        # Call Preprocessor
+        self._call_preprocessor(data=values)
+
+        # Primary Keys
+        mapper = sqinspect(self.model.model)
+        for item in values:
+            for column in mapper.primary_key:
+                if mapper.get_property_by_column(column).key not in item:
+                    raise IllegalArgumentError("Missing primary key %s" % column.key)
+
+        try:
+            # Upsert
+            instances = self.model.upsert(values)
+            for instance in instances:
+                invalidate_instance(self.model.model, sqinspect(instance).identity, self.model.session)
+
+            # To Dict (before the commit expires the instances)
+            objects = self.to_dict(instances)
+
+            # Commit
+            self.commit()
+        except SQLAlchemyError:
+            self.rollback()
+            self.send_error(status_code=400, exc_info=sys.exc_info())
+            return
+
+        # Set Status
+        self.set_status(201, "Upserted")
+        self.num_rows = len(instances)
+
+        return {'num_results': len(instances),
+                'objects': objects}
+
+    @scoped
     def post(self, instance_id: str=None):
         """
             POST (new input) request
@@ -474,17 +1019,25 @@ class BaseHandler(RequestHandler):
         if not 'post' in self.methods:
             raise MethodNotAllowedError(self.request.method)
 
+        self.begin_write()
+
         # Call Preprocessor
         self._call_preprocessor(search_params=self.search_params)
 
         result = self.post_single()
 
+        if self._finished:
+            return
         self._call_postprocessor(result=result)
-        self.finish(result)
+        return self.finish(result)
 
     def post_single(self):
         """
             Post one instance
+
+            The instance is translated after the flush and before the commit, so it is not read again.
+            Only server generated columns (besides the primary key) are loaded by an extra statement,
+            unless the model sets eager_defaults to fetch them by RETURNING.
         """
 
         try:
@@ -497,22 +1050,22 @@ class BaseHandler(RequestHandler):
             instance = self.model(**values)
 
             # Flush
-            self.model.session.commit()
-
-            # Refresh
-            self.model.session.refresh(instance)
+            self.model.session.flush()
 
             # Set Status
             self.set_status(201, "Created")
+            self.num_rows = 1
 
             # To Dict
-            return self.to_dict(instance)
+            result = self.to_dict(instance)
+
+            # Commit
+            self.commit()
+
+            return result
         except SQLAlchemyError:
+            self.rollback()
             self.send_error(status_code=400, exc_info=sys.exc_info())
-            self.model.session.rollback()
-        finally:
-            # Commit
-            self.model.session.commit()
 
     @memoized_instancemethod
     def get_content_encoding(self) -> str:
@@ -541,20 +1094,21 @@ class BaseHandler(RequestHandler):
         self.logger.debug(self.request.body)
 
         content_type = self.request.headers.get('Content-Type')
-        if 'www-form-urlencoded' in content_type:
-            payload = self.request.arguments
-            for key, value in payload.items():
-                if len(value) == 0:
-                    payload[key] = None
-                elif len(value) == 1:
-                    payload[key] = str(value[0], encoding=self.get_content_encoding())
-                else:
-                    payload[key] = [str(value, encoding=self.get_content_encoding()) for value in value]
-            return payload
-        elif 'application/json' in content_type:
-            return loads(str(self.request.body, encoding=self.get_content_encoding()))
-        else:
-            raise HTTPError(415, content_type=content_type)
+        with self.timing('parse'):
+            if 'www-form-urlencoded' in content_type:
+                payload = self.request.arguments
+                for key, value in payload.items():
+                    if len(value) == 0:
+                        payload[key] = None
+                    elif len(value) == 1:
+                        payload[key] = str(value[0], encoding=self.get_content_encoding())
+                    else:
+                        payload[key] = [str(value, encoding=self.get_content_encoding()) for value in value]
+                return payload
+            elif 'application/json' in content_type:
+                return loads(str(self.request.body, encoding=self.get_content_encoding()))
+            else:
+                raise HTTPError(415, content_type=content_type)
 
     def get_body_argument(self, name: str, default=RequestHandler._ARG_DEFAULT):
         """
@@ -582,7 +1136,8 @@ class BaseHandler(RequestHandler):
         try:
             return self._search_params
         except AttributeError:
-            self._search_params = loads(self.get_argument("q", default="{}"))
+            with self.timing('parse'):
+                self._search_params = loads(self.get_argument("q", default="{}"))
             return self._search_params
 
     def get_query_argument(self, name: str, default=RequestHandler._ARG_DEFAULT):
@@ -620,15 +1175,19 @@ class BaseHandler(RequestHandler):
             else:
                 raise
 
-    def get_argument_values(self):
+    def get_argument_values(self, arguments: dict=None):
         """
             Get all values provided via arguments
 
+            :param arguments: Dictionary of arguments (e.g. an item of a list body), the body arguments in default
+
             :query q: (ignored)
         """
 
         # Include Columns
-        if self.include is not None:
+        if arguments is not None:
+            values = {k: v for k, v in arguments.items() if self.include is None or k in self.include}
+        elif self.include is not None:
             values = {k: self.get_body_argument(k) for k in self.include}
         else:
             values = {k: v for k, v in self.get_body_arguments().items()}
@@ -669,6 +1228,7 @@ class BaseHandler(RequestHandler):
 
         return values
 
+    @scoped
     def get(self, instance_id: str=None):
         """
             GET request
@@ -687,16 +1247,130 @@ class BaseHandler(RequestHandler):
 
         if instance_id is None:
             result = self.get_many()
+        elif self.allow_export and instance_id.rstrip('/') == self.EXPORT:
+            return self.get_export()
         else:
-            result = self.get_single(self.parse_pk(instance_id))
+            instance_id, _, relation = instance_id.rstrip('/').partition('/')
+            if relation:
+                result = self.get_related(self.parse_pk(instance_id), relation)
+            else:
+                result = self.get_single(self.parse_pk(instance_id))
 
         self._call_postprocessor(result=result)
         self.finish(result)
 
+    @gen.coroutine
+    def get_export(self):
+        """
+            Stream all instances as NDJSON (one json object per line) or CSV
+
+            The instances are filtered and ordered like in get_many, but neither counted nor paginated.
+            They are read with a server side cursor and written in batches of export_batch_size
+            with chunked transfer encoding, so memory stays flat regardless of the number of instances.
+
+            In CSV relations and other nested values are written as JSON strings.
+            If the export fails after the first batch has been sent, the connection is closed without the
+            terminating chunk (see abort), so clients notice the truncated body.
+            The export stops when the client disconnects, which is checked before every batch.
+
+            :statuscode 400: if the format is unknown
+
+            :query format: ndjson (default) or csv
+        """
+
+        export_format = self.get_argument("format", self.get_query_argument("format", "ndjson"))
+        if export_format not in ('ndjson', 'csv'):
+            raise IllegalArgumentError("Unknown export format %s" % export_format)
+
+        # Filters
+        filters = self.get_filters()
+
+        # Call Preprocessor
+        self._call_preprocessor(filters=filters)
+
+        if export_format == 'csv':
+            self.set_header('Content-Type', 'text/csv; charset=UTF-8')
+        else:
+            self.set_header('Content-Type', 'application/x-ndjson; charset=UTF-8')
+        self.set_header('Content-Disposition', 'attachment; filename="%s.%s"' % (self.blueprint_name, export_format))
+
+        columns = self.get_row_columns(self.model)
+        fieldnames = None
+        stream = self.model.stream(filters=filters, batch_size=self.export_batch_size, columns=columns)
+        try:
+            while True:
+                if self.is_disconnected():
+                    self.cancelled = True
+                    self.error_type = 'disconnected'
+                    break
+
+                with self.statement_scope():
+                    batch = next(stream, None)
+                    if batch is None:
+                        break
+
+                    self.num_rows += len(batch)
+                    objects = self.rows_to_dict(batch, columns) if columns is not None else self.to_dict(batch)
+
+                with self.timing('encode'):
+                    if export_format == 'csv':
+                        output = StringIO()
+                        writer = csv.DictWriter(output, fieldnames or columns or list(objects[0].keys()),
+                                                extrasaction='ignore')
+                        if fieldnames is None:
+                            fieldnames = writer.fieldnames
+                            writer.writeheader()
+                        writer.writerows({key: dumps(value) if isinstance(value, (dict, list)) else value
+                                          for key, value in item.items()} for item in objects)
+                        chunk = output.getvalue()
+                    else:
+                        chunk = "".join(dumps(item) + "\n" for item in objects)
+                    self.write(chunk)
+                    self.response_bytes += sum(len(part) for part in self._write_buffer)
+
+                try:
+                    yield self.flush()
+                except StreamClosedError:
+                    self.cancelled = True
+        except Exception:
+            if not self._headers_written:
+                raise
+            self.abort(sys.exc_info())
+            return
+        finally:
+            stream.close()
+
+        self.finish()
+
+    def abort(self, exc_info):
+        """
+            Abort a response whose headers have already been sent
+
+            An error response is not possible anymore, so the error is logged and the connection is closed
+            before the response is finished (e.g. without the terminating chunk of chunked transfer encoding).
+
+            :param exc_info: The exception that aborted the response
+        """
+        self.logger.error("Aborted %s %s after %u bytes" % (self.request.method, self.request.uri,
+                                                           self.response_bytes), exc_info=exc_info)
+        if issubclass(exc_info[0], SQLAlchemyError) and self.deadline is not None and is_timeout(exc_info[1]):
+            self.error_type = 'timeout'
+            self.set_status(504)
+        else:
+            self.error_type = 'internal'
+            self.set_status(500)
+
+        close = getattr(self.request.connection, 'close', None)
+        if close is not None:
+            close()
+        self.finish()
+
     def get_single(self, instance_id: list) -> dict:
         """
             Get one instance
 
+            With a cache the response is kept by primary key until the instance changes (see InstanceCache).
+
             :param instance_id: query argument of request
             :type instance_id: list of primary keys
         """
@@ -704,11 +1378,32 @@ class BaseHandler(RequestHandler):
         # Call Preprocessor
         self._call_preprocessor(instance_id=instance_id)
 
-        # Get Instance
-        instance = self.model.get(*instance_id)
+        # Cached
+        if self.cache is not None:
+            identity = self.model.get_identity(*instance_id)
+            cached = self.cache.get(identity, self.blueprint_name)
+            if cached is not None:
+                self.num_rows = 1
+                return loads(cached)
+
+        # Plain columns only
+        columns = self.get_row_columns(self.model)
+        if columns is not None:
+            with self.timing('fetch'):
+                row = self.model.get_row(columns, *instance_id)
+            result = self.rows_to_dict([row], columns)[0]
+        else:
+            # Get Instance
+            with self.timing('fetch'):
+                instance = self.model.get(*instance_id)
+
+            # To Dict
+            result = self.to_dict(instance)
+        self.num_rows = 1
 
-        # To Dict
-        return self.to_dict(instance)
+        if self.cache is not None:
+            self.cache.set(identity, self.blueprint_name, dumps(result))
+        return result
 
     def get_many(self) -> dict:
         """
@@ -726,6 +1421,70 @@ class BaseHandler(RequestHandler):
             :query single: If true sqlalchemy will raise an error if zero or more than one instances would be deleted
         """
 
+        # All search params
+        search_params = self.get_search_params()
+
+        # Filters
+        filters = self.get_filters()
+
+        # Call Preprocessor
+        self._call_preprocessor(filters=filters, search_params=search_params)
+
+        return self.query_many(self.model, filters, search_params)
+
+    def get_related(self, instance_id: list, relation: str) -> dict:
+        """
+            Get the instances of a relation of one instance
+
+            The related instances are queried, filtered and paginated like in get_many,
+            restricted to the instances related to instance_id.
+
+            :param instance_id: query argument of request
+            :type instance_id: list of primary keys
+            :param relation: Name of the relation
+
+            :statuscode 404: if the instance or the relation does not exist or is not included
+        """
+
+        if relation not in self.model.relations:
+            raise HTTPError(404)
+        if self.include is not None and relation not in self.include:
+            raise HTTPError(404)
+        if self.exclude is not None and self.exclude.get(relation) is True:
+            raise HTTPError(404)
+
+        # Get Parent
+        with self.timing('fetch'):
+            instance = self.model.get(*instance_id)
+        related = self.model.related(instance, relation)
+
+        # Scalar relations
+        if not related.uselist:
+            self._call_preprocessor(instance_id=instance_id, relation=relation, filters=[], search_params={})
+            with self.timing('fetch'):
+                instance = related.one()
+            self.num_rows = 1
+            return self.to_dict(instance, relation=relation)
+
+        # All search params
+        search_params = self.get_search_params()
+
+        # Filters
+        filters = self.get_filters(related.model)
+
+        # Call Preprocessor
+        self._call_preprocessor(instance_id=instance_id, relation=relation,
+                                filters=filters, search_params=search_params)
+
+        return self.query_many(related, filters, search_params, relation=relation)
+
+    def get_search_params(self) -> dict:
+        """
+            Returns the pagination arguments of get_many (single, results_per_page, offset, page, limit, compound)
+
+            :statuscode 400: if results_per_page > max_results_per_page or offset < 0
+        """
+
         # All search params
         search_params = {'single': self.get_query_argument("single", False),
                          'results_per_page': int(self.get_argument("results_per_page", self.results_per_page)),
@@ -736,22 +1495,34 @@ class BaseHandler(RequestHandler):
             raise IllegalArgumentError("request.results_per_page > application.max_results_per_page")
 
         # Offset & Page
-        page = int(self.get_argument("page", '1')) - 1
-        search_params['offset'] += page * search_params['results_per_page']
+        search_params['page'] = int(self.get_argument("page", '1')) - 1
+        search_params['offset'] += search_params['page'] * search_params['results_per_page']
         if search_params['offset'] < 0:
             raise IllegalArgumentError("request.offset < 0")
 
         # Limit
         search_params['limit'] = self.get_query_argument("limit", search_params['results_per_page'] or None)
 
-        # Filters
-        filters = self.get_filters()
+        # Compound Documents
+        compound = self.get_argument("compound", self.get_query_argument("compound", self.compound_documents))
+        search_params['compound'] = compound in (True, 1, 'true', '1')
 
-        # Call Preprocessor
-        self._call_preprocessor(filters=filters, search_params=search_params)
+        return search_params
+
+    def query_many(self, model: SessionedModelWrapper, filters: list, search_params: dict, relation: str=None):
+        """
+            Count and fetch the instances of model for get_many
+
+            :param model: The (related) model wrapper
+            :param filters: Filters and OrderBy Clauses
+            :param search_params: The search params returned by get_search_params
+            :param relation: The instances are those of this relation (see get_columns)
+        """
 
         # Num Results
-        num_results = self.model.count(filters=filters)
+        with self.timing('count'):
+            num_results = model.count(filters=filters)
+        self.check_connection()
         if search_params['results_per_page']:
             total_pages = ceil(num_results / search_params['results_per_page'])
         else:
@@ -759,17 +1530,245 @@ class BaseHandler(RequestHandler):
 
         # Get Instances
         if search_params['single']:
-            instance = self.model.one(offset=search_params['offset'],
-                                      filters=filters)
-            return self.to_dict(instance)
+            with self.timing('fetch'):
+                instance = model.one(offset=search_params['offset'],
+                                     filters=filters)
+            self.num_rows = 1
+            return self.to_dict(instance, relation=relation)
+        elif search_params['compound']:
+            relations = self.get_compound_relations(model, relation)
+            with self.timing('fetch'):
+                instances = model.all(offset=search_params['offset'],
+                                      limit=search_params['limit'],
+                                      filters=filters,
+                                      options=[selectinload(getattr(model.model, key)) for key in relations])
+            self.num_rows = len(instances)
+            self.check_connection()
+            return {'num_results': num_results,
+                    "total_pages": total_pages,
+                    "page": search_params['page'] + 1,
+                    "objects": self.to_dict(instances, relation=relation, compound=True),
+                    "included": self.to_included(instances, relations, relation)}
         else:
-            instances = self.model.all(offset=search_params['offset'],
-                                       limit=search_params['limit'],
-                                       filters=filters)
+            # Plain columns only
+            columns = self.get_row_columns(model, relation)
+            if columns is not None:
+                with self.timing('fetch'):
+                    rows = model.rows(columns,
+                                      offset=search_params['offset'],
+                                      limit=search_params['limit'],
+                                      filters=filters)
+                self.num_rows = len(rows)
+                self.check_connection()
+                objects = self.rows_to_dict(rows, columns, model)
+            else:
+                with self.timing('fetch'):
+                    instances = model.all(offset=search_params['offset'],
+                                          limit=search_params['limit'],
+                                          filters=filters)
+                self.num_rows = len(instances)
+                self.check_connection()
+                objects = self.to_dict(instances, relation=relation)
             return {'num_results': num_results,
                     "total_pages": total_pages,
-                    "page": page + 1,
-                    "objects": self.to_dict(instances)}
+                    "page": search_params['page'] + 1,
+                    "objects": objects}
+
+    def get_columns(self, relation: str=None) -> tuple:
+        """
+            Returns include and exclude of the instances of the blueprint or of one of its relations
+
+            :param relation: Name of the relation, the columns of the blueprint nested below it apply
+        """
+        if relation is None:
+            return self.include, self.exclude
+
+        columns = to_deep(self.include, self.exclude, relation)
+        include = columns['include'] if self.include is not None else None
+        return None if include is True else include, columns['exclude']
+
+    def get_row_columns(self, model: SessionedModelWrapper, relation: str=None) -> list:
+        """
+            Returns the columns of the response if it contains only plain columns of model, otherwise None
+
+            Then rows of these columns are read instead of instances (see SessionedModelWrapper.rows).
+            Polymorphic models are always read as instances, as their rows may be of subclasses with other columns.
+
+            :param model: The (related) model wrapper
+            :param relation: The instances are those of this relation (see get_columns)
+        """
+        if not self.core_reads:
+            return None
+
+        mapper = sqinspect(model.model)
+        if mapper.polymorphic_map or mapper.with_polymorphic or len(mapper.self_and_descendants) > 1:
+            return None
+        columns, hybrids, relations, attributes = ModelWrapper.get_mapper_attributes(mapper)
+        include, exclude = self.get_columns(relation)
+
+        if include is not None:
+            if any(value is not True for value in include.values()):
+                return None
+            keys = list(include)
+        else:
+            keys = []
+            for key in attributes:
+                if key not in keys and (exclude is None or key not in exclude):
+                    keys.append(key)
+
+        if any(key not in columns for key in keys):
+            return None
+        if not self.to_dict_options['execute_queries'] and any(mapper.attrs[key].deferred for key in keys):
+            return None
+        return keys
+
+    def rows_to_dict(self, rows: list, columns: list, model: SessionedModelWrapper=None) -> list:
+        """
+            Wrapper to convert.rows_to_dict, the counterpart of to_dict for rows
+
+            :param rows: The rows
+            :param columns: Names of the column attributes in the order of the rows
+            :param model: The (related) model wrapper, the model of the blueprint in default
+        """
+        with self.timing('to_dict'):
+            mapper = sqinspect((model or self.model).model)
+            return rows_to_dict(rows, columns, get_converters(mapper, columns))
+
+    def get_compound_relations(self, model: SessionedModelWrapper, relation: str=None) -> list:
+        """
+            Returns the relations of model that are side loaded in compound documents
+
+            Dynamic relations can not be loaded in advance and are rendered as urls.
+            Relations not included or excluded by the columns of the blueprint are not side loaded.
+
+            :param model: The (related) model wrapper
+            :param relation: The instances are those of this relation (see get_columns)
+        """
+        include, exclude = self.get_columns(relation)
+        if include is False:
+            return []
+
+        relations = []
+        for key, prop in sorted(model.relations.items()):
+            if getattr(prop, 'property', prop).lazy == 'dynamic':
+                continue
+            if include is not None and key not in include:
+                continue
+            if exclude is not None and exclude.get(key) is True:
+                continue
+            relations.append(key)
+        return relations
+
+    def get_included_columns(self, key: str, mapper, relation: str=None) -> tuple:
+        """
+            Returns include and exclude of the side loaded instances of relation key in compound documents
+
+            Side loaded instances are rendered without their relations,
+            unless the columns of the blueprint nested below key include them.
+
+            :param key: Name of the side loaded relation
+            :param mapper: The mapper of the side loaded instances
+            :param relation: The instances are those of this relation (see get_columns)
+        """
+        include, exclude = self.get_columns(relation)
+        columns = to_deep(include, exclude, key)
+        if include is not None and isinstance(columns['include'], dict):
+            return columns['include'], None
+        if exclude is not None and columns['exclude'] is not None:
+            return None, dict(columns['exclude'], **{name: True for name in mapper.relationships.keys()})
+        return False, None
+
+    def get_collection_name(self, mapper) -> str:
+        """
+            Returns the collection name of the blueprint of a related model
+
+            The first blueprint of the model with the url prefix of this blueprint is used,
+            models without such a blueprint are named by their table.
+
+            :param mapper: The mapper of the related model
+        """
+        url = self.to_dict_options['url']
+        url_prefix = url.rsplit('/', 1)[0] if url is not None else None
+        for (prefix, collection_name), blueprint in self.manager.blueprints.items():
+            if prefix == url_prefix and blueprint.kwargs.get('model') is mapper.class_:
+                return collection_name
+        return mapper.local_table.name
+
+    def to_included(self, instances: list, relations: list, relation: str=None) -> dict:
+        """
+            Translates the related instances of instances to the included dictionary of a compound document
+
+            The related instances are translated once each, as dictionary of collection to primary key to instance.
+            The collections are named by the blueprints of the related models (see get_collection_name).
+
+            :param instances: The instances of the page (with the relations loaded)
+            :param relations: The names of the relations
+            :param relation: The instances are those of this relation (see get_columns)
+        """
+        included = {}
+        memo = DictMemo()
+        with self.timing('to_dict'):
+            for key in relations:
+                columns = None
+                for instance in instances:
+                    nodes = getattr(instance, key)
+                    if nodes is None:
+                        continue
+                    if not isinstance(nodes, (list, set, tuple)):
+                        nodes = [nodes]
+                    for node in nodes:
+                        state = sqinspect(node)
+                        if columns is None:
+                            columns = self.get_included_columns(key, state.mapper, relation)
+                        collection = included.setdefault(self.get_collection_name(state.mapper), {})
+                        identity = self.ID_SEPARATOR.join(str(value) for value in state.identity)
+                        if identity not in collection:
+                            collection[identity] = to_dict(node, include=columns[0], exclude=columns[1], memo=memo)
+        return included
+
+    def begin_write(self):
+        """
+            Begin the writes of the request
+
+            Within a group commit the request works in a savepoint of the session of the current group.
+            It is opened by the http method after the request has been admitted and joins the group in commit
+            without a yield in between, so the group is not committed while the savepoint is open.
+        """
+        if self.group_commit is not None and self.savepoint is None:
+            self.model = SessionedModelWrapper(self.model.model, self.group_commit.session())
+            self.savepoint = self.model.session.begin_nested()
+
+    def commit(self):
+        """
+            Commit the session of the request
+
+            Within a transactional batch the session is only flushed, the batch commits it at its end.
+            Within a group commit the savepoint of the request is released and the request joins the group.
+        """
+        if self.group_commit is not None:
+            self.model.session.flush()
+            if self.savepoint is not None:
+                self.savepoint.commit()
+                self.savepoint = None
+                self.group_future = self.group_commit.join()
+        elif self.batch_transaction:
+            self.model.session.flush()
+        else:
+            self.model.session.commit()
+
+    def rollback(self):
+        """
+            Rollback the session of the request
+
+            Within a group commit only the savepoint of the request is rolled back.
+        """
+        if self.group_commit is not None:
+            if self.savepoint is not None:
+                self.savepoint.rollback()
+                self.savepoint = None
+                self.group_commit.leave()
+        else:
+            self.model.session.rollback()
 
     def _call_preprocessor(self, *args, **kwargs):
         """
@@ -778,8 +1777,9 @@ class BaseHandler(RequestHandler):
         func_name = inspect.stack()[1][3]
 
         if func_name in self.preprocessor:
-            for func in self.preprocessor[func_name]:
-                func(*args, model=self.model, handler=self, **kwargs)
+            with self.timing('preprocessor'):
+                for func in self.preprocessor[func_name]:
+                    func(*args, model=self.model, handler=self, **kwargs)
 
     def _call_postprocessor(self, *args, **kwargs):
         """
@@ -788,8 +1788,9 @@ class BaseHandler(RequestHandler):
         func_name = inspect.stack()[1][3]
 
         if func_name in self.postprocessor:
-            for func in self.postprocessor[func_name]:
-                func(*args, model=self.model, handler=self, **kwargs)
+            with self.timing('postprocessor'):
+                for func in self.postprocessor[func_name]:
+                    func(*args, model=self.model, handler=self, **kwargs)
 
     @memoized_property
     def logger(self):
@@ -798,16 +1799,56 @@ class BaseHandler(RequestHandler):
         """
         return logging.getLogger('tornado.restless')
 
-    def to_dict(self, instance):
+    def to_dict(self, instance, relation: str=None, compound: bool=False):
         """
             Wrapper to convert.to_dict with arguments from blueprint init
 
             :param instance: Instance to be translated
+            :param relation: Instance is of the target model of this relation (see get_columns)
+            :param compound: Render the relations by their primary keys (see to_included)
         """
-        return to_dict(instance,
-                       include=self.include,
-                       exclude=self.exclude,
-                       options=self.to_dict_options)
+        options = self.to_dict_options
+        if relation is not None:
+            options = dict(options, url=None)
+        if compound:
+            relations = {key: dict(policy, render='id') for key, policy in options['relations'].items()}
+            relations.setdefault('*', {'render': 'id'})
+            for key, prop in self.model.relations.items() if relation is None else ():
+                if getattr(prop, 'property', prop).lazy == 'dynamic':
+                    relations[key] = {'render': 'url'}
+            options = dict(options, relations=relations)
+
+        include, exclude = self.get_columns(relation)
+        with self.timing('to_dict'):
+            return to_dict(instance,
+                           include=include,
+                           exclude=exclude,
+                           options=options)
 
     def parse_pk(self, instance_id):
         return instance_id.split(self.ID_SEPARATOR, self.pk_length - 1)
+
+
+class DispatchHandler(RequestHandler):
+    """
+        Single route for all blueprints below an url prefix
+
+        Looks up the collection of the request path in a dictionary and creates the handler of that blueprint,
+        so the routing costs stay the same regardless how many models are exposed.
+        Unknown collections are answered with :http:statuscode:`404`.
+    """
+
+    # noinspection PyMethodOverriding
+    def __new__(cls, application, request, blueprints: dict, url_prefix: str, **kwargs):
+        """
+            Create the handler of the blueprint of the requested collection
+
+            :param blueprints: Dictionary of collection name to (handler_class, kwargs)
+            :param url_prefix: The url prefix of the blueprints
+        """
+        collection = url_unescape(request.path[len(url_prefix) + 1:].split('/', 1)[0])
+        try:
+            handler_class, handler_kwargs = blueprints[collection]
+        except KeyError:
+            return ErrorHandler(application, request, status_code=404)
+        return handler_class(application, request, **handler_kwargs)
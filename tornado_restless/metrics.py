@@ -0,0 +1,285 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless Metrics
+
+    A small registry of counters, gauges and histograms that is exposed in the prometheus text format
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+
+from tornado.web import RequestHandler
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 14:10'
+
+
+def _escape(value) -> str:
+    """
+        Escape a label value for the text exposition format
+    """
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels) -> str:
+    """
+        Format a sequence of (name, value) pairs as {name="value",...}
+    """
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels)
+
+
+def _format_value(value) -> str:
+    """
+        Format a sample value (integers without fraction)
+    """
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer()):
+        return '%d' % value
+    return repr(float(value))
+
+
+class Metric(object):
+    """
+        Base class of all metrics, stores one value per combination of label values
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        """
+            Create a metric
+
+            :param name: The metric name
+            :param documentation: The help text
+            :param labelnames: Names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = Lock()
+
+    def key(self, labels: dict) -> tuple:
+        """
+            Build the storage key of the label values
+
+            :raise ValueError: If labels do not match labelnames
+        """
+        if len(labels) != len(self.labelnames):
+            raise ValueError("Metric %s expects labels %s" % (self.name, self.labelnames))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+            Yields (suffix, labels, value) of all samples
+        """
+        for key, value in sorted(self.values.items()):
+            yield '', tuple(zip(self.labelnames, key)), value
+
+    def render(self) -> list:
+        """
+            Render the metric in the prometheus text format
+        """
+        lines = ['# HELP %s %s' % (self.name, self.documentation.replace('\\', r'\\').replace('\n', r'\n')),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        with self.lock:
+            for suffix, labels, value in self.samples():
+                lines.append('%s%s%s %s' % (self.name, suffix, _format_labels(labels), _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    """
+        A monotonic increasing value
+    """
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+        A value that may go up and down
+    """
+
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """
+        Counts observations in cumulative buckets
+    """
+
+    type = 'histogram'
+
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+            Create a histogram
+
+            :param buckets: The upper bounds of the buckets, +Inf is always appended
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            try:
+                counts, total = self.values[key]
+            except KeyError:
+                counts, total = [0] * (len(self.buckets) + 1), 0
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        for key, (counts, total) in sorted(self.values.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', labels + (('le', _format_value(bound)),), cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+class MetricsRegistry(object):
+    """
+        A collection of metrics
+    """
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def register(self, metric: Metric) -> Metric:
+        """
+            Register a metric, metrics with the same name are returned instead
+
+            :raise ValueError: If a metric with the same name but another type exists
+        """
+        existing = self.metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric):
+            raise ValueError("Metric %s is already registered as %s" % (metric.name, existing.type))
+        return existing
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+            Render all metrics in the prometheus text format
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ApiMetrics(MetricsRegistry):
+    """
+        The metrics collected by the blueprints of an ApiManager
+    """
+
+    SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+    STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+    def __init__(self, prefix: str='restless'):
+        super().__init__()
+        self.requests = self.counter(prefix + '_requests_total',
+                                     'Finished requests',
+                                     ('blueprint', 'method', 'status'))
+        self.duration = self.histogram(prefix + '_request_duration_seconds',
+                                       'Time spent processing requests',
+                                       ('blueprint', 'method'))
+        self.in_flight = self.gauge(prefix + '_requests_in_flight',
+                                    'Requests currently processed',
+                                    ('blueprint', ))
+        self.rows = self.counter(prefix + '_rows_returned_total',
+                                 'Instances returned in responses',
+                                 ('blueprint', 'method'))
+        self.response_bytes = self.histogram(prefix + '_response_bytes',
+                                             'Size of response bodies',
+                                             ('blueprint', 'method'),
+                                             self.SIZE_BUCKETS)
+        self.statements = self.histogram(prefix + '_sql_statements',
+                                         'SQL statements executed per request',
+                                         ('blueprint', 'method'),
+                                         self.STATEMENT_BUCKETS)
+        self.errors = self.counter(prefix + '_errors_total',
+                                   'Errors by type',
+                                   ('blueprint', 'method', 'type'))
+        self.admission_wait = self.histogram(prefix + '_admission_wait_seconds',
+                                             'Time requests waited for admission',
+                                             ('blueprint', 'lane'))
+        self.admission_queued = self.gauge(prefix + '_admission_queued',
+                                           'Requests waiting for admission',
+                                           ('lane', ))
+        self.admission_rejected = self.counter(prefix + '_admission_rejected_total',
+                                               'Requests rejected by admission control',
+                                               ('blueprint', 'lane', 'reason'))
+
+    def start_request(self, handler):
+        """
+            Called when a handler starts processing a request
+        """
+        self.in_flight.inc(blueprint=handler.blueprint_name)
+
+    def finish_request(self, handler, duration: float):
+        """
+            Called when a handler finished a request
+
+            :param handler: The finished BaseHandler
+            :param duration: Seconds spent for the request
+        """
+        blueprint, method = handler.blueprint_name, handler.request.method
+
+        self.in_flight.dec(blueprint=blueprint)
+        self.requests.inc(blueprint=blueprint, method=method, status=handler.get_status())
+        self.duration.observe(duration, blueprint=blueprint, method=method)
+        self.rows.inc(handler.num_rows, blueprint=blueprint, method=method)
+        self.response_bytes.observe(handler.response_bytes, blueprint=blueprint, method=method)
+        self.statements.observe(handler.statements.count, blueprint=blueprint, method=method)
+        if handler.error_type is not None:
+            self.errors.inc(blueprint=blueprint, method=method, type=handler.error_type)
+
+
+class MetricsHandler(RequestHandler):
+    """
+        Serves a MetricsRegistry in the prometheus text format
+    """
+
+    # noinspection PyMethodOverriding
+    def initialize(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.finish(self.registry.render())
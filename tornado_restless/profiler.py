@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Tornado Restless Profiler
+
+    Profiles a sampled fraction of requests (or requests carrying a debug header) and writes
+    the results per blueprint to a local directory.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import cProfile
+from hmac import compare_digest
+import os
+import pstats
+import random
+import sys
+from threading import Lock, Thread, Event, get_ident
+from time import time
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 17:05'
+
+
+class StackSampler(object):
+    """
+        Samples the stack of a thread in a background thread
+
+        The samples are counted as collapsed stacks (frame;frame;frame), ready for flame graph tools.
+        Only samples taken while the sampler is enabled are counted, like the calls of a cProfile.Profile.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.enabled = False
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, name='restless-stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def stop(self) -> Counter:
+        self.enabled = False
+        self.stopped.set()
+        self.thread.join()
+        return self.stacks
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.enabled:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append('%s:%s' % (frame.f_code.co_filename, frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+class RequestProfiler(object):
+    """
+        Profiles requests of the blueprints it is passed to (create_api_blueprint(profiler=...))
+
+        The mode 'cprofile' uses cProfile and writes pstats files, the mode 'sample' samples the stack
+        every interval seconds and writes collapsed stacks (.stacks), which costs less but only sees
+        where time is spent, not how often functions are called.
+
+        With aggregate the results of all requests of a blueprint are merged into <blueprint>.pstats
+        or <blueprint>.stacks, otherwise every request gets its own file.
+
+        Coroutine requests interleave on one thread, so a profile is only enabled while its request executes
+        without yielding (see BaseHandler.statement_scope). The profiles are merged and written by a
+        background thread after the request, call flush to wait for them.
+    """
+
+    HEADER = 'X-Restless-Profile'
+
+    def __init__(self,
+                 directory: str,
+                 sample_rate: float=0.0,
+                 token: str=None,
+                 mode: str='cprofile',
+                 aggregate: bool=True,
+                 interval: float=0.001):
+        """
+            Create a profiler
+
+            :param directory: Directory the profiles are written to
+            :param sample_rate: Fraction of requests that gets profiled (0.0 ... 1.0)
+            :param token: Requests with a X-Restless-Profile header equal to token are always profiled
+            :param mode: 'cprofile' or 'sample'
+            :param aggregate: Merge the profiles of a blueprint into one file
+            :param interval: Seconds between two samples in the sample mode
+        """
+        if mode not in ('cprofile', 'sample'):
+            raise ValueError("Unknown profiler mode %s" % mode)
+
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token
+        self.mode = mode
+        self.aggregate = aggregate
+        self.interval = interval
+
+        self.lock = Lock()
+        self.stats = {}
+        self.stacks = {}
+        self.sequence = 0
+        self.writer = ThreadPoolExecutor(1)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def is_sampled(self, handler) -> bool:
+        """
+            Should the request of handler be profiled?
+        """
+        if self.token is not None:
+            token = handler.request.headers.get(self.HEADER)
+            if token is not None and compare_digest(token, self.token):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, handler):
+        """
+            Create the profile of the request of handler if it is sampled, it is enabled by enable
+
+            :return: The profile or None
+        """
+        if not self.is_sampled(handler):
+            return None
+
+        if self.mode == 'sample':
+            profile = StackSampler(get_ident(), self.interval)
+            profile.start()
+            return profile
+        return cProfile.Profile()
+
+    def enable(self, profile) -> bool:
+        """
+            Enable a profile for the synchronous work of its request
+
+            :param profile: The profile returned by start
+            :return: False if another profiler is active in this thread and the profile has not been enabled
+        """
+        if isinstance(profile, StackSampler):
+            profile.enable()
+            return True
+
+        # Before python 3.12 enabling replaces the active profiler silently
+        if sys.getprofile() is not None:
+            return False
+        try:
+            profile.enable()
+        except ValueError:
+            return False
+        return True
+
+    def disable(self, profile):
+        """
+            Disable a profile enabled by enable
+
+            :param profile: The profile returned by start
+        """
+        profile.disable()
+
+    def stop(self, handler, profile):
+        """
+            Stop a profile and write it in the background
+
+            :param handler: The handler that has been profiled
+            :param profile: The profile returned by start
+        """
+        if isinstance(profile, StackSampler):
+            profile.stopped.set()
+            self.writer.submit(lambda: self.write_stacks(handler.blueprint_name, profile.stop()))
+        else:
+            self.writer.submit(self.write_stats, handler.blueprint_name, profile)
+
+    def flush(self):
+        """
+            Wait until the profiles of the finished requests are written
+        """
+        self.writer.submit(lambda: None).result()
+
+    def filename(self, blueprint: str, extension: str) -> str:
+        """
+            The name of the file of a blueprint (unique per request if not aggregated)
+        """
+        if self.aggregate:
+            name = blueprint
+        else:
+            self.sequence += 1
+            name = '%s-%u-%u' % (blueprint, int(time() * 1000), self.sequence)
+        return os.path.join(self.directory, '%s.%s' % (name, extension))
+
+    def write_stats(self, blueprint: str, profile: cProfile.Profile):
+        with self.lock:
+            if not self.aggregate:
+                profile.dump_stats(self.filename(blueprint, 'pstats'))
+                return
+            if blueprint in self.stats:
+                self.stats[blueprint].add(profile)
+            else:
+                self.stats[blueprint] = pstats.Stats(profile)
+            self.stats[blueprint].dump_stats(self.filename(blueprint, 'pstats'))
+
+    def write_stacks(self, blueprint: str, stacks: Counter):
+        with self.lock:
+            if self.aggregate:
+                stacks = self.stacks.setdefault(blueprint, Counter()) + stacks
+                self.stacks[blueprint] = stacks
+            with open(self.filename(blueprint, 'stacks'), 'w') as fp:
+                for stack, count in stacks.most_common():
+                    fp.write('%s %u\n' % (stack, count))
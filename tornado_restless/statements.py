@@ -0,0 +1,132 @@
+#!/usr/bin/python
+# -*- encoding: utf-8 -*-
+"""
+    Records the sql statements executed while a request is processed
+"""
+from collections import Counter
+import re
+from threading import local
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+__author__ = 'Martin Martimeo <martin@martimeo.de>'
+__date__ = '18.10.26 - 14:02'
+
+_active = local()
+_listening = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+        Remember the start of a statement for the active recorder
+    """
+    recorder = getattr(_active, 'recorder', None)
+    if recorder is not None:
+        recorder.start = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+        Pass a finished statement to the active recorder
+    """
+    recorder = getattr(_active, 'recorder', None)
+    if recorder is not None:
+        recorder.record(statement, perf_counter() - recorder.start, parameters)
+
+
+def listen():
+    """
+        Register the cursor execute listeners on all engines (only once)
+    """
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+_whitespace = re.compile(r'\s+')
+_parameter_list = re.compile(r'\(\s*(\?|%s|:\w+|%\(\w+\)s)(\s*,\s*(\?|%s|:\w+|%\(\w+\)s))*\s*\)')
+
+
+class StatementRecorder(object):
+    """
+        Counts the statements and the time spent in the database
+
+        Statements are grouped by their shape, many statements of the same shape are the
+        signature of lazy loaded relations (N+1 queries).
+
+        A recorder only sees statements while it is active, e.g. between activate() and deactivate()
+        in the thread it was activated in. Activations must be nested and must not span a yield of a coroutine,
+        other coroutines of the thread would be recorded otherwise.
+
+        With keep the recorder remembers (phase, statement, parameters, duration) of all statements in executed,
+        phase being the value of the attribute phase at execution time.
+    """
+
+    REPEATED_THRESHOLD = 2
+
+    def __init__(self, keep: bool=False):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.keep = keep
+        self.executed = []
+        self.phase = None
+        self.start = None
+        self.previous = None
+
+    @staticmethod
+    def shape(statement: str) -> str:
+        """
+            Normalize a statement, so that executions with other parameters have the same shape
+
+            :param statement: The sql statement
+        """
+        return _parameter_list.sub('(?)', _whitespace.sub(' ', statement).strip())
+
+    def activate(self):
+        """
+            Make this recorder the active one of the current thread
+        """
+        listen()
+        self.previous = getattr(_active, 'recorder', None)
+        _active.recorder = self
+
+    def deactivate(self):
+        """
+            Restore the recorder that was active before
+        """
+        if getattr(_active, 'recorder', None) is self:
+            _active.recorder = self.previous
+        self.previous = None
+
+    def record(self, statement: str, duration: float, parameters=None):
+        """
+            Record an executed statement
+
+            :param statement: The sql statement
+            :param duration: Seconds spent executing the statement
+            :param parameters: The bound parameters
+        """
+        self.count += 1
+        self.duration += duration
+        self.shapes[self.shape(statement)] += 1
+        if self.keep:
+            self.executed.append((self.phase, statement, parameters, duration))
+
+    def repeated(self) -> list:
+        """
+            Returns (shape, count) of all shapes executed at least REPEATED_THRESHOLD times, most frequent first
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= self.REPEATED_THRESHOLD]
+
+    def format_header(self) -> str:
+        """
+            Summary of the recorded statements for a debug response header
+        """
+        repeated = self.repeated()
+        return "count=%u, duration=%.3fms, repeated=%u, max_repeated=%u" % (
+            self.count, self.duration * 1000, len(repeated), repeated[0][1] if repeated else 0)
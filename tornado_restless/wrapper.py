@@ -6,18 +6,27 @@
 from collections import namedtuple
 import inspect
 import logging
+from weakref import WeakKeyDictionary
 
-from sqlalchemy import inspect as sqinspect
+from sqlalchemy import event, inspect as sqinspect, and_, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.ext.associationproxy import AssociationProxy
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import ColumnProperty, Query
+from sqlalchemy.orm import ColumnProperty, Mapper, Query, configure_mappers, with_parent
 from sqlalchemy.orm.attributes import QueryableAttribute
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.orm.interfaces import MapperProperty
+from sqlalchemy.orm.interfaces import MapperProperty, MANYTOONE
 from sqlalchemy.orm.properties import RelationshipProperty
 from sqlalchemy.sql.operators import is_ordering_modifier
-from sqlalchemy.util import memoized_property
+
+from .errors import IllegalArgumentError
+
+try:
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+except ImportError:
+    # sqlalchemy < 1.4
+    sqlite_insert = None
 
 
 __author__ = 'Martin Martimeo <martin@martimeo.de>'
@@ -55,6 +64,58 @@ def _filter(instance, condition) -> dict:
                 if condition(field)}
 
 
+_metadata = WeakKeyDictionary()
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _after_configured():
+    """
+        Forget the memoized metadata, newly configured mappers may have added backrefs to memoized models
+    """
+    _metadata.clear()
+
+
+class model_property(object):
+    """
+        Like sqlalchemy.util.memoized_property, but memoized per model instead of per wrapper
+
+        Handlers create a new wrapper for every request, the metadata of a model is computed only once.
+        The mappers are configured before, so relations added by backrefs of other models are not missed.
+    """
+
+    def __init__(self, fget):
+        self.fget = fget
+        self.__name__ = fget.__name__
+        self.__doc__ = fget.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            return _metadata[obj.model][self.__name__]
+        except KeyError:
+            configure_mappers()
+            result = self.fget(obj)
+            _metadata.setdefault(obj.model, {})[self.__name__] = result
+            return result
+
+
+def _coerce(column, value):
+    """
+        Convert value to the python type of column, if it is not already of that type
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if value is None or isinstance(value, python_type):
+        return value
+    try:
+        return python_type(value)
+    except (TypeError, ValueError):
+        return value
+
+
 def _is_ordering_expression(expression):
     """
         Test an expression whether it is an ordering clause
@@ -104,7 +165,7 @@ class ModelWrapper(object):
             isinstance(field, QueryableAttribute) and isinstance(field.property, ColumnProperty) and
             hasattr(field.property.columns[0], 'primary_key') and field.property.columns[0].primary_key))
 
-    @memoized_property
+    @model_property
     def primary_keys(self):
         """
         @see get_primary_keys
@@ -124,7 +185,7 @@ class ModelWrapper(object):
             isinstance(field, QueryableAttribute) and isinstance(field.property, ColumnProperty) and
             hasattr(field.property.columns[0], 'unique') and field.property.columns[0].unique))
 
-    @memoized_property
+    @model_property
     def unique_keys(self):
         """
         @see get_primary_keys
@@ -140,12 +201,10 @@ class ModelWrapper(object):
 
             Inspired by flask-restless.helpers.primary_key_names
         """
-        return {field.key: field for key, field in inspect.getmembers(instance)
-                if isinstance(field, QueryableAttribute)
-                   and isinstance(field.property, ColumnProperty)
-        and field.foreign_keys}
+        return _filter(instance, lambda field: isinstance(field, QueryableAttribute) and
+                       isinstance(field.property, ColumnProperty) and field.foreign_keys)
 
-    @memoized_property
+    @model_property
     def foreign_keys(self):
         """
         @see get_foreign_keys
@@ -162,7 +221,7 @@ class ModelWrapper(object):
         return _filter(instance, lambda field: isinstance(field, ColumnProperty) or (
             isinstance(field, QueryableAttribute) and isinstance(field.property, ColumnProperty)))
 
-    @memoized_property
+    @model_property
     def columns(self):
         """
         @see get_columns
@@ -179,7 +238,7 @@ class ModelWrapper(object):
         return _filter(instance,
                        lambda field: isinstance(field, MapperProperty) or isinstance(field, QueryableAttribute))
 
-    @memoized_property
+    @model_property
     def attributes(self):
         """
         @see get_attributes
@@ -196,7 +255,7 @@ class ModelWrapper(object):
         return _filter(instance, lambda field: isinstance(field, RelationshipProperty) or (
             isinstance(field, QueryableAttribute) and isinstance(field.property, RelationshipProperty)))
 
-    @memoized_property
+    @model_property
     def relations(self):
         """
         @see get_relations
@@ -220,7 +279,7 @@ class ModelWrapper(object):
             return [Proxy(key, field) for key, field in inspect.getmembers(instance)
                     if isinstance(field, hybrid_property)]
 
-    @memoized_property
+    @model_property
     def hybrids(self) -> list:
         """
         @see get_hybrids
@@ -244,7 +303,7 @@ class ModelWrapper(object):
             return [Proxy(key, field) for key, field in inspect.getmembers(instance)
                     if isinstance(field, AssociationProxy)]
 
-    @memoized_property
+    @model_property
     def proxies(self):
         """
         @see get_proxies
@@ -253,6 +312,45 @@ class ModelWrapper(object):
 
     proxies.__doc__ = get_proxies.__func__.__doc__
 
+    @staticmethod
+    def get_mapper_attributes(mapper) -> tuple:
+        """
+            Returns the keys of columns, hybrids, relations and of all attributes
+            (columns, relations, proxies, hybrids, others) of a mapper as used by to_dict, memoized per mapper
+        """
+        try:
+            return _metadata[mapper]['mapper_attributes']
+        except KeyError:
+            configure_mappers()
+            columns = list(ModelWrapper.get_columns(mapper).keys())
+            relations = list(ModelWrapper.get_relations(mapper).keys())
+            proxies = [p.key for p in ModelWrapper.get_proxies(mapper)]
+            hybrids = [p.key for p in ModelWrapper.get_hybrids(mapper)]
+            attributes = list(ModelWrapper.get_attributes(mapper).keys())
+            result = (frozenset(columns), frozenset(hybrids), frozenset(relations),
+                      tuple(columns + relations + proxies + hybrids + attributes))
+            _metadata.setdefault(mapper, {})['mapper_attributes'] = result
+            return result
+
+    def precompute(self):
+        """
+            Compute and validate all metadata of the model
+
+            Afterwards requests find the metadata memoized instead of inspecting the model.
+
+            :raise: IllegalArgumentError if the model can not be inspected or has no primary key
+        """
+        try:
+            for name in ('primary_keys', 'unique_keys', 'foreign_keys', 'columns',
+                         'attributes', 'relations', 'hybrids', 'proxies'):
+                getattr(self, name)
+            self.get_mapper_attributes(sqinspect(self.model))
+        except Exception as ex:
+            raise IllegalArgumentError("Could not inspect model %s: %s" % (self.__name__, ex))
+
+        if not self.primary_keys:
+            raise IllegalArgumentError("Model %s has no primary key" % self.__name__)
+
 
 class SessionedModelWrapper(ModelWrapper):
     """
@@ -263,6 +361,21 @@ class SessionedModelWrapper(ModelWrapper):
         super().__init__(model)
         self.session = session
 
+    def query(self) -> Query:
+        """
+            Returns the query all requests of this wrapper are based on
+        """
+        return self.session.query(self.model)
+
+    def related(self, instance, relation: str) -> 'RelatedModelWrapper':
+        """
+            Returns a wrapper of the target model of a relation restricted to the related instances of instance
+
+            :param instance: The parent instance
+            :param relation: Name of the relation
+        """
+        return RelatedModelWrapper(instance, relation, self.session)
+
     @staticmethod
     def _apply_kwargs(instance: Query, **kwargs) -> Query:
         for expression in kwargs.pop('filters', []):
@@ -283,6 +396,9 @@ class SessionedModelWrapper(ModelWrapper):
         else:
             flimit = lambda instance: instance
 
+        if 'options' in kwargs:
+            instance = instance.options(*kwargs.pop('options'))
+
         instance = instance.filter_by(**kwargs)
         instance = foffset(instance)
         instance = flimit(instance)
@@ -297,7 +413,7 @@ class SessionedModelWrapper(ModelWrapper):
             :keyword offset: Offset for request
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -311,9 +427,10 @@ class SessionedModelWrapper(ModelWrapper):
             :param kwargs: Additional filters passed to filter_by
             :keyword limit: Limit for request
             :keyword offset: Offset for request
+            :keyword options: Loader options (e.g. selectinload)
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -330,7 +447,7 @@ class SessionedModelWrapper(ModelWrapper):
             :keyword offset: Offset for request
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -347,12 +464,297 @@ class SessionedModelWrapper(ModelWrapper):
             :keyword offset: Offset for request
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
         return SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs).delete()
 
+    def rows(self, columns: list, filters: list=(), **kwargs) -> list:
+        """
+            Gets the values of columns of all instances as rows, without creating instances
+
+            The statement is executed by the session directly, so the ORM neither hydrates instances
+            nor adds them to the identity map.
+
+            :param columns: Names of the column attributes
+            :param filters: Filters and OrderBy Clauses
+            :param kwargs: Additional filters passed to filter_by
+            :keyword limit: Limit for request
+            :keyword offset: Offset for request
+        """
+        instance = self.query().with_entities(*[getattr(self.model, column) for column in columns])
+        instance = SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs)
+        return self.session.execute(instance.statement).fetchall()
+
+    def stream(self, filters: list=(), batch_size: int=1000, columns: list=None, **kwargs):
+        """
+            Iterates over all instances (or rows of columns) in batches of batch_size using a server side cursor
+
+            The instances of a batch are expunged from the session before the next batch is fetched,
+            so the session does not grow with the number of instances.
+
+            :param filters: Filters and OrderBy Clauses
+            :param batch_size: Number of instances fetched at once
+            :param columns: Names of the column attributes, iterates over rows instead of instances
+            :param kwargs: Additional filters passed to filter_by
+        """
+        instance = self.query()
+        if columns is not None:
+            instance = instance.with_entities(*[getattr(self.model, column) for column in columns])
+        instance = SessionedModelWrapper._apply_kwargs(instance, filters=filters, **kwargs)
+
+        # Rows
+        if columns is not None:
+            result = self.session.execute(instance.statement.execution_options(stream_results=True))
+            try:
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                result.close()
+            return
+
+        # Instances
+        batch = []
+        for item in instance.execution_options(stream_results=True).yield_per(batch_size):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                for item in batch:
+                    self.session.expunge(item)
+                batch = []
+        if batch:
+            yield batch
+            for item in batch:
+                self.session.expunge(item)
+
+    def get_table_columns(self, keys) -> dict:
+        """
+            Returns a dictionary of the column attributes keys to the names of their table columns,
+            or None if an attribute is no plain column of the table of the model
+
+            :param keys: Names of the column attributes
+        """
+        mapper = sqinspect(self.model)
+        if len(mapper.tables) != 1:
+            return None
+
+        columns = {}
+        for key in keys:
+            prop = mapper.attrs.get(key)
+            if not isinstance(prop, ColumnProperty) or len(prop.columns) != 1 or \
+                    prop.columns[0].table is not mapper.local_table:
+                return None
+            columns[key] = prop.columns[0].key
+        return columns
+
+    def get_identity(self, *pargs) -> tuple:
+        """
+            Returns the primary key of pargs converted to the types of the primary key columns (e.g. of the url)
+
+            :param pargs: ident
+        """
+        return tuple(_coerce(column, value) for column, value in zip(sqinspect(self.model).primary_key, pargs))
+
+    def update_row(self, values: dict, columns: list, *pargs) -> tuple:
+        """
+            Updates one instance based on primary_keys by one UPDATE statement and returns its row of columns
+
+            The statement returns the row if the dialect supports UPDATE ... RETURNING, otherwise it is read afterwards.
+            Returns None if the instance can not be updated without the ORM (values of other attributes than
+            plain columns, a version counter, validators or attribute and mapper events).
+
+            :param values: Dictionary of column attribute to value
+            :param columns: Names of the column attributes of the row
+            :param pargs: ident
+            :raise NoResultFound: If no element has been updated
+        """
+        mapper = sqinspect(self.model)
+        names = self.get_table_columns(values)
+        if names is None or not names or self.get_table_columns(columns) is None or \
+                mapper.version_id_col is not None or mapper.dispatch.before_update or mapper.dispatch.after_update:
+            return None
+        for key in values:
+            if mapper.attrs[key].class_attribute.dispatch.set:
+                return None
+
+        identity = [_coerce(column, value) for column, value in zip(mapper.primary_key, pargs)]
+        statement = mapper.local_table.update().where(
+            and_(*[column == value for column, value in zip(mapper.primary_key, identity)])).values(
+            {names[key]: value for key, value in values.items()})
+
+        # The instance in the session is outdated
+        instance = self.session.identity_map.get(mapper.identity_key_from_primary_key(identity))
+        if instance is not None:
+            self.session.expire(instance)
+
+        dialect = self.session.get_bind(mapper=self.model).dialect
+        if getattr(dialect, 'update_returning', getattr(dialect, 'full_returning', False)):
+            table_columns = [mapper.attrs[key].columns[0] for key in columns]
+            row = self.session.execute(statement.returning(*table_columns)).first()
+        else:
+            row = self.get_row(columns, *identity) if self.session.execute(statement).rowcount else None
+
+        if row is None:
+            raise NoResultFound("No element recieved for %s(%s)" % (self.__collectionname__, pargs))
+
+        return row
+
+    def delete_row(self, *pargs) -> bool:
+        """
+            Deletes one instance based on primary_keys by one DELETE statement without loading it
+
+            Returns False if the instance has to be deleted by the ORM (relations the ORM cascades to or updates,
+            a version counter, delete mapper events or the instance is already in the session).
+
+            :param pargs: ident
+            :raise NoResultFound: If no element has been deleted
+        """
+        mapper = sqinspect(self.model)
+        if len(mapper.tables) != 1 or mapper.version_id_col is not None or \
+                mapper.dispatch.before_delete or mapper.dispatch.after_delete:
+            return False
+        for relation in mapper.relationships:
+            if relation.cascade.delete or (relation.direction is not MANYTOONE and not relation.passive_deletes):
+                return False
+
+        identity = [_coerce(column, value) for column, value in zip(mapper.primary_key, pargs)]
+        if mapper.identity_key_from_primary_key(identity) in self.session.identity_map:
+            return False
+
+        statement = mapper.local_table.delete().where(
+            and_(*[column == value for column, value in zip(mapper.primary_key, identity)]))
+        if not self.session.execute(statement).rowcount:
+            raise NoResultFound("No element recieved for %s(%s)" % (self.__collectionname__, pargs))
+
+        return True
+
+    def get_upsert_statement(self, keys: tuple):
+        """
+            Returns the INSERT ... ON CONFLICT (primary key) DO UPDATE statement of the dialect for values of keys,
+            or None if the dialect (or the model) has no native upsert
+
+            Like update_row, models with a version counter, validators or attribute and mapper events
+            have to be written by the ORM.
+
+            :param keys: Names of the column attributes, including the primary key
+        """
+        mapper = sqinspect(self.model)
+        if mapper.version_id_col is not None or mapper.dispatch.before_insert or mapper.dispatch.after_insert or \
+                mapper.dispatch.before_update or mapper.dispatch.after_update:
+            return None
+        for key in keys:
+            if key in mapper.validators or (key in mapper.attrs and mapper.attrs[key].class_attribute.dispatch.set):
+                return None
+
+        dialect = self.session.get_bind(mapper=self.model).dialect
+        if dialect.name == 'postgresql':
+            insert = postgresql_insert
+        elif dialect.name == 'sqlite' and sqlite_insert is not None:
+            insert = sqlite_insert
+        else:
+            return None
+
+        columns = self.get_table_columns(keys)
+        if columns is None:
+            return None
+
+        primary_key = [column.key for column in mapper.primary_key]
+        if not set(primary_key) <= set(columns.values()):
+            return None
+
+        statement = insert(mapper.local_table)
+        update = {column: statement.excluded[column] for column in columns.values() if column not in primary_key}
+        statement = statement.on_conflict_do_update(index_elements=primary_key,
+                                                    set_=update or {primary_key[0]: statement.excluded[primary_key[0]]})
+        return statement, columns
+
+    def upsert(self, values: list) -> list:
+        """
+            Inserts instances or updates them if their primary key exists, without reading them first
+
+            Only the given attributes of existing instances are updated, the others keep their values.
+            Values with the same keys are written by one INSERT ... ON CONFLICT DO UPDATE statement (sqlite and
+            postgresql), that returns the written rows if the dialect supports RETURNING. Otherwise the instances are
+            read by their primary keys afterwards. Other dialects (or values of other attributes than plain columns
+            and models the ORM has to write, see get_upsert_statement) fall back to session.merge.
+
+            :param values: List of dictionaries of column attribute to value, including the primary key
+            :return: The instances in the order of values
+        """
+        mapper = sqinspect(self.model)
+        dialect = self.session.get_bind(mapper=self.model).dialect
+        returning = getattr(dialect, 'insert_returning', getattr(dialect, 'full_returning', False))
+
+        # Primary keys given as strings (e.g. of the url)
+        primary_key = [(mapper.get_property_by_column(column).key, column) for column in mapper.primary_key]
+        values = [dict(item) for item in values]
+        for item in values:
+            for key, column in primary_key:
+                if key in item:
+                    item[key] = _coerce(column, item[key])
+
+        # Group values by their keys
+        groups = {}
+        for index, item in enumerate(values):
+            groups.setdefault(tuple(sorted(item)), []).append(index)
+
+        instances = [None] * len(values)
+        for keys, indexes in groups.items():
+            upsert = self.get_upsert_statement(keys)
+
+            # Merge
+            if upsert is None:
+                for index in indexes:
+                    instance = mapper.class_manager.new_instance()
+                    for key, value in values[index].items():
+                        setattr(instance, key, value)
+                    instances[index] = self.session.merge(instance)
+
+                # Written like by the statement (versions, events and identities of inserted instances)
+                self.session.flush([instances[index] for index in indexes])
+                continue
+
+            statement, columns = upsert
+            statement = statement.values([{columns[key]: values[index][key] for key in keys} for index in indexes])
+
+            # Upsert
+            if returning:
+                statement = statement.returning(*mapper.local_table.columns)
+                written = self.session.query(self.model).from_statement(statement).populate_existing().all()
+            else:
+                self.session.execute(statement)
+                identities = [tuple(values[index][key] for key, _ in primary_key) for index in indexes]
+                written = self.query().populate_existing().filter(
+                    or_(*[and_(*[column == value for column, value in zip(mapper.primary_key, identity)])
+                          for identity in identities])).all()
+
+            # Order like values
+            written = {mapper.identity_key_from_instance(instance)[1]: instance for instance in written}
+            for index in indexes:
+                instances[index] = written.get(tuple(values[index][key] for key, _ in primary_key))
+
+        return instances
+
+    def get_row(self, columns: list, *pargs) -> tuple:
+        """
+            Gets the values of columns of one instance based on primary_keys as row
+
+            :param columns: Names of the column attributes
+            :param pargs: ident
+            :raise NoResultFound: If no element has been received
+        """
+        primary_key = sqinspect(self.model).primary_key
+        rows = self.rows(columns, filters=[column == value for column, value in zip(primary_key, pargs)])
+
+        if not rows:
+            raise NoResultFound("No element recieved for %s(%s)" % (self.__collectionname__, pargs))
+
+        return rows[0]
+
     def count(self, filters: list=(), **kwargs) -> int:
         """
             Gets the instance count
@@ -361,7 +763,7 @@ class SessionedModelWrapper(ModelWrapper):
             :param kwargs: Additional filters passed to filter_by
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -375,7 +777,7 @@ class SessionedModelWrapper(ModelWrapper):
             :raise NoResultFound: If no element has been received
         """
         if isinstance(self, SessionedModelWrapper):
-            instance = self.session.query(self.model)
+            instance = self.query()
         else:
             instance = self
 
@@ -395,3 +797,27 @@ class SessionedModelWrapper(ModelWrapper):
             setattr(instance, key, value)
         self.session.add(instance)
         return instance
+
+
+class RelatedModelWrapper(SessionedModelWrapper):
+    """
+        Wrapper around the target model of a relation of an instance
+
+        All queries are restricted by the join condition of the relation,
+        so the related instances are filtered and paginated in sql instead of loading the whole relation.
+    """
+
+    def __init__(self, parent, relation: str, session):
+        self.parent = parent
+        self.relation = getattr(type(parent), relation)
+        super().__init__(self.relation.property.mapper.class_, session)
+
+    @property
+    def uselist(self) -> bool:
+        """
+            Is the relation a collection?
+        """
+        return self.relation.property.uselist
+
+    def query(self) -> Query:
+        return self.session.query(self.model).filter(with_parent(self.parent, self.relation))